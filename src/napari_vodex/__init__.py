@@ -1,6 +1,18 @@
 __version__ = "0.0.1"
-from ._widget import VodexWidget
 
 __all__ = (
-    "VodexWidget"
+    "VodexWidget",
+    "open_experiment",
+    "export_volumes",
 )
+
+
+def __getattr__(name):
+    # imported when asked for: the widget pulls in Qt, and the batch export shouldn't need it
+    if name == "VodexWidget":
+        from ._widget import VodexWidget
+        return VodexWidget
+    if name in ("open_experiment", "export_volumes"):
+        from . import _batch
+        return getattr(_batch, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
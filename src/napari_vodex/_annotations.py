@@ -0,0 +1,304 @@
+"""
+Annotations that keep the label of every frame as a small integer code instead of a list of TimeLabels.
+Built with numpy from the cycle or timeline, so it stays fast for very long recordings.
+"""
+import csv
+import sqlite3
+from itertools import repeat
+from pathlib import Path
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+import vodex as vx
+
+# when writing an annotation to the database, the rows are inserted this many frames at a time
+INSERT_CHUNK_FRAMES = 100000
+
+
+def frame_label_codes(labels: vx.Labels, timing: Union[vx.Cycle, vx.Timeline], n_frames: int) -> np.ndarray:
+    """
+    Finds the label for every frame in the recording, as the position of the label in labels.state_names.
+    Cycles are repeated (and cropped) to cover the whole recording, timelines must cover it exactly.
+
+    Args:
+        labels: the labels of the annotation.
+        timing: the cycle or the timeline of the annotation.
+        n_frames: total number of frames in the recording.
+    Returns:
+        1D array with the label code for each frame.
+    """
+    lookup = {name: code for code, name in enumerate(labels.state_names)}
+    codes = np.array([lookup[label.name] for label in timing.label_order], dtype=np.int16)
+    per_frame = np.repeat(codes, timing.duration)
+    if isinstance(timing, vx.Cycle):
+        return np.resize(per_frame, n_frames)
+    assert len(per_frame) == n_frames, "number of frames and total timing should be the same"
+    return per_frame
+
+
+def run_lengths(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Splits the array into the runs of the same value.
+
+    Args:
+        values: 1D array.
+    Returns:
+        the value and the length of each run.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return values, np.zeros(0, dtype=np.int64)
+    run_starts = np.flatnonzero(np.append(True, values[1:] != values[:-1]))
+    return values[run_starts], np.diff(np.append(run_starts, len(values)))
+
+
+def read_timing_file(file_name: Union[str, Path]) -> Tuple[List[str], List[int]]:
+    """
+    Reads the sequence of the labels and their durations from a file:
+    a .npy file with the label of every frame ( names or numbers ), the runs of the same label become the entries;
+    or a .csv file with a label name and a duration on every line, the first line is skipped if it is a header.
+
+    Args:
+        file_name: the .npy or .csv file.
+    Returns:
+        the label names in the order as they follow and their durations in frames.
+    """
+    file_name = Path(file_name)
+    if file_name.suffix.lower() == ".npy":
+        frame_labels = np.load(file_name, allow_pickle=False)
+        if frame_labels.ndim != 1:
+            raise ValueError(f"Expected a 1D array with the label of every frame, but got shape {frame_labels.shape}")
+        names, duration = run_lengths(frame_labels)
+        return [str(name) for name in names.tolist()], duration.tolist()
+
+    if file_name.suffix.lower() == ".csv":
+        with open(file_name, newline="") as f:
+            rows = [row for row in csv.reader(f) if row]
+        # skip the header
+        if rows and not rows[0][-1].strip().isdigit():
+            rows = rows[1:]
+        if any(len(row) != 2 for row in rows):
+            raise ValueError("Expected two columns in the csv file: the label name and the duration.")
+        names = [row[0].strip() for row in rows]
+        try:
+            duration = np.array([row[1] for row in rows], dtype=np.int64)
+        except ValueError:
+            raise ValueError("The durations in the csv file must be whole numbers of frames.")
+        if np.any(duration < 1):
+            raise ValueError("The durations in the csv file must be at least 1 frame.")
+        return names, duration.tolist()
+
+    raise ValueError(f"Can only import annotations from .npy or .csv files, got {file_name.name}")
+
+
+def timeline_from_codes(labels: vx.Labels, codes: np.ndarray) -> vx.Timeline:
+    """
+    Creates the timeline from the label of every frame: the runs of the same label become the timeline entries.
+
+    Args:
+        labels: the labels of the annotation.
+        codes: the label code for each frame, as the position of the label in labels.state_names.
+    Returns:
+        the timeline.
+    """
+    run_codes, duration = run_lengths(codes)
+    label_order = [labels.states[code] for code in run_codes]
+    return vx.Timeline(label_order, duration.tolist())
+
+
+class CodedAnnotation:
+    """
+    Same information as vodex Annotation, but the labels are kept as one int16 code per frame.
+
+    Args:
+        n_frames: total number of frames in the recording.
+        labels: the labels of the annotation.
+        codes: the label code for each frame, as the position of the label in labels.state_names.
+        info: a short description of the annotation.
+        cycle: the cycle, if the annotation was created from a cycle.
+
+    Attributes:
+        name: annotation name ( the same as the group of the labels ).
+    """
+
+    def __init__(self, n_frames: int, labels: vx.Labels, codes: np.ndarray, info: Optional[str] = None,
+                 cycle: Optional[vx.Cycle] = None):
+        assert n_frames == len(codes), f"The number of frames in the codes, {len(codes)}, " \
+                                       f"and the number of frames provided, {n_frames}, do not match."
+        self.n_frames = n_frames
+        self.labels = labels
+        self.name = labels.group
+        self.codes = np.asarray(codes, dtype=np.int16)
+        self.info = info
+        self.cycle = cycle
+
+    @classmethod
+    def from_cycle(cls, n_frames: int, labels: vx.Labels, cycle: vx.Cycle, info: Optional[str] = None):
+        """
+        Creates the annotation by repeating the cycle over the recording.
+        """
+        return cls(n_frames, labels, frame_label_codes(labels, cycle, n_frames), info=info, cycle=cycle)
+
+    @classmethod
+    def from_timeline(cls, n_frames: int, labels: vx.Labels, timeline: vx.Timeline, info: Optional[str] = None):
+        """
+        Creates the annotation from the timeline, the timeline must cover the whole recording.
+        """
+        return cls(n_frames, labels, frame_label_codes(labels, timeline, n_frames), info=info)
+
+    @property
+    def frame_to_label(self) -> List[vx.TimeLabel]:
+        """
+        The label of every frame, as in vodex Annotation. Builds a list, avoid for long recordings.
+        """
+        states = np.empty(len(self.labels.states), dtype=object)
+        states[:] = self.labels.states
+        return states[self.codes].tolist()
+
+    @property
+    def frame_to_cycle(self) -> Optional[np.ndarray]:
+        """
+        Cycle iteration for every frame, None if the annotation is not from a cycle.
+        """
+        if self.cycle is None:
+            return None
+        return np.arange(self.n_frames) // self.cycle.cycle_length
+
+    def to_vodex(self) -> vx.Annotation:
+        """
+        Converts to vodex Annotation.
+        """
+        frame_to_cycle = None if self.cycle is None else self.frame_to_cycle.tolist()
+        return vx.Annotation(self.n_frames, self.labels, self.frame_to_label, info=self.info,
+                             cycle=self.cycle, frame_to_cycle=frame_to_cycle)
+
+
+def write_annotation(connection: sqlite3.Connection, annotation: CodedAnnotation):
+    """
+    Adds the annotation to the experiment database, same tables as vodex DbWriter.add_annotations,
+    but inserts the frames in bulk with the label ids looked up once.
+    Does NOT save the database to disk.
+
+    Args:
+        connection: connection to the experiment database.
+        annotation: the annotation to add.
+    """
+    cursor = connection.cursor()
+    try:
+        n_frames = cursor.execute("SELECT COUNT(*) FROM Frames").fetchone()[0]
+        assert n_frames == annotation.n_frames, f"Number of frames in the annotation, {annotation.n_frames}, " \
+                                                f"doesn't match the expected number of frames {n_frames}"
+
+        cursor.execute("INSERT INTO AnnotationTypes (Name, Description) VALUES (?, ?)",
+                       (annotation.name, annotation.info))
+        type_id = cursor.lastrowid
+        cursor.executemany("INSERT INTO AnnotationTypeLabels (AnnotationTypeId, Name, Description) "
+                           "VALUES(?, ?, ?)",
+                           [(type_id, label.name, label.description) for label in annotation.labels.states])
+
+        # database ids of the labels, in the order of the codes
+        label_ids = dict(cursor.execute("SELECT Name, Id FROM AnnotationTypeLabels WHERE AnnotationTypeId = ?",
+                                        (type_id,)).fetchall())
+        code_to_id = np.array([label_ids[name] for name in annotation.labels.state_names])
+        cycle_id = None
+        if annotation.cycle is not None:
+            cursor.execute("INSERT INTO Cycles (AnnotationTypeId, Structure) VALUES(?, ?)",
+                           (type_id, annotation.cycle.to_json()))
+            cycle_id = cursor.lastrowid
+
+        # the rows are made a chunk at a time, so long recordings don't need python lists for every frame
+        for start in range(0, n_frames, INSERT_CHUNK_FRAMES):
+            end = min(start + INSERT_CHUNK_FRAMES, n_frames)
+            frames = np.arange(start, end)
+            frame_ids = (frames + 1).tolist()
+            cursor.executemany("INSERT INTO Annotations (FrameId, AnnotationTypeLabelId) VALUES(?, ?)",
+                               zip(frame_ids, code_to_id[annotation.codes[start:end]].tolist()))
+            if cycle_id is not None:
+                iterations = (frames // annotation.cycle.cycle_length).tolist()
+                cursor.executemany("INSERT INTO CycleIterations (FrameId, CycleId, CycleIteration) "
+                                   "VALUES(?, ?, ?)", zip(frame_ids, repeat(cycle_id), iterations))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# the tables with the rows of an annotation, in the order the tables reference each other,
+# and how to find the rows of the annotation with the type id ? in a database schema
+ANNOTATION_TABLES = [
+    ("AnnotationTypes", "Id = ?"),
+    ("AnnotationTypeLabels", "AnnotationTypeId = ?"),
+    ("Annotations", "AnnotationTypeLabelId IN (SELECT Id FROM {schema}.AnnotationTypeLabels "
+                    "WHERE AnnotationTypeId = ?)"),
+    ("Cycles", "AnnotationTypeId = ?"),
+    ("CycleIterations", "CycleId IN (SELECT Id FROM {schema}.Cycles WHERE AnnotationTypeId = ?)"),
+]
+
+
+def save_annotation_changes(connection: sqlite3.Connection, file_name: Union[str, Path],
+                            added: List[str], removed: List[str]):
+    """
+    Updates a database file that has the experiment as it was at the last save,
+    instead of writing the whole database again: deletes the removed annotations from the file
+    and copies the added ones from the experiment database, with the same ids, in one transaction.
+    The file is attached to the experiment database for that, so the rows don't go through python.
+
+    Args:
+        connection: connection to the experiment database.
+        file_name: the database file the experiment was last saved to.
+        added: names of the annotations added since the last save.
+        removed: names of the annotations removed since the last save,
+            an annotation can be both removed and added if it was created again with the same name.
+    """
+    connection.execute("ATTACH DATABASE ? AS saved", (str(file_name),))
+    cursor = connection.cursor()
+    try:
+        for name in set(removed) | set(added):
+            row = cursor.execute("SELECT Id FROM saved.AnnotationTypes WHERE Name = ?", (name,)).fetchone()
+            if row is not None:
+                # the rows are found through the parent tables, so the children are deleted first
+                for table, condition in reversed(ANNOTATION_TABLES):
+                    cursor.execute(f"DELETE FROM saved.{table} WHERE {condition.format(schema='saved')}", row)
+        for name in added:
+            row = cursor.execute("SELECT Id FROM main.AnnotationTypes WHERE Name = ?", (name,)).fetchone()
+            for table, condition in ANNOTATION_TABLES:
+                cursor.execute(f"INSERT INTO saved.{table} SELECT * FROM main.{table} "
+                               f"WHERE {condition.format(schema='main')}", row)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.execute("DETACH DATABASE saved")
+
+
+def read_label_codes(connection: sqlite3.Connection, labels: vx.Labels) -> np.ndarray:
+    """
+    Reads the label of every frame of the annotation from the experiment database.
+
+    Args:
+        connection: connection to the experiment database.
+        labels: the labels of the annotation.
+    Returns:
+        1D array with the label code for each frame, as the position of the label in labels.state_names.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""SELECT AnnotationTypeLabels.Name FROM Annotations
+                          JOIN AnnotationTypeLabels ON Annotations.AnnotationTypeLabelId = AnnotationTypeLabels.Id
+                          WHERE AnnotationTypeLabels.AnnotationTypeId =
+                            (SELECT Id FROM AnnotationTypes WHERE Name = ?)
+                          ORDER BY Annotations.FrameId ASC""", (labels.group,))
+        names = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    assert len(names) > 0, f"Could not find labels from group {labels.group} in the database."
+    unique_names, codes = np.unique(names, return_inverse=True)
+    name_to_code = np.array([labels.state_names.index(name) for name in unique_names], dtype=np.int16)
+    return name_to_code[codes]
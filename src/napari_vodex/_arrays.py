@@ -0,0 +1,194 @@
+"""
+Array containers for the image data that is handed over to napari.
+"""
+import uuid
+from typing import Callable
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import dask.array as da
+import numpy as np
+
+# the multiscale pyramid stops when the frames are this small (in pixels along the longest side)
+PYRAMID_MIN_SIZE = 512
+
+
+def lazy_volumes(read_volume: Callable[[int], np.ndarray], n_volumes: int, n_slices: int,
+                 frame_size: Tuple[int, int], dtype) -> da.Array:
+    """
+    Creates a dask array (volume, slice, y, x) with one chunk per volume.
+    Nothing is read from disk until napari (or anybody else) asks for a chunk.
+
+    Args:
+        read_volume: a function that takes the position of the volume in the array
+            and returns the frames for that volume as an array (slice, y, x).
+        n_volumes: number of volumes in the array.
+        n_slices: number of slices in each volume.
+        frame_size: ( height, width ) of an individual frame in pixels.
+        dtype: datatype of the frames.
+    Returns:
+        lazy 4D array (volume, slice, y, x).
+    """
+    h, w = frame_size
+
+    def load_chunk(block_id=None):
+        return read_volume(block_id[0])[np.newaxis]
+
+    chunks = ((1,) * n_volumes, (n_slices,), (h,), (w,))
+    # the name must be unique, otherwise napari's dask cache can mix up chunks from different loads
+    return da.map_blocks(load_chunk, chunks=chunks, dtype=dtype, name=f"vodex-volumes-{uuid.uuid4().hex}")
+
+
+class VolumeArray:
+    """
+    A read-only array (volume, slice, y, x) that reads the frames only when they are indexed,
+    so browsing through a recording with the napari sliders reads one frame per step.
+    Supports what napari needs from an array: shape, dtype, ndim and indexing.
+    The volume and slice axes can be indexed with integers, slices or 1D arrays, each axis independently
+    ( like zarr's orthogonal indexing ), the y and x axes as numpy arrays.
+
+    Args:
+        read_planes: a function that takes the positions of the volumes and of the slices in the array
+            ( two 1D integer arrays ) and returns those frames as an array (volume, slice, y, x).
+        shape: shape of the array (volume, slice, y, x).
+        dtype: datatype of the frames.
+    """
+
+    def __init__(self, read_planes: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                 shape: Tuple[int, int, int, int], dtype):
+        self.read_planes = read_planes
+        self.shape = tuple(int(side) for side in shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"VolumeArray(shape={self.shape}, dtype={self.dtype})"
+
+    def __array__(self, dtype=None, copy=None):
+        # reads everything, napari only does it when asked to
+        img = self[...]
+        return img if dtype is None else img.astype(dtype)
+
+    def _expand_key(self, key) -> tuple:
+        """
+        Turns the key into one index per axis.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is None for k in key):
+            raise IndexError("VolumeArray doesn't support adding new axes")
+        n_ellipsis = sum(k is Ellipsis for k in key)
+        if n_ellipsis > 1:
+            raise IndexError("an index can only have a single ellipsis ('...')")
+        if n_ellipsis == 1:
+            i = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices for array: array is {self.ndim}-dimensional, "
+                             f"but {len(key)} were indexed")
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __getitem__(self, key):
+        key = self._expand_key(key)
+        positions = []
+        # the axes indexed with an integer are dropped from the result
+        drop = []
+        for axis, k in enumerate(key[:2]):
+            if isinstance(k, (int, np.integer)):
+                if not -self.shape[axis] <= k < self.shape[axis]:
+                    raise IndexError(f"index {k} is out of bounds for axis {axis} with size {self.shape[axis]}")
+                positions.append(np.array([k % self.shape[axis]]))
+                drop.append(axis)
+            else:
+                positions.append(np.arange(self.shape[axis])[k])
+        planes = self.read_planes(*positions)
+        planes = planes[(slice(None), slice(None)) + key[2:]]
+        return planes[tuple(0 if axis in drop else slice(None) for axis in range(2))]
+
+    def sample_range(self, n_samples: int = 3) -> Tuple[float, float]:
+        """
+        Minimum and maximum of the middle slice in a few volumes spread over the array,
+        to set the contrast without reading the whole array.
+        """
+        volumes = np.unique(np.linspace(0, self.shape[0] - 1, n_samples).astype(int))
+        sample = self.read_planes(volumes, np.array([self.shape[1] // 2]))
+        low, high = float(sample.min()), float(sample.max())
+        return low, max(high, low + 1)
+
+
+def pyramid_shapes(shape: Tuple[int, ...], min_size: int = PYRAMID_MIN_SIZE) -> List[Tuple[int, ...]]:
+    """
+    Shapes of the multiscale pyramid levels: each level is 2 times smaller in y and x than the one before,
+    until the frames are not larger than min_size.
+
+    Args:
+        shape: shape of the full resolution array, the last two axes are y and x.
+        min_size: the smallest level has no side longer than this.
+    Returns:
+        list of shapes, starting from the full resolution.
+    """
+    shapes = [tuple(shape)]
+    while max(shapes[-1][-2:]) > min_size and min(shapes[-1][-2:]) >= 2:
+        h, w = shapes[-1][-2:]
+        shapes.append(shapes[-1][:-2] + (h // 2, w // 2))
+    return shapes
+
+
+def block_mean(img: Union[np.ndarray, da.Array], factor: int = 2) -> Union[np.ndarray, da.Array]:
+    """
+    Downsamples the frames ( the last two axes ) by averaging blocks of factor x factor pixels.
+    The pixels that don't fill a whole block at the bottom and right edges are dropped.
+    Dask arrays stay lazy.
+
+    Args:
+        img: array with y and x as the last two axes.
+        factor: block size.
+    Returns:
+        the downsampled array of the same datatype.
+    """
+    # integer images are rounded to the nearest value, casting the mean alone would truncate it
+    is_integer = np.issubdtype(img.dtype, np.integer)
+    if isinstance(img, da.Array):
+        axes = {img.ndim - 2: factor, img.ndim - 1: factor}
+        mean = da.coarsen(np.mean, img, axes, trim_excess=True)
+        if is_integer:
+            mean = da.rint(mean)
+        return mean.astype(img.dtype)
+
+    h, w = img.shape[-2] // factor, img.shape[-1] // factor
+    out = np.empty(img.shape[:-2] + (h, w), dtype=img.dtype)
+    # one frame at a time, so that the float copy stays small
+    frames = img.reshape((-1,) + img.shape[-2:])
+    for frame, out_frame in zip(frames, out.reshape((-1, h, w))):
+        blocks = frame[:h * factor, :w * factor].reshape(h, factor, w, factor)
+        mean = blocks.mean(axis=(1, 3), dtype=np.float32)
+        out_frame[:] = np.rint(mean) if is_integer else mean
+    return out
+
+
+def build_pyramid(img: Union[np.ndarray, da.Array],
+                  min_size: int = PYRAMID_MIN_SIZE) -> List[Union[np.ndarray, da.Array]]:
+    """
+    Creates the multiscale pyramid for napari by repeated 2 x 2 block mean downsampling.
+
+    Args:
+        img: full resolution array, the last two axes are y and x.
+        min_size: the smallest level has no side longer than this.
+    Returns:
+        list of arrays, starting from the full resolution.
+    """
+    levels = [img]
+    for _ in pyramid_shapes(img.shape, min_size)[1:]:
+        levels.append(block_mean(levels[-1]))
+    return levels
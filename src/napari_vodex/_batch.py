@@ -0,0 +1,221 @@
+"""
+Exporting volumes from a saved experiment without napari, for scripts and batch jobs.
+From python:
+
+    from napari_vodex import open_experiment, export_volumes
+
+    model = open_experiment("experiment.db")
+    volumes = model.choose_volumes([("light", "on"), ("shape", "c")], "and")
+    export_volumes(model, "light_on_and_c.tif", volumes)
+
+or from the command line:
+
+    vodex-export experiment.db light_on_and_c.tif --condition light=on --condition shape=c --logic and
+
+The volumes are read and written a chunk at a time, so the memory use doesn't depend on the number of volumes.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from ._estimate import format_bytes
+from ._model import EXPORT_CHUNK_MB
+from ._model import VodexModel
+
+# output file format for each file extension
+FILE_FORMATS = {".tif": "tif", ".tiff": "tif", ".npy": "npy", ".zarr": "zarr"}
+
+
+def parse_ids(text: str) -> List[int]:
+    """
+    Reads volume or slice IDs the same way as the Load/Save Data tab:
+    comma-separated IDs or ranges, the end of the range is included.
+    For example "0, 4, 9:12" is [0, 4, 9, 10, 11, 12].
+    """
+    ids = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        if ":" in item:
+            start, end = item.split(":")
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(item))
+    return ids
+
+
+def parse_condition(text: str) -> Tuple[str, str]:
+    """
+    Reads a condition written as annotation=label, for example "light=on" is ("light", "on").
+    """
+    group, sep, label = text.partition("=")
+    if not sep or not group.strip() or not label.strip():
+        raise ValueError(f"Write the condition as annotation=label, for example light=on, got {text!r}")
+    return group.strip(), label.strip()
+
+
+def open_experiment(db_file: Union[str, Path], disk_cache: bool = False,
+                    n_workers: Optional[int] = None) -> VodexModel:
+    """
+    Loads the experiment from the database for exporting.
+    The memory cache is turned off, since every frame is only read once.
+
+    Args:
+        db_file: the experiment database, saved from the plugin.
+        disk_cache: whether to read the frames from ( and write them to ) the disk cache next to the database.
+        n_workers: number of threads to read the files in parallel, the model's default if None.
+    Returns:
+        the model with the experiment loaded.
+    """
+    model = VodexModel()
+    model.set_cache_budget(0)
+    model.set_disk_cache(disk_cache)
+    if n_workers is not None:
+        model.n_workers = n_workers
+    model.load_experiment(db_file)
+    return model
+
+
+def export_volumes(model: VodexModel, out_file: Union[str, Path], volumes: Sequence[int] = (),
+                   slices: Sequence[int] = (), load_head: bool = False, load_tail: bool = False,
+                   pad: bool = False, chunk_mb: float = EXPORT_CHUNK_MB,
+                   progress: Optional[Callable[[int, int], None]] = None) -> List[int]:
+    """
+    Writes the volumes to a file as a 4D array (volume, slice, y, x), the same array as load_volumes returns.
+    The format is chosen by the file extension: .tif / .tiff ( BigTIFF, one page per frame ), .npy
+    or .zarr ( OME-Zarr with the experiment description, see VodexModel.iter_export_ome_zarr ).
+
+    Args:
+        model: model with the experiment, see open_experiment.
+        out_file: the file to write, overwritten if it exists.
+        volumes: volume IDs to export, if empty, exports all the full volumes.
+        slices: slices to export in each volume, if empty, exports all the slices.
+        load_head: whether to add the partial volume at the beginning of the recording.
+        load_tail: whether to add the partial volume at the end of the recording.
+        pad: whether to fill the slices that are missing in the head and tail with zeros, see load_volumes.
+        chunk_mb: how much to read at a time, in MB. At least one volume is read at a time.
+        progress: called with (volumes written, volumes total) after every chunk.
+    Returns:
+        the IDs of the exported volumes in the order they are written, -1 for the head and -2 for the tail.
+    """
+    out_file = Path(out_file)
+    file_format = FILE_FORMATS.get(out_file.suffix.lower())
+    if file_format is None:
+        raise ValueError(f"Can't write {out_file.name}: use one of the extensions {list(FILE_FORMATS)}")
+
+    if file_format == "zarr":
+        export = model.iter_export_ome_zarr(out_file, list(volumes), list(slices), load_head, load_tail,
+                                            pad=pad, chunk_mb=chunk_mb)
+        while True:
+            try:
+                n_done, n_total = next(export)
+            except StopIteration as stop:
+                return stop.value
+            if progress is not None:
+                progress(n_done, n_total)
+
+    # only the shape is needed, not the time
+    estimate = model.estimate_load(list(volumes), list(slices), load_head, load_tail, pad=pad, measure_speed=False)
+    volume_bytes = estimate.n_bytes // estimate.shape[0]
+    chunk_volumes = max(1, int(chunk_mb * 2 ** 20 // volume_bytes))
+    chunks = model.iter_volume_chunks(list(volumes), list(slices), load_head, load_tail, chunk_volumes, pad=pad)
+
+    written = []
+
+    def iter_chunks():
+        for volume_ids, img, n_total in chunks:
+            yield img
+            written.extend(volume_ids.tolist())
+            if progress is not None:
+                progress(len(written), n_total)
+
+    if file_format == "npy":
+        out = np.lib.format.open_memmap(out_file, mode="w+", dtype=estimate.dtype, shape=estimate.shape)
+        for img in iter_chunks():
+            out[len(written): len(written) + len(img)] = img
+        out.flush()
+        del out
+    else:
+        import tifffile
+
+        def iter_frames():
+            for img in iter_chunks():
+                yield from img.reshape((-1,) + img.shape[2:])
+
+        with tifffile.TiffWriter(out_file, bigtiff=True) as tif:
+            tif.write(iter_frames(), shape=estimate.shape, dtype=estimate.dtype, photometric="minisblack",
+                      metadata={"axes": "TZYX"})
+    return written
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    The vodex-export command, see the module docstring and vodex-export --help.
+    """
+    parser = argparse.ArgumentParser(
+        prog="vodex-export",
+        description="Export volumes from an experiment saved with napari-vodex to a .tif, .npy or OME-Zarr file. "
+                    "Choose the volumes by their IDs or by the annotation conditions.")
+    parser.add_argument("db_file", help="the experiment database")
+    parser.add_argument("out_file", help="the file to write, .tif, .tiff, .npy or .zarr ( OME-Zarr )")
+    parser.add_argument("-c", "--condition", action="append", default=[], type=parse_condition,
+                        metavar="ANNOTATION=LABEL",
+                        help="export the volumes with this label, repeat to combine several conditions")
+    parser.add_argument("--logic", choices=["and", "or"], default="and",
+                        help="how to combine the conditions ( default: and )")
+    parser.add_argument("-v", "--volumes", type=parse_ids, default=[],
+                        help="volume IDs, for example 0,4,9:12 ( default: all the full volumes )")
+    parser.add_argument("-s", "--slices", type=parse_ids, default=[],
+                        help="slices in each volume, for example 0:5 ( default: all the slices )")
+    parser.add_argument("--head", action="store_true", help="add the partial volume at the beginning")
+    parser.add_argument("--tail", action="store_true", help="add the partial volume at the end")
+    parser.add_argument("--pad", action="store_true",
+                        help="fill the slices that are missing in the head and tail with zeros")
+    parser.add_argument("--chunk-mb", type=float, default=EXPORT_CHUNK_MB,
+                        help=f"how much to read at a time, in MB ( default: {EXPORT_CHUNK_MB} )")
+    parser.add_argument("--workers", type=int, default=None, help="number of threads reading the files")
+    parser.add_argument("--disk-cache", action="store_true",
+                        help="use the disk cache next to the experiment database")
+    args = parser.parse_args(argv)
+
+    if args.condition and args.volumes:
+        parser.error("choose the volumes either by --condition or by --volumes, not both")
+
+    model = open_experiment(args.db_file, disk_cache=args.disk_cache, n_workers=args.workers)
+    volumes = args.volumes
+    if args.condition:
+        volumes = model.choose_volumes(args.condition, args.logic)
+        if not volumes:
+            print("No full volumes satisfy the conditions, nothing to export.", file=sys.stderr)
+            return 1
+
+    def show_progress(n_done, n_total):
+        print(f"\rExported {n_done} / {n_total} volumes", end="", file=sys.stderr, flush=True)
+
+    try:
+        written = export_volumes(model, args.out_file, volumes, args.slices, args.head, args.tail,
+                                 pad=args.pad, chunk_mb=args.chunk_mb, progress=show_progress)
+    except (ValueError, ImportError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    out_file = Path(args.out_file)
+    # an OME-Zarr store is a folder
+    files = [out_file] if out_file.is_file() else [file for file in out_file.rglob("*") if file.is_file()]
+    print(file=sys.stderr)
+    print(f"Wrote {len(written)} volumes ( {format_bytes(sum(file.stat().st_size for file in files))} ) "
+          f"to {out_file}", file=sys.stderr)
+    # the volume IDs go to stdout, to be saved or piped into the next step
+    print(",".join(str(volume) for volume in written))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Caches for the image data, so that the same frames are not read from disk over and over again.
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Keeps the least recently used arrays until they don't fit into the memory budget.
+    Safe to use from several threads ( napari reads lazy data in separate threads ).
+
+    Args:
+        max_bytes: memory budget in bytes, 0 turns the cache off.
+
+    Attributes:
+        max_bytes: memory budget in bytes.
+        n_bytes: memory used by the cached arrays in bytes.
+        hits: how many times the requested array was in the cache.
+        misses: how many times the requested array was not in the cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    def __str__(self):
+        return f"Cache: {self.n_bytes / 2 ** 20:.1f} / {self.max_bytes / 2 ** 20:.0f} MB, " \
+               f"{len(self)} frames, hits {self.hits}, misses {self.misses}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def keys(self) -> List[Hashable]:
+        """
+        Returns the keys of the cached arrays, from the least to the most recently used.
+        """
+        with self._lock:
+            return list(self._items)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        Returns the cached array or None if it is not in the cache.
+        """
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value, n_bytes: Optional[int] = None):
+        """
+        Adds an array to the cache, evicts the least recently used arrays if over the budget.
+        Arrays larger than the whole budget are not cached.
+
+        Args:
+            key: key to find the value later.
+            value: the array to cache, or anything else if n_bytes is given.
+            n_bytes: memory used by the value, defaults to value.nbytes.
+        """
+        if n_bytes is None:
+            n_bytes = value.nbytes
+        if n_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = value
+            self._sizes[key] = n_bytes
+            self.n_bytes += n_bytes
+            self._evict()
+
+    def set_budget(self, max_bytes: int):
+        """
+        Changes the memory budget, evicts the least recently used arrays if over the new budget.
+        """
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        """
+        Removes everything from the cache and resets the statistics.
+        """
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.n_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache statistics.
+        """
+        return {"hits": self.hits, "misses": self.misses, "items": len(self),
+                "n_bytes": self.n_bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, key: Hashable):
+        self._items.pop(key)
+        self.n_bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self.n_bytes > self.max_bytes:
+            self._remove(next(iter(self._items)))
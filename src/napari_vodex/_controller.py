@@ -1,7 +1,23 @@
+import math
 from pathlib import Path
+
+from ._estimate import format_bytes
+from ._timing import PerfRecorder
 from ._view import InputError
 
 
+def _create_worker(function, *args, **kwargs):
+    """
+    Creates a napari worker that runs the function in a separate thread.
+    The errors are passed to the errored signal only, and not raised again in the main thread.
+    napari is imported here: it is already imported when the plugin runs in napari,
+    so this only saves time when the plugin is used on its own.
+    """
+    from napari.qt.threading import create_worker
+
+    return create_worker(function, *args, _ignore_errors=True, **kwargs)
+
+
 class VodexController:
     """
     Controller class for the GUI (following the MVC schema).
@@ -12,9 +28,34 @@ class VodexController:
         self._model = model
         self._view = view
 
+        # timing of the actions, shown on the Performance tab
+        self.perf = PerfRecorder(self._model.timer)
+        self.perf.listeners.append(self._view.pt.add_record)
+        self._view.pt.show_log_file(self.perf.log_file)
+
         self._connectDisplaySignalsAndSlots()
         self.msg = InputError(title="Error!")
 
+        # show the current cache budget
+        self._view.dt.cache_mb.setValue(self._model.cache.max_bytes // 2 ** 20)
+        self._view.dt.pyramid_mb.setValue(self._model.pyramids.max_bytes // 2 ** 20)
+        self.update_cache_info()
+        self._view.dt.disk_cache_cb.setChecked(self._model.use_disk_cache)
+
+        # the worker that is loading volumes in the background and the timing of that loading
+        self._load_worker = None
+        self._load_action = None
+        self._load_status = "ok"
+        # the workers that are listing the files and counting their frames in the background
+        self._files_worker = None
+        self._files_action = None
+        self._files_status = "ok"
+        self._count_worker = None
+        # the same for loading the experiment from the database
+        self._experiment_worker = None
+        self._experiment_action = None
+        self._experiment_status = "ok"
+
     def launch_popup(self, text):
         self.msg.setText(text)
         x = self.msg.exec_()
@@ -22,8 +63,9 @@ class VodexController:
     def initialize_fm(self):
         """
         Executed when [Get Files] button is pressed.
-        Initialises FileManager with all the files retrieved from the data directory
-        and adds the files to the list to inspect.
+        Lists the files in the data directory in a separate thread, adding them to the list to inspect as they are found.
+        When all the files are found, the list can be edited, while the frames in the files are counted in the background.
+        The FileManager is created when the file order is saved.
         """
         data_dir_str = self._view.nt.dir_location.text()
         if data_dir_str == "":
@@ -32,30 +74,86 @@ class VodexController:
             data_dir = Path(data_dir_str)
             # check that the location is a directory
             if data_dir.is_dir():
-                try:
-                    # create FileManager
-                    file_type = self._view.nt.file_types.currentText()
-                    self._model.crete_fm(data_dir, file_type)
-                    # update list of files
-                    self._view.nt.list_widget.fill_list(self._model.fm.file_names)
-                    # freeze dir
-                    self._view.nt.freeze_dir()
-                    # unfreeze file list
-                    self._view.nt.list_widget.setEnabled(True)
-                except Exception as initialize_fm_exception:
-                    self.launch_popup(str(initialize_fm_exception))
-                    self._model.remove_fm()
-                # # if file names are not empty
-                # if self._model.fm is not None:
-                #     # update list of files
-                #     self._view.ft.list_widget.fill_list(self._model.fm.file_names)
-                #     # freeze dir
-                #     self._view.ft.freeze_dir()
-                #     # unfreeze file list
-                #     self._view.ft.list_widget.setEnabled(True)
+                self.stop_file_workers()
+                # the counts are forgotten here, in the main thread, the workers don't change the model
+                self._model.clear_frame_counts()
+                file_type = self._view.nt.file_types.currentText()
+                self._files_action = self.perf.start("fetch files")
+                self._files_status = "ok"
+                worker = _create_worker(self._model.iter_find_files, data_dir, file_type)
+                worker.yielded.connect(self._files_found)
+                worker.returned.connect(lambda file_names: self._all_files_found(data_dir, file_names))
+                worker.errored.connect(self._listing_files_failed)
+                worker.finished.connect(self._listing_files_finished)
+
+                self._files_worker = worker
+                self._view.nt.list_widget.fill_list([])
+                self._view.nt.list_widget.show_status("Looking for files ...")
+                # freeze dir
+                self._view.nt.freeze_dir()
+                worker.start()
             else:
                 self.launch_popup(f"Directory {data_dir} does not exist!")
 
+    def _files_found(self, file_names):
+        self._view.nt.list_widget.add_files(file_names)
+        self._view.nt.list_widget.show_status(f"Looking for files ... {self._view.nt.list_widget.n_files()} found")
+
+    def _all_files_found(self, data_dir, file_names):
+        # show the files in the same order as the FileManager
+        self._view.nt.list_widget.fill_list(file_names)
+        # unfreeze file list
+        self._view.nt.list_widget.setEnabled(True)
+
+        n_files = len(file_names)
+        self._view.nt.list_widget.show_status(f"Counting frames ... 0 / {n_files} files")
+        worker = _create_worker(self._model.iter_count_frames, data_dir, file_names)
+        worker.yielded.connect(lambda counted: self._frames_counted(data_dir, *counted, n_files))
+        worker.errored.connect(lambda count_e: self._view.nt.list_widget.show_status(
+            f"Could not count the frames: {count_e}"))
+        worker.returned.connect(lambda _: self._view.nt.list_widget.show_status(""))
+        worker.finished.connect(self._counting_frames_finished)
+        self._count_worker = worker
+        worker.start()
+
+    def _frames_counted(self, data_dir, file_name, n_frames, n_files):
+        # the counts are kept here, in the main thread, the worker doesn't change the model
+        self._model.add_frame_counts(data_dir, {file_name: n_frames})
+        self._view.nt.list_widget.set_frame_count(file_name, n_frames)
+        self._view.nt.list_widget.show_status(
+            f"Counting frames ... {len(self._model.frame_counts)} / {n_files} files")
+
+    def _listing_files_failed(self, list_e):
+        self._files_status = "error"
+        self._view.nt.list_widget.show_status("")
+        self._view.nt.unfreeze_dir()
+        self.launch_popup(str(list_e))
+
+    def _listing_files_finished(self):
+        self.perf.finish(self._files_action, status=self._files_status)
+        self._files_action = None
+        self._files_worker = None
+
+    def _counting_frames_finished(self):
+        self._count_worker = None
+
+    def stop_file_workers(self):
+        """
+        Stops listing the files and counting the frames.
+        The workers are disconnected, so that the files they have already found don't get into the list.
+        """
+        for worker in [self._files_worker, self._count_worker]:
+            if worker is not None:
+                worker.quit()
+                for signal in [worker.yielded, worker.returned, worker.errored, worker.finished]:
+                    signal.disconnect()
+        if self._files_worker is not None:
+            self.perf.finish(self._files_action, status="cancelled")
+        self._files_worker = None
+        self._files_action = None
+        self._count_worker = None
+        self._view.nt.list_widget.show_status("")
+
     def update_and_freeze_fm(self):
         """
         Executed when [Save File Order] button is pressed.
@@ -68,8 +166,11 @@ class VodexController:
             file_names = self._view.nt.list_widget.get_file_names()
             # if file names are empty
             if file_names:
+                # the frames that are not counted yet are counted when creating the FileManager
+                self.stop_file_workers()
                 # create new FileManager from updated file list
-                self._model.crete_fm(data_dir, file_type, file_names=file_names)
+                with self.perf.action("save file order"):
+                    self._model.crete_fm(data_dir, file_type, file_names=file_names)
                 # freeze files list
                 self._view.nt.list_widget.freeze()
                 # unfreeze vm
@@ -89,12 +190,13 @@ class VodexController:
         """
         # clear dependent managers
         self.remove_vm()
+        self.stop_file_workers()
 
         try:
             # remove FileManager from the model
             self._model.remove_fm()
             # clear files from list and make it active
-            self._view.nt.list_widget.list_widget.clear()
+            self._view.nt.list_widget.fill_list([])
             self._view.nt.list_widget.unfreeze()
         except Exception as e:
             self._view.error_dialog.showMessage(e)
@@ -106,18 +208,19 @@ class VodexController:
         """
 
         # must save files before adding vm
-        if self._view.nt.list_widget.list_widget.isEnabled():
+        if self._view.nt.list_widget.list_view.isEnabled():
             self._view.vt.volume_info_string.setText("Save changes to the files first!")
         else:
             # create new VolumeManager from updated file list
             fpv = self._view.vt.fpv.value()
             fgf = self._view.vt.fgf.value()
             try:
-                self._model.create_vm(fpv, fgf)
-                # freeze vm
-                self._view.vt.freeze_vm()
-                # update the volume info summary
-                self._view.vt.volume_info_string.setText(str(self._model.vm))
+                with self.perf.action("save volume info"):
+                    self._model.create_vm(fpv, fgf)
+                    # freeze vm
+                    self._view.vt.freeze_vm()
+                    # update the volume info summary
+                    self._view.vt.volume_info_string.setText(str(self._model.vm))
 
                 # show the info for the next step
                 self._view.it.show()
@@ -133,7 +236,8 @@ class VodexController:
         if self._model.vm is None:
             self.launch_popup("Save volume information first!")
         else:
-            self._model.create_experiment()
+            with self.perf.action("create experiment"):
+                self._model.create_experiment()
 
             # swap the button to edit
             self._view.it.create_experiment.hide()
@@ -203,21 +307,51 @@ class VodexController:
             duration = self._view.at.annotations[annotation_name].timing.get_duration_sequence()
             an_type = self._view.at.annotations[annotation_name].timing.annotation_type.currentText()
 
-            if an_type == "Timeline" and sum(duration) != self._model.vm.n_frames:
-                self.launch_popup("The number of frames in a Timeline "
-                                  "must exactly match the total number of frames in the recording.")
-            elif an_type == "Cycle" and sum(duration) > self._model.vm.n_frames:
-                self.launch_popup("The number of frames in a Cycle "
-                                  "must be less or equal to the total number of frames in the recording.")
+            try:
+                self._model.check_timing(duration, an_type)
+            except ValueError as e:
+                self.launch_popup(str(e))
             else:
                 # change the tab view
                 self._view.at.annotations[annotation_name].freeze()
 
-                # create annotation and add it to the experiment
-                self._model.create_annotation(group, state_names, state_info, labels_order, duration, an_type)
+                with self.perf.action("add annotation", n_frames=self._model.vm.n_frames):
+                    # create annotation and add it to the experiment
+                    self._model.create_annotation(group, state_names, state_info, labels_order, duration,
+                                                  an_type)
+
+                    # update the Load/Save Tab
+                    self._view.dt.update_labels(self._get_label_names())
+
+    def import_annotation(self, annotation_name):
+        """
+        Executed when [Import from file] is pressed on the Time Annotation tab.
+        Creates the annotation from the file and adds it to the experiment,
+        then shows its labels and timing on the tab, same as for the loaded annotations.
+        """
+        if self._model.experiment is None:
+            self.launch_popup("Create Experiment First!")
+            return
+        page = self._view.at.annotations[annotation_name]
+        file_name = page.timing.get_import_file()
+        if file_name == "":
+            return
+
+        an_type = page.timing.annotation_type.currentText()
+        try:
+            with self.perf.action("import annotation", n_frames=self._model.vm.n_frames):
+                self._model.import_annotation(annotation_name, file_name, an_type=an_type,
+                                              state_info=page.labels.get_descriptions())
+        except Exception as import_e:
+            self.launch_popup(f"Could not import the annotation: {import_e}")
+            return
 
-                # update the Load/Save Tab
-                self._view.dt.update_labels(self._get_label_names())
+        page.labels.clear()
+        self._load_labels(annotation_name)
+        self._load_timing(annotation_name)
+        page.freeze()
+        # update the Load/Save Tab
+        self._view.dt.update_labels(self._get_label_names())
 
     def remove_annotation(self, annotation_name):
         # remove the tab from view
@@ -276,7 +410,8 @@ class VodexController:
         file_name = self._view.st.get_save_filename()
         if file_name is not None:
             # attempt to save
-            self._model.save_experiment(file_name)
+            with self.perf.action("save experiment"):
+                self._model.save_experiment(file_name)
 
     def load_volumes(self):
         """
@@ -291,6 +426,7 @@ class VodexController:
 
             load_head = self._view.dt.head_cb.isChecked()
             load_tail = self._view.dt.tail_cb.isChecked()
+            pad = self._view.dt.pad_cb.isChecked()
 
             name = ""
             if not requested_slices == "":
@@ -312,10 +448,8 @@ class VodexController:
             name += "[V " + requested_volumes + "]"
 
             if volumes or slices:
-                # load images
-                volumes_img = self._model.load_volumes(volumes, slices, load_head, load_tail)
-                # finally add loaded data to napari viewer
-                self._view.napari.add_image(volumes_img, name=name)
+                # load images and add loaded data to napari viewer
+                self._load_in_background(name, volumes, slices, load_head, load_tail, pad=pad)
             else:
                 self.launch_popup("Enter the IDs of volumes or slices to load!")
 
@@ -337,39 +471,294 @@ class VodexController:
                 # construct the name
                 name = f"_{logic}_".join(f"{condition[0]}-{condition[1]}" for condition in conditions)
 
-                # load images
-                volumes_img = self._model.load_volumes(volumes, [], False, False)
-                # finally add loaded data to napari viewer
-                self._view.napari.add_image(volumes_img, name=name)
+                # load images and add loaded data to napari viewer
+                self._load_in_background(name, volumes, [], False, False)
+
+    def export_volumes(self):
+        """
+        Executed when [Export to OME-Zarr] under the volume IDs is pressed.
+        Exports the requested volumes and slices, the whole recording if nothing is requested.
+        """
+        if self._model.experiment is not None:
+            volumes, _ = self._view.dt.get_volumes()
+            slices, _ = self._view.dt.get_slices()
+            self._export_in_background(volumes, slices, self._view.dt.head_cb.isChecked(),
+                                       self._view.dt.tail_cb.isChecked(), self._view.dt.pad_cb.isChecked())
+        else:
+            self.launch_popup("You must create the experiment to export the volumes.\n"
+                              "See Image Data tab.")
+
+    def export_volumes_for_conditions(self):
+        """
+        Executed when [Export to OME-Zarr] under the conditions is pressed.
+        """
+        search_results = self._find_volumes()
+        if search_results is not None:
+            conditions, logic, volumes = search_results
+            if volumes:
+                self._export_in_background(volumes, [], False, False, False)
+
+    def _export_in_background(self, volumes, slices, load_head, load_tail, pad):
+        """
+        Exports the volumes to OME-Zarr in a separate thread, showing the progress on the Load/Save Data tab.
+        """
+        file_name = self._view.dt.get_export_file()
+        if file_name is None:
+            return
+
+        self._view.dt.estimate_info.setText(f"Exporting to {file_name}")
+        self._load_action = self.perf.start("export volumes")
+        self._load_status = "ok"
+        worker = _create_worker(self._model.iter_export_ome_zarr, file_name, volumes, slices, load_head, load_tail,
+                               pad=pad)
+        worker.yielded.connect(lambda progress: self._view.dt.update_progress(*progress, action="Exported"))
+        worker.returned.connect(lambda written: self._view.dt.estimate_info.setText(
+            f"Exported {len(written)} volumes to {file_name}"))
+        worker.errored.connect(self._loading_failed)
+        worker.finished.connect(self._loading_finished)
+
+        self._load_worker = worker
+        self._view.dt.start_progress()
+        self._view.freeze_model_tabs()
+        worker.start()
+
+    def _load_in_background(self, name, volumes, slices, load_head, load_tail, pad=False):
+        """
+        Loads volumes in a separate thread, so that napari doesn't freeze.
+        Shows the progress on the Load/Save Data tab and adds the layer to napari when the loading is done.
+        If the volumes don't fit into memory, offers to load them lazily or to load a preview instead.
+        """
+        if self._view.dt.is_average():
+            self._average_in_background(name, volumes, slices, load_head, load_tail)
+            return
+        if self._view.dt.is_browse():
+            self._browse(name, volumes, slices, load_head, load_tail, pad)
+            return
+
+        lazy = self._view.dt.is_lazy()
+        multiscale = self._view.dt.is_multiscale()
+        volume_step, slice_step, bin_xy = preview = self._view.dt.get_preview()
+        # the estimate is done here, in the main thread: no frames are read for it,
+        # the time to read is only shown once the read speed is known from the previous loads
+        try:
+            estimate = self._model.estimate_load(volumes, slices, load_head, load_tail,
+                                                 multiscale=multiscale, pad=pad, volume_step=volume_step,
+                                                 slice_step=slice_step, bin_xy=bin_xy, measure_speed=False)
+        except ValueError as e:
+            self.launch_popup(str(e))
+            return
+
+        if not lazy and not estimate.fits_in_memory:
+            # every how many volumes to load for the preview to take at most half of the available memory
+            preview_step = volume_step * math.ceil(estimate.n_bytes / max(1, estimate.available_bytes // 2))
+            answer = self._view.dt.ask_load_lazily(
+                f"The requested volumes need {format_bytes(estimate.n_bytes)}, "
+                f"but only {format_bytes(estimate.available_bytes)} of memory is available.\n"
+                f"Load them lazily ( read from disk only when displayed ) instead, "
+                f"or load a preview of one volume in every {preview_step}?")
+            if answer is None:
+                return
+            lazy = answer == "lazy"
+            if answer == "preview":
+                volume_step = preview_step
+                preview = (volume_step, slice_step, bin_xy)
+                estimate = self._model.estimate_load(volumes, slices, load_head, load_tail,
+                                                     multiscale=multiscale, pad=pad, volume_step=volume_step,
+                                                     slice_step=slice_step, bin_xy=bin_xy, measure_speed=False)
+        placement = self._model.preview_placement(volumes, slices, load_head, load_tail,
+                                                  volume_step=volume_step, slice_step=slice_step)
+        if preview != (1, 1, 1):
+            name += f" (preview: volumes / {volume_step}, slices / {slice_step}, bin {bin_xy}x{bin_xy})"
+        self._view.dt.estimate_info.setText(f"Loading {name}: {estimate}")
+
+        self._load_action = self.perf.start("load volumes", lazy=lazy, multiscale=multiscale,
+                                            n_bytes=estimate.n_bytes, preview=list(preview))
+        self._load_status = "ok"
+        worker = _create_worker(self._model.iter_load_volumes, volumes, slices, load_head, load_tail,
+                               lazy=lazy, multiscale=multiscale, pad=pad, volume_step=volume_step,
+                               slice_step=slice_step, bin_xy=bin_xy)
+        worker.yielded.connect(lambda progress: self._view.dt.update_progress(*progress))
+        worker.returned.connect(lambda volumes_img: self._add_layer(volumes_img, name, multiscale,
+                                                                    bin_xy=bin_xy, placement=placement))
+        worker.errored.connect(self._loading_failed)
+        worker.finished.connect(self._loading_finished)
+
+        self._load_worker = worker
+        self._view.dt.start_progress()
+        self._view.freeze_model_tabs()
+        worker.start()
+
+    def _browse(self, name, volumes, slices, load_head, load_tail, pad):
+        """
+        Adds the volumes to napari without reading them, the frames are read as the sliders move.
+        Only a few frames are read to set the contrast.
+        """
+        with self.perf.action("browse volumes"):
+            try:
+                volumes_img = self._model.browse_volumes(volumes, slices, load_head, load_tail, pad=pad)
+            except ValueError as e:
+                self.launch_popup(str(e))
+                return
+            self._view.dt.estimate_info.setText(f"Browsing {name}: {volumes_img.shape} {volumes_img.dtype}")
+            contrast_limits = volumes_img.sample_range()
+            with self._model.timer.stage("layer"):
+                self._view.napari.add_image(volumes_img, name=name, contrast_limits=contrast_limits)
+
+    def _average_in_background(self, name, volumes, slices, load_head, load_tail):
+        """
+        Averages the volumes in a separate thread, reading a few volumes at a time,
+        and adds their mean and standard deviation to napari as two layers.
+        """
+        self._view.dt.estimate_info.setText(f"Averaging {name}")
+        self._load_action = self.perf.start("average volumes")
+        self._load_status = "ok"
+        worker = _create_worker(self._model.iter_average_volumes, volumes, slices, load_head, load_tail)
+        worker.yielded.connect(lambda progress: self._view.dt.update_progress(*progress))
+        worker.returned.connect(lambda stats: self._add_average_layers(stats, name))
+        worker.errored.connect(self._loading_failed)
+        worker.finished.connect(self._loading_finished)
+
+        self._load_worker = worker
+        self._view.dt.start_progress()
+        self._view.freeze_model_tabs()
+        worker.start()
+
+    def _add_average_layers(self, stats, name):
+        with self._model.timer.stage("layer"):
+            self._view.napari.add_image(stats.std, name=f"{name} std ( n={stats.count} )", visible=False)
+            self._view.napari.add_image(stats.mean, name=f"{name} mean ( n={stats.count} )")
+
+    def _add_layer(self, volumes_img, name, multiscale, bin_xy=1, placement=((1, 1), (0, 0))):
+        """
+        Adds the volumes to napari. The preview is placed to line up with the full resolution layer
+        of the same request: the volumes and slices go where they are in it ( see VodexModel.preview_placement ),
+        a binned pixel covers bin x bin pixels and is centered on them.
+        """
+        (volume_scale, slice_scale), (volume_translate, slice_translate) = placement
+        scale = (volume_scale, slice_scale, bin_xy, bin_xy)
+        translate = (volume_translate, slice_translate, (bin_xy - 1) / 2, (bin_xy - 1) / 2)
+        with self._model.timer.stage("layer"):
+            self._view.napari.add_image(volumes_img, name=name, multiscale=multiscale,
+                                        scale=scale, translate=translate)
+
+    def _loading_failed(self, load_e):
+        self._load_status = "error"
+        self.launch_popup(str(load_e))
+
+    def _loading_finished(self):
+        self.perf.finish(self._load_action, status=self._load_status)
+        self._load_action = None
+        self._load_worker = None
+        self._view.dt.stop_progress()
+        self._view.unfreeze_model_tabs()
+        self.update_cache_info()
+
+    def choose_log_file(self):
+        """
+        Executed when [Log to file] is pressed on the Performance tab.
+        """
+        log_file = self._view.pt.get_log_filename()
+        if log_file is not None:
+            self.perf.log_file = log_file
+            self._view.pt.show_log_file(log_file)
+
+    def set_cache_budget(self, budget_mb):
+        """
+        Executed when the memory budget for the cache is changed.
+        """
+        self._model.set_cache_budget(budget_mb * 2 ** 20)
+        self.update_cache_info()
+
+    def update_cache_info(self):
+        stats = self._model.cache_stats()
+        self._view.dt.cache_info.setText(f"used {stats['n_bytes'] / 2 ** 20:.0f} MB, "
+                                         f"hits {stats['hits']}, misses {stats['misses']}")
+
+    def cancel_loading(self):
+        """
+        Executed when [Cancel] is pressed while loading.
+        Stops the loading after the current volume, nothing is added to napari.
+        """
+        if self._load_worker is not None:
+            self._load_status = "cancelled"
+            self._load_worker.quit()
+            self._view.dt.cancel_pb.setEnabled(False)
+            self._view.dt.progress_bar.setFormat("Cancelling ...")
+
+    def show_file_types(self):
+        """
+        Executed when [Create New Experiment] is pressed.
+        Gets the file types from vodex, that's when vodex is imported for the first time.
+        """
+        self._view.nt.set_file_types(self._model.supported_file_types())
 
     def load_experiment(self):
+        """
+        Executed when [Load] is pressed on the Load Experiment tab.
+        Loads the experiment in a separate thread, so that napari doesn't freeze,
+        showing the progress on the Load Experiment tab.
+        """
         # browse for the db
         self._view.lt.browse()
         db_name = self._view.lt.db_location.text()
         if db_name != "":
-            self._model.load_experiment(db_name)
+            self._experiment_action = self.perf.start("load experiment")
+            self._experiment_status = "ok"
+            worker = _create_worker(self._model.iter_load_experiment, db_name)
+            worker.yielded.connect(lambda progress: self._view.lt.update_progress(*progress))
+            worker.returned.connect(self._experiment_loaded)
+            worker.errored.connect(self._experiment_loading_failed)
+            worker.finished.connect(self._experiment_loading_finished)
+
+            self._experiment_worker = worker
+            self._view.lt.start_progress()
+            worker.start()
+
+    def _experiment_loaded(self, loaded):
+        # the model is changed here, in the main thread, and not by the worker
+        self._model.set_experiment(loaded)
+        # update the info about the fm and vm
+        self._view.lt.fm_info_string.setText(str(self._model.fm))
+        self._view.lt.vm_info_string.setText(str(self._model.vm))
+        self._view.lt.setEnabled(False)
+        self._load_annotations()
+
+        # disable/enable checkboxes if there are no head or tail frames
+        if self._model.vm.n_head == 0:
+            # uncheck
+            self._view.dt.head_cb.setChecked(False)
+            self._view.dt.head_cb.setEnabled(False)
+        else:
+            self._view.dt.head_cb.setChecked(True)
+            self._view.dt.head_cb.setEnabled(True)
 
-            # update the info about the fm and vm
-            self._view.lt.fm_info_string.setText(str(self._model.fm))
-            self._view.lt.vm_info_string.setText(str(self._model.vm))
-            self._view.lt.setEnabled(False)
-            self._load_annotations()
+        if self._model.vm.n_tail == 0:
+            self._view.dt.tail_cb.setChecked(False)
+            self._view.dt.tail_cb.setEnabled(False)
+        else:
+            self._view.dt.tail_cb.setChecked(True)
+            self._view.dt.tail_cb.setEnabled(True)
 
-            # disable/enable checkboxes if there are no head or tail frames
-            if self._model.vm.n_head == 0:
-                # uncheck
-                self._view.dt.head_cb.setChecked(False)
-                self._view.dt.head_cb.setEnabled(False)
-            else:
-                self._view.dt.head_cb.setChecked(True)
-                self._view.dt.head_cb.setEnabled(True)
+    def _experiment_loading_failed(self, load_e):
+        self._experiment_status = "error"
+        self.launch_popup(f"Could not load the experiment: {load_e}")
 
-            if self._model.vm.n_tail == 0:
-                self._view.dt.tail_cb.setChecked(False)
-                self._view.dt.tail_cb.setEnabled(False)
-            else:
-                self._view.dt.tail_cb.setChecked(True)
-                self._view.dt.tail_cb.setEnabled(True)
+    def _experiment_loading_finished(self):
+        self.perf.finish(self._experiment_action, status=self._experiment_status)
+        self._experiment_action = None
+        self._experiment_worker = None
+        self._view.lt.stop_progress()
+
+    def cancel_experiment_loading(self):
+        """
+        Executed when [Cancel] is pressed while loading the experiment.
+        Stops the loading after the current stage, the experiment is not loaded.
+        """
+        if self._experiment_worker is not None:
+            self._experiment_status = "cancelled"
+            self._experiment_worker.quit()
+            self._view.lt.cancel_pb.setEnabled(False)
+            self._view.lt.progress_bar.setFormat("Cancelling ...")
 
     def _get_label_names(self):
         """
@@ -413,10 +802,8 @@ class VodexController:
             self._view.at.annotations[annotation_name].timing.annotation_type.setCurrentText("Timeline")
             timing = self._model.timelines[annotation_name]
         # fill out the table
-        for label, duration in zip(timing.label_order, timing.duration):
-            self._view.at.annotations[annotation_name].timing.add_row(labels,
-                                                                      label_name=label.name,
-                                                                      duration=duration)
+        self._view.at.annotations[annotation_name].timing.set_sequence(
+            labels, [label.name for label in timing.label_order], timing.duration)
 
     def _find_volumes(self):
         if self._model.experiment is None:
@@ -434,14 +821,15 @@ class VodexController:
                     conditions.extend(annotation.get_checked_conditions())
             logic = self._view.dt.logic_box.currentText()
 
-            # get volumes
-            volumes_ids = self._model.experiment.choose_volumes(conditions, logic=logic)
+            with self.perf.action("find volumes", logic=logic):
+                # get volumes
+                volumes_ids = self._model.choose_volumes(conditions, logic=logic)
 
-            # print volumes to text field
-            if volumes_ids:
-                self._view.dt.volumes_info.setText(','.join(str(volume) for volume in volumes_ids))
-            else:
-                self._view.dt.volumes_info.setText("No full volumes satisfy the conditions.")
+                # print volumes to text field
+                if volumes_ids:
+                    self._view.dt.volumes_info.setText(','.join(str(volume) for volume in volumes_ids))
+                else:
+                    self._view.dt.volumes_info.setText("No full volumes satisfy the conditions.")
 
             return conditions, logic, volumes_ids
 
@@ -482,6 +870,8 @@ class VodexController:
                 self._view.at.annotations[annotation_name].labels.get_names()))
         self._view.at.annotations[annotation_name].timing.del_button.clicked.connect(
             self._view.at.annotations[annotation_name].timing.delete_row)
+        self._view.at.annotations[annotation_name].timing.import_button.clicked.connect(
+            lambda: self.import_annotation(annotation_name))
 
     def _connectFirstTabSignalsAndSlots(self):
         # 1. connect FileTab
@@ -490,6 +880,8 @@ class VodexController:
         self._view.nt.browse_button.clicked.connect(self._view.nt.browse)
         # [Load] button in Load Experiment
         self._view.lt.load_db_pb.clicked.connect(self.load_experiment)
+        # [Cancel] button while loading the experiment
+        self._view.lt.cancel_pb.clicked.connect(self.cancel_experiment_loading)
 
         # [Fetch files] button
         self._view.nt.files_button.clicked.connect(self.initialize_fm)
@@ -527,6 +919,7 @@ class VodexController:
         # 0. Connect intro Tab
         # _______________________________________________________________________________________________
         self._view.nt_pb.clicked.connect(self._view.initialize_new_experiment)
+        self._view.nt_pb.clicked.connect(self.show_file_types)
         self._view.lt_pb.clicked.connect(self._view.initialize_load_experiment)
 
         self._connectFirstTabSignalsAndSlots()
@@ -549,3 +942,14 @@ class VodexController:
         self._view.dt.load_volumes_pb.clicked.connect(self.load_volumes)
         self._view.dt.find_volumes.clicked.connect(self._find_volumes)
         self._view.dt.load_conditions_pb.clicked.connect(self.load_volumes_for_conditions)
+        self._view.dt.export_volumes_pb.clicked.connect(self.export_volumes)
+        self._view.dt.export_conditions_pb.clicked.connect(self.export_volumes_for_conditions)
+        self._view.dt.cancel_pb.clicked.connect(self.cancel_loading)
+        self._view.dt.disk_cache_cb.toggled.connect(self._model.set_disk_cache)
+        self._view.dt.cache_mb.valueChanged.connect(self.set_cache_budget)
+        self._view.dt.pyramid_mb.valueChanged.connect(lambda budget_mb: self._model.set_pyramid_budget(
+            budget_mb * 2 ** 20))
+
+        # 6. connect PerformanceTab
+        # _______________________________________________________________________________________________
+        self._view.pt.log_pb.clicked.connect(self.choose_log_file)
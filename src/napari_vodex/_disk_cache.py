@@ -0,0 +1,151 @@
+"""
+Cache of the decoded frames on disk, next to the experiment database,
+so that reopening the experiment doesn't decode the same image files again.
+"""
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import List
+from typing import Tuple
+
+import numpy as np
+
+# the cache folder is <experiment db>.vxcache
+CACHE_SUFFIX = ".vxcache"
+
+
+def cache_dir(db_file: str) -> Path:
+    """
+    The folder with the disk cache for the experiment database.
+    """
+    return Path(str(db_file) + CACHE_SUFFIX)
+
+
+def describe_sources(files: List[Path]) -> List[dict]:
+    """
+    Name, size and modification time of the image files, to check that the cache is still valid.
+    """
+    sources = []
+    for file in files:
+        stat = Path(file).stat()
+        sources.append({"name": Path(file).name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return sources
+
+
+class DiskCache:
+    """
+    Keeps the decoded frames that have been read on disk: the frames from every write go to a new part file,
+    part_<number>.npy (frame, y, x), so the cache only takes as much space as the frames that were read.
+    Where each frame is stored is kept in a memory-mapped index.npy (frame, 2): the part number
+    and the frame inside the part, -1 for the frames that are not in the cache.
+    If the image files changed ( different size or modification time ) since the cache was written,
+    the cache is emptied.
+    Safe to use from several threads.
+
+    Args:
+        directory: the cache folder, created if needed.
+        files: the image files of the recording, in order.
+        n_frames: total number of frames in the recording.
+        frame_size: ( height, width ) of a frame in pixels.
+        dtype: datatype of the frames.
+    """
+
+    def __init__(self, directory: Path, files: List[Path], n_frames: int, frame_size: Tuple[int, int], dtype):
+        self.directory = Path(directory)
+        self.info = {"sources": describe_sources(files),
+                     "shape": [int(n_frames)] + [int(side) for side in frame_size],
+                     "dtype": np.dtype(dtype).str}
+        self._lock = threading.Lock()
+
+        if not self._is_valid():
+            self.clear()
+        self.index = np.load(self.directory / "index.npy", mmap_mode="r+")
+        # parts left by an interrupted write are not in the index, but their numbers are not reused
+        numbers = [int(file.stem.split("_")[1]) for file in self.directory.glob("part_*.npy")]
+        self._next_part = max(numbers, default=-1) + 1
+
+    def _is_valid(self) -> bool:
+        info_file = self.directory / "info.json"
+        if not info_file.is_file():
+            return False
+        with open(info_file) as f:
+            return json.load(f) == self.info
+
+    def _part_file(self, part: int) -> Path:
+        return self.directory / f"part_{part}.npy"
+
+    def clear(self):
+        """
+        Removes all the frames from the cache.
+        """
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True)
+        n_frames = self.info["shape"][0]
+        index = np.lib.format.open_memmap(self.directory / "index.npy", mode="w+", dtype=np.int32,
+                                          shape=(n_frames, 2))
+        index[:] = -1
+        index.flush()
+        del index
+        # written last: without it the cache is considered broken and is recreated
+        with open(self.directory / "info.json", "w") as f:
+            json.dump(self.info, f)
+
+    def close(self):
+        """
+        Closes the memory-mapped files, nothing is cached after that.
+        """
+        with self._lock:
+            self.index = None
+
+    def contains(self, frame_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns whether each of the frames is in the cache.
+        """
+        with self._lock:
+            if self.index is None:
+                return np.zeros(len(frame_ids), dtype=bool)
+            return self.index[np.asarray(frame_ids, dtype=int), 0] >= 0
+
+    def read(self, frame_ids: np.ndarray, out: np.ndarray, positions: np.ndarray) -> bool:
+        """
+        Copies the frames from the cache into the output array.
+
+        Args:
+            frame_ids: frame ids, starting at 0, must be in the cache.
+            out: output array (frame, y, x).
+            positions: where to put each frame in the output array.
+        Returns:
+            False if the cache was closed and nothing was read.
+        """
+        positions = np.asarray(positions, dtype=int)
+        with self._lock:
+            if self.index is None:
+                return False
+            parts, rows = self.index[np.asarray(frame_ids, dtype=int)].T
+            for part in np.unique(parts):
+                in_part = parts == part
+                out[positions[in_part]] = np.load(self._part_file(part), mmap_mode="r")[rows[in_part]]
+        return True
+
+    def write(self, frame_ids: np.ndarray, frames: np.ndarray):
+        """
+        Adds the frames to the cache as a new part.
+        The part is written to disk before the frames are added to the index.
+
+        Args:
+            frame_ids: frame ids, starting at 0.
+            frames: the frames (frame, y, x).
+        """
+        frame_ids = np.asarray(frame_ids, dtype=int)
+        with self._lock:
+            if self.index is None:
+                return
+            part = self._next_part
+            self._next_part += 1
+            np.save(self._part_file(part), np.ascontiguousarray(frames))
+            # the part number goes last, it marks the frame as cached
+            self.index[frame_ids, 1] = np.arange(len(frame_ids))
+            self.index[frame_ids, 0] = part
+            self.index.flush()
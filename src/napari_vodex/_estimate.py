@@ -0,0 +1,60 @@
+"""
+How much memory and time a loading request will take, checked before anything is read from disk.
+"""
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import psutil
+
+
+def available_memory() -> int:
+    """
+    Returns the memory that can be used without swapping, in bytes.
+    """
+    return psutil.virtual_memory().available
+
+
+def format_bytes(n_bytes: float) -> str:
+    """
+    Human-readable size, for example 1.5 GB.
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+class LoadEstimate(NamedTuple):
+    """
+    What a call to VodexModel.load_volumes will produce.
+
+    Attributes:
+        shape: shape of the output array (volume, slice, y, x), full resolution for multiscale.
+        dtype: datatype of the output array.
+        n_bytes: size of the output array in bytes, all levels together for multiscale.
+        n_bytes_to_read: how much of it is not in the cache and has to be read from disk, in bytes.
+        seconds: expected time to read the data from disk, None if the read speed is unknown.
+        available_bytes: memory available at the time of the estimate, in bytes.
+    """
+    shape: Tuple[int, int, int, int]
+    dtype: np.dtype
+    n_bytes: int
+    n_bytes_to_read: int
+    seconds: Optional[float]
+    available_bytes: int
+
+    @property
+    def fits_in_memory(self) -> bool:
+        """
+        Whether the whole array can be loaded into the available memory.
+        """
+        return self.n_bytes < self.available_bytes
+
+    def __str__(self):
+        text = f"{self.shape} {np.dtype(self.dtype).name}, {format_bytes(self.n_bytes)}"
+        if self.seconds is not None:
+            text += f", ~{self.seconds:.1f} s to read"
+        return text
@@ -0,0 +1,42 @@
+"""
+Finding the image files in the data directory a batch at a time,
+so that huge directories ( or directories on slow network drives ) can be listed in the background.
+"""
+import os
+from pathlib import Path
+from typing import Tuple
+from typing import Union
+
+# file names are reported in batches of this size while the directory is listed
+FILE_BATCH_SIZE = 500
+
+
+def iter_find_files(data_dir: Union[str, Path], file_extensions: Tuple[str], batch_size: int = FILE_BATCH_SIZE):
+    """
+    Lists the files with the extensions in the data directory, the same files as vodex FileManager finds.
+    Yields the file names in batches, in the order the file system lists them,
+    and returns all the names sorted the same way as vodex does ( alphabetically, ignoring the case ).
+
+    Args:
+        data_dir: the directory to search.
+        file_extensions: extensions of the files to search for, for example ('.tif', '.tiff').
+        batch_size: how many names to collect before yielding them.
+    Returns:
+        list of file names, relative to the data directory.
+    """
+    file_names = []
+    batch = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1] in file_extensions and entry.is_file():
+                batch.append(entry.name)
+                if len(batch) == batch_size:
+                    file_names.extend(batch)
+                    yield batch
+                    batch = []
+    if batch:
+        file_names.extend(batch)
+        yield batch
+    file_names.sort(key=str.lower)
+    return file_names
+
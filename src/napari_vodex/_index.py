@@ -0,0 +1,93 @@
+"""
+Index of the annotation labels over the volumes, so that choosing the volumes doesn't query the database.
+"""
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+import vodex as vx
+
+from ._annotations import CodedAnnotation
+
+
+class ConditionIndex:
+    """
+    Keeps the label of every frame in the full volumes for each annotation,
+    and the boolean masks (volume, slice) for the labels that have been asked for.
+    Choosing the volumes is then a few vectorized operations on the masks.
+
+    Args:
+        vm: the VolumeManager of the experiment.
+    """
+
+    def __init__(self, vm: vx.VolumeManager):
+        self.n_head = vm.n_head
+        self.fpv = vm.fpv
+        self.full_volumes = vm.full_volumes
+
+        self._state_names: Dict[str, List[str]] = {}
+        # label codes per annotation, 2D array (volume, slice), only the full volumes
+        self._codes: Dict[str, np.ndarray] = {}
+        # masks for the labels, keyed by (group, label name)
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def __contains__(self, group: str):
+        return group in self._codes
+
+    def add(self, annotation: CodedAnnotation):
+        """
+        Adds an annotation to the index, replaces the annotation with the same name if it is already there.
+        """
+        full = annotation.codes[self.n_head: self.n_head + self.full_volumes * self.fpv]
+        self.remove(annotation.name)
+        self._state_names[annotation.name] = list(annotation.labels.state_names)
+        self._codes[annotation.name] = full.reshape(self.full_volumes, self.fpv)
+
+    def remove(self, group: str):
+        """
+        Removes an annotation and its masks from the index.
+        """
+        self._state_names.pop(group, None)
+        self._codes.pop(group, None)
+        for key in [key for key in self._masks if key[0] == group]:
+            self._masks.pop(key)
+
+    def choose_volumes(self, conditions: Union[tuple, List[tuple]], logic: str = "and") -> List[int]:
+        """
+        Selects the full volumes where every frame satisfies the conditions.
+        Same as vodex Experiment.choose_volumes.
+
+        Args:
+            conditions: a list of conditions on the annotation labels
+                in a form [(group, name),(group, name), ...]
+            logic: "and" or "or" , default is "and".
+        Returns:
+            list of volume IDs in ascending order.
+        """
+        assert logic == "and" or logic == "or", 'logic should be equal to "and" or "or"'
+        if isinstance(conditions, tuple):
+            conditions = [conditions]
+        if not conditions:
+            return []
+
+        masks = [self._get_mask(group, name) for group, name in dict.fromkeys(conditions)]
+        if logic == "and":
+            chosen = np.logical_and.reduce(masks)
+        else:
+            chosen = np.logical_or.reduce(masks)
+        return np.flatnonzero(chosen.all(axis=1)).tolist()
+
+    def _get_mask(self, group: str, name: str) -> np.ndarray:
+        """
+        Returns the mask (volume, slice) of the frames with the label, computes it on the first request.
+        """
+        key = (group, name)
+        if key not in self._masks:
+            if group not in self._codes:
+                raise KeyError(f"No annotation {group} in the experiment.")
+            if name not in self._state_names[group]:
+                raise KeyError(f"No label {name} in the annotation {group}.")
+            self._masks[key] = self._codes[group] == self._state_names[group].index(name)
+        return self._masks[key]
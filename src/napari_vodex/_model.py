@@ -1,6 +1,96 @@
+import os
+import sqlite3
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import Any
 from typing import List
+from typing import NamedTuple
+from typing import Tuple
 from typing import Union
-import vodex as vx
+
+import numpy as np
+
+from ._cache import LRUCache
+from ._disk_cache import DiskCache
+from ._disk_cache import cache_dir
+from ._estimate import LoadEstimate
+from ._estimate import available_memory
+from ._timing import StageTimer
+
+# vodex, dask and tifffile take a while to import, so they ( and the modules that use them ) are imported
+# in the methods that need them: opening the plugin doesn't wait for them, only creating or loading an experiment does
+
+# default memory budget for the volume cache
+CACHE_BUDGET_MB = 512
+# default memory budget for the multiscale pyramids cache, larger: a single pyramid of long recordings
+# with large frames is several GB, and it is usually also shown in napari, so caching it doesn't use more memory
+PYRAMID_BUDGET_MB = 8192
+# frames are read from disk in chunks of this size, the progress is reported after each chunk
+READ_CHUNK_FRAMES = 256
+# number of frames to read to measure the read speed, when nothing has been loaded yet
+SPEED_PROBE_FRAMES = 16
+# when averaging, volumes are read and added to the statistics this many at a time
+AVERAGE_CHUNK_VOLUMES = 4
+# when exporting, volumes are read and written in chunks of about this size
+EXPORT_CHUNK_MB = 256
+
+
+def _run_to_end(generator):
+    """
+    Exhausts a generator and returns its return value.
+    """
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _load_db(file_name: Union[Path, str]) -> sqlite3.Connection:
+    """
+    Copies the database file into memory, like vodex DbReader.load does,
+    but the connection can be used from another thread than the one that created it:
+    the experiment is loaded in the background and then used from the main thread.
+    """
+    # sqlite creates an empty database if the file doesn't exist
+    if not Path(file_name).is_file():
+        raise FileNotFoundError(f"No database file {file_name}")
+    disk_db = sqlite3.connect(file_name)
+    memory_db = sqlite3.connect(":memory:", check_same_thread=False)
+    disk_db.backup(memory_db)
+    disk_db.close()
+    return memory_db
+
+
+def _file_key(data_dir: Union[Path, str], file_name: str) -> str:
+    """
+    The key of the file in VodexModel.frame_counts: the absolute path,
+    so that files with the same name in different directories don't mix.
+    """
+    return os.path.abspath(os.path.join(data_dir, file_name))
+
+
+class LoadedExperiment(NamedTuple):
+    """
+    An experiment read from a database file by VodexModel.iter_load_experiment, not in the model yet.
+
+    Attributes:
+        file_name: the database file.
+        experiment: vodex Experiment with the database in memory.
+        fm: the FileManager.
+        vm: the VolumeManager.
+        records: ( labels, cycle, codes ) per annotation, see VodexModel._read_annotation_records.
+        annotations: the annotations, keyed by the name.
+    """
+    file_name: Union[Path, str]
+    experiment: Any
+    fm: Any
+    vm: Any
+    records: List[tuple]
+    annotations: dict
 
 
 class VodexModel:
@@ -20,35 +110,155 @@ class VodexModel:
 
         self.experiment = None
         self.experiment_saved = False
+        # the database file the experiment was saved to or loaded from
+        self.db_file = None
+        # names of the annotations added and removed since the experiment was saved or loaded,
+        # only these are written when saving to the same file again
+        self.added_annotations = set()
+        self.removed_annotations = set()
+        # which labels are in which volumes, to choose the volumes without querying the database
+        self.index = None
+
+        # image loader for the current files, created on the first load
+        self._loader = None
+        # tif files kept open between the loads, created on the first load
+        self._readers = None
+        # recently loaded frames, keyed by (volume id, slice id)
+        self.cache = LRUCache(CACHE_BUDGET_MB * 2 ** 20)
+        # multiscale pyramids of the recently loaded selections, keyed by (volume ids, slice ids)
+        # the levels are read-only, so changing a layer doesn't change the cache
+        self.pyramids = LRUCache(PYRAMID_BUDGET_MB * 2 ** 20)
+        # decoded frames on disk next to the experiment database, off until turned on with set_disk_cache,
+        # created on the first load after saving
+        self.use_disk_cache = False
+        self._disk_cache = None
+        # time spent in the database, decoding and assembling the arrays
+        self.timer = StageTimer()
+        # number of threads to read the files in parallel
+        self.n_workers = min(32, (os.cpu_count() or 1) + 4)
+        # measured read speed in bytes per second, None until something is read
+        self.read_speed = None
+        # number of frames in the image files, keyed by the absolute path of the file,
+        # counted in the background after the files are listed ( see iter_count_frames and add_frame_counts )
+        self.frame_counts = {}
+
+    def supported_file_types(self) -> List[str]:
+        """
+        The image file types that vodex can read.
+        """
+        import vodex as vx
+
+        return list(vx.VX_SUPPORTED_TYPES)
+
+    def iter_find_files(self, data_dir, file_type: str):
+        """
+        Lists the image files of the type in the data directory, the same files as the FileManager finds.
+        Yields the file names in batches as they are found and returns all the names, sorted the same way
+        as the FileManager sorts them. The model is not changed, see clear_frame_counts for listing the files again.
+        Used to list the files in a separate thread, so that napari doesn't freeze on huge directories.
+
+        Args:
+            data_dir: the directory with the image files.
+            file_type: file type to search for, one of supported_file_types().
+        """
+        import vodex as vx
+        from ._files import iter_find_files
+
+        assert Path(data_dir).is_dir(), f"No directory {data_dir}"
+        file_extensions = vx.VX_SUPPORTED_TYPES[file_type]
+        file_names = yield from iter_find_files(data_dir, file_extensions)
+        assert len(file_names) > 0, f"No files of type {file_type} [extensions {file_extensions}]\n in {data_dir}"
+        return file_names
+
+    def iter_count_frames(self, data_dir, file_names: List[str]):
+        """
+        Counts the frames in the files that haven't been counted yet, reading the files in parallel.
+        Yields ( file name, number of frames ) as soon as each file is counted and returns all the new counts,
+        keyed by the file name. The counts are not kept: pass them to add_frame_counts.
+        Used to count the frames in a separate thread, while the list of files can already be edited.
+
+        Args:
+            data_dir: the directory with the image files.
+            file_names: names of the files, relative to the data directory.
+        """
+        import vodex as vx
+
+        to_count = [name for name in dict.fromkeys(file_names)
+                    if _file_key(data_dir, name) not in self.frame_counts]
+        counts = {}
+        if not to_count:
+            return counts
+        loader = vx.ImageLoader(Path(data_dir, to_count[0]))
+
+        def count(name):
+            file = Path(data_dir, name)
+            assert file.is_file(), f"File {file} is not found"
+            return name, loader.get_frames_in_file(file)
+
+        for name, n_frames in self._iter_in_threads(count, to_count):
+            counts[name] = n_frames
+            yield name, n_frames
+        return counts
+
+    def clear_frame_counts(self):
+        """
+        Forgets the frame counts, for example before listing the files again: the files might have changed.
+        """
+        self.frame_counts = {}
+
+    def add_frame_counts(self, data_dir, counts: dict):
+        """
+        Keeps the frame counts from iter_count_frames, used when creating the FileManager.
+
+        Args:
+            data_dir: the directory with the image files.
+            counts: number of frames in each file, keyed by the file name, relative to the data directory.
+        """
+        for name, n_frames in counts.items():
+            self.frame_counts[_file_key(data_dir, name)] = n_frames
 
     def crete_fm(self, data_dir, file_type, file_names=None):
         """
         Creates the FileManager.
+        If the file names are given, uses the frame counts from add_frame_counts, counting the rest of the files.
         """
-        self.fm = vx.FileManager(data_dir, file_type=file_type, file_names=file_names)
+        import vodex as vx
+
+        frames_per_file = None
+        if file_names is not None:
+            self.add_frame_counts(data_dir, _run_to_end(self.iter_count_frames(data_dir, file_names)))
+            frames_per_file = [self.frame_counts[_file_key(data_dir, name)] for name in file_names]
+        self.fm = vx.FileManager(data_dir, file_type=file_type, file_names=file_names,
+                                 frames_per_file=frames_per_file)
 
     def remove_fm(self):
         """
         Removes the FileManager.
         """
         self.annotations = {}
+        self._close_readers()
 
     def create_vm(self, fpv, fgf):
         """
         Creates the VolumeManager.
         """
+        import vodex as vx
+
         self.vm = vx.VolumeManager(fpv, vx.FrameManager(self.fm), fgf=fgf)
+        self._reset_loading()
 
     def remove_vm(self):
         """
         Removes the VolumeManager.
         """
         self.vm = None
+        self._reset_loading()
 
     def create_annotation(self, group: str, state_names: List[str], state_info: dict,
                           labels_order: List[str], duration: List[int], an_type: str):
         """
         Creates an annotation.
+        The labels are kept as one code per frame ( see CodedAnnotation ) and written to the experiment in bulk.
 
         Args:
             group: Group name ( the same as annotation name)
@@ -58,25 +268,70 @@ class VodexModel:
             duration: duration of the labels in the order as they follow in the annotation
             an_type: whether annotation os created from Cycle or from Timeline
         """
+        import vodex as vx
+        from ._annotations import CodedAnnotation
+        from ._annotations import write_annotation
+
         n_frames = self.vm.n_frames
         self.labels[group] = vx.Labels(group, state_names, state_info=state_info)
-        label_order = [vx.TimeLabel(name, description=state_info[name], group=group) for name in labels_order]
+        # one TimeLabel per label name, shared by all the entries with that label
+        time_labels = {name: vx.TimeLabel(name, description=state_info[name], group=group) for name in state_names}
+        label_order = [time_labels[name] for name in labels_order]
 
         if an_type == 'Timeline':
             self.timelines[group] = vx.Timeline(label_order, duration)
-            annotation = vx.Annotation.from_timeline(n_frames, self.labels[group], self.timelines[group], info=None)
+            annotation = CodedAnnotation.from_timeline(n_frames, self.labels[group], self.timelines[group])
         elif an_type == 'Cycle':
             self.cycles[group] = vx.Cycle(label_order, duration)
-            annotation = vx.Annotation.from_cycle(n_frames, self.labels[group], self.cycles[group], info=None)
+            annotation = CodedAnnotation.from_cycle(n_frames, self.labels[group], self.cycles[group])
         else:
-            annotation = None
-        self.annotations[group] = annotation
+            raise ValueError(f"Unknown annotation type {an_type}, must be 'Cycle' or 'Timeline'.")
 
-        # add to the experiment
-        self.experiment.add_annotations([annotation])
+        # add to the experiment, then to the index once it is in the database
+        with self.timer.stage("db"):
+            write_annotation(self.experiment.db.connection, annotation)
+        self.annotations[group] = annotation
+        self.index.add(annotation)
 
         # indicate that there are some unsaved changes
         self.experiment_saved = False
+        self.added_annotations.add(group)
+
+    def check_timing(self, duration: List[int], an_type: str):
+        """
+        Checks that the durations fit the recording, raises ValueError if they don't.
+        A Timeline must cover the whole recording, a Cycle can't be longer than the recording.
+        """
+        if an_type == "Timeline" and sum(duration) != self.vm.n_frames:
+            raise ValueError(f"The number of frames in a Timeline ( {sum(duration)} ) "
+                             f"must exactly match the total number of frames in the recording ( {self.vm.n_frames} ).")
+        if an_type == "Cycle" and sum(duration) > self.vm.n_frames:
+            raise ValueError(f"The number of frames in a Cycle ( {sum(duration)} ) "
+                             f"must be less or equal to the total number of frames in the recording "
+                             f"( {self.vm.n_frames} ).")
+
+    def import_annotation(self, group: str, file_name: str, an_type: str = "Timeline", state_info: dict = None):
+        """
+        Creates an annotation from a file and adds it to the experiment, see _annotations.read_timing_file:
+        a .npy file with the label of every frame or a .csv file with a label name and a duration on every line.
+        The labels are the label names in the order they first appear in the file.
+
+        Args:
+            group: Group name ( the same as annotation name)
+            file_name: the .npy or .csv file.
+            an_type: whether the file describes a Timeline or one period of a Cycle.
+            state_info: descriptions of the labels, empty for the labels that are not in it.
+        """
+        from ._annotations import read_timing_file
+
+        labels_order, duration = read_timing_file(file_name)
+        if not labels_order:
+            raise ValueError(f"No labels in {file_name}")
+        self.check_timing(duration, an_type)
+
+        state_names = list(dict.fromkeys(labels_order))
+        state_info = {name: (state_info or {}).get(name, "") for name in state_names}
+        self.create_annotation(group, state_names, state_info, labels_order, duration, an_type)
 
     def remove_annotation(self, group):
         """
@@ -86,18 +341,34 @@ class VodexModel:
         self.cycles.pop(group, None)
         self.timelines.pop(group, None)
         self.annotations.pop(group)
+        self.index.remove(group)
 
         # finally, remove from the experiment
-        self.experiment.delete_annotations([group])
+        with self.timer.stage("db"):
+            self.experiment.delete_annotations([group])
         # indicate that there are some unsaved changes
         self.experiment_saved = False
+        if group in self.added_annotations:
+            # never saved, nothing to delete from the file
+            self.added_annotations.remove(group)
+        else:
+            self.removed_annotations.add(group)
 
     def create_experiment(self):
         """
         Initialises the experiment from VolumeManager, no annotations added at this point.
         """
+        import vodex as vx
+        from ._index import ConditionIndex
+
         # check that the vm is not empty ( no creating empty tables )
-        self.experiment = vx.Experiment.create(self.vm, [])
+        with self.timer.stage("db"):
+            self.experiment = vx.Experiment.create(self.vm, [])
+        self.index = ConditionIndex(self.vm)
+        # the new experiment is not in any file yet
+        self.db_file = None
+        self.added_annotations = set()
+        self.removed_annotations = set()
 
     def remove_experiment(self):
         """
@@ -113,58 +384,171 @@ class VodexModel:
 
         self.experiment = None
         self.experiment_saved = False
+        self.db_file = None
+        self.added_annotations = set()
+        self.removed_annotations = set()
+        self.index = None
+        self._close_disk_cache()
+        self._close_readers()
 
     def save_experiment(self, file_name: str):
         """
         Saves experiment to file.
+        When saving again to the file the experiment was saved to or loaded from,
+        only the annotations that were added or removed since then are written, see save_annotation_changes.
+        Otherwise the whole database is written.
         """
-        self.experiment.save(file_name)
+        from ._annotations import save_annotation_changes
+
+        with self.timer.stage("db"):
+            if self._is_saved_to(file_name):
+                save_annotation_changes(self.experiment.db.connection, file_name,
+                                        sorted(self.added_annotations), sorted(self.removed_annotations))
+            else:
+                self.experiment.save(file_name)
+                self._close_disk_cache()
         self.experiment_saved = True
+        self.db_file = file_name
+        self.added_annotations = set()
+        self.removed_annotations = set()
+
+    def _is_saved_to(self, file_name: str) -> bool:
+        """
+        Whether the file has the experiment as it was at the last save ( or load ).
+        """
+        return self.db_file is not None and Path(file_name).is_file() and \
+            Path(file_name).resolve() == Path(self.db_file).resolve()
 
     def load_experiment(self, file_name: str):
         """
-        Loads experiment to file.
+        Loads experiment from file.
+        """
+        self.set_experiment(_run_to_end(self.iter_load_experiment(file_name)))
+
+    def iter_load_experiment(self, file_name: str):
         """
+        Reads the experiment from file, reporting the progress.
+        Reading the database is done in stages, after each stage yields ( stage description, done, total ).
+        The labels of the annotations are put together in parallel, one annotation per thread.
+        The model is not changed: the experiment is returned, to be put into the model with set_experiment.
+        Used to read the experiment in a separate thread, so that napari doesn't freeze,
+        set_experiment is then called from the main thread.
+
+        Args:
+            file_name: the database file.
+        Returns:
+            the experiment read from the file.
+        """
+        import vodex as vx
+
+        yield "Reading the database", 0, 3
         # this makes sure annotations and all the managers
         # are already in experiment
-        self.experiment = vx.Experiment.load(file_name)
-        self.experiment_saved = True
+        with self.timer.stage("db"):
+            experiment = vx.Experiment(vx.DbReader(_load_db(file_name)))
+
+        yield "Reconstructing the files and volumes", 1, 3
+        with self.timer.stage("db"):
+            db_exporter = vx.DbExporter(experiment.db)
+            fm = db_exporter.reconstruct_file_manager()
+            vm = vx.VolumeManager(experiment.db.get_fpv(), vx.FrameManager(fm), fgf=experiment.db.get_fgf())
+
+        yield "Reading the annotations", 2, 3
+        records = self._read_annotation_records(db_exporter)
+
+        annotations = {}
+        for i_done, annotation in enumerate(self._iter_build_annotations(records, vm.n_frames)):
+            annotations[annotation.name] = annotation
+            yield "Building the annotations", i_done + 1, len(records)
+
+        return LoadedExperiment(file_name, experiment, fm, vm, records, annotations)
+
+    def set_experiment(self, loaded: LoadedExperiment):
+        """
+        Replaces the experiment in the model with the one from iter_load_experiment.
+        """
+        from ._index import ConditionIndex
 
         # populate the model to reflect the experiment
-        db_exporter = vx.DbExporter(self.experiment.db)
-        self.fm = db_exporter.reconstruct_file_manager()
-        self.vm = db_exporter.reconstruct_volume_manager()
-        self.load_annotation_info(db_exporter)
+        self.remove_experiment()
+        self.experiment = loaded.experiment
+        self.experiment_saved = True
+        self.db_file = loaded.file_name
+        self.fm = loaded.fm
+        self.vm = loaded.vm
+        self._reset_loading()
+        self.index = ConditionIndex(self.vm)
+        self._add_annotations(loaded.records, loaded.annotations)
 
     def load_annotation_info(self, db_exporter):
         """
         Creates annotations, cycles, timelines and labels from the database records.
         """
-        # get the names of all the available annotations from the db
-        annotation_names = self.experiment.db.get_Names_from_AnnotationTypes()
+        records = self._read_annotation_records(db_exporter)
+        annotations = {annotation.name: annotation
+                       for annotation in self._iter_build_annotations(records, self.vm.n_frames)}
+        self._add_annotations(records, annotations)
 
-        # get the total number of frames in the recording
-        n_frames = self.vm.n_frames
+    def _read_annotation_records(self, db_exporter) -> List[tuple]:
+        """
+        Reads the labels, the cycle and the label codes of every annotation from the database.
+        The database can only be used from one thread at a time, so this is done one annotation after another.
 
-        for group in annotation_names:
-            # reconstruct Labels for the group
-            labels = db_exporter.reconstruct_labels(group)
-            self.labels[group] = labels
+        Returns:
+            list of ( labels, cycle, codes ) per annotation, cycle is None for a timeline, codes is None for a cycle.
+        """
+        from ._annotations import read_label_codes
+
+        records = []
+        with self.timer.stage("db"):
+            # get the names of all the available annotations from the db
+            annotation_names = db_exporter.db.get_Names_from_AnnotationTypes()
+            for group in annotation_names:
+                labels = db_exporter.reconstruct_labels(group)
+                cycle = db_exporter.reconstruct_cycle(group)
+                codes = None
+                if cycle is None:
+                    codes = read_label_codes(db_exporter.db.connection, labels)
+                records.append((labels, cycle, codes))
+        return records
+
+    def _iter_build_annotations(self, records: List[tuple], n_frames: int):
+        """
+        Creates the annotations from the database records, in parallel.
+        Yields the annotations in the order they are ready.
+        """
+        from ._annotations import CodedAnnotation
+
+        def build(record):
+            labels, cycle, codes = record
+            if cycle is not None:
+                return CodedAnnotation.from_cycle(n_frames, labels, cycle)
+            return CodedAnnotation(n_frames, labels, codes)
+
+        yield from self._iter_in_threads(build, records)
+
+    def _add_annotations(self, records: List[tuple], annotations: dict):
+        """
+        Adds the annotations built from the database records to the model, in the order of the records.
+        """
+        from ._annotations import timeline_from_codes
 
-            # create the annotation based on the annotation type
-            cycle = db_exporter.reconstruct_cycle(group)
+        for labels, cycle, codes in records:
+            group = labels.group
+            self.labels[group] = labels
             if cycle is not None:
                 self.cycles[group] = cycle
-                self.annotations[group] = vx.Annotation.from_cycle(n_frames, labels, cycle)
             else:
-                timeline = db_exporter.reconstruct_timeline(group)
-                self.timelines[group] = timeline
-                self.annotations[group] = vx.Annotation.from_timeline(n_frames, labels, timeline)
+                self.timelines[group] = timeline_from_codes(labels, codes)
+            self.annotations[group] = annotations[group]
+            self.index.add(annotations[group])
 
     def choose_volumes(self, conditions: Union[tuple, List[tuple]], logic: str):
         """
         Selects only full volumes that correspond to specified conditions;
         Uses "or" or "and" between the conditions depending on logic.
+        Uses the index of the annotations instead of querying the database,
+        the result is the same as experiment.choose_volumes.
         To load the selected volumes, use load_volumes()
 
         Args:
@@ -173,27 +557,444 @@ class VodexModel:
                 and name is the name of the label of that annotation type. For example [('light', 'on'), ('shape','c')]
             logic: "and" or "or" , default is "and".
         Returns:
-            list of volumes and list of frame ids that were chosen.
-            Remember that frame numbers start at 1, but volumes start at 0.
+            list of volumes that were chosen, in ascending order. Volumes start at 0.
         """
-        volume_list = self.experiment.choose_volumes(conditions, logic)
+        volume_list = self.index.choose_volumes(conditions, logic)
         return volume_list
 
-    def load_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool):
+    def load_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                     lazy: bool = False, multiscale: bool = False, pad: bool = False,
+                     volume_step: int = 1, slice_step: int = 1, bin_xy: int = 1):
         """
         Loads volumes.
+        Volumes are returned in ascending order (head first, tail last), slices in ascending order.
+
+        Args:
+            volumes: volume IDs to load, if empty, loads all the full volumes.
+            slices: slices to load in each volume, if empty, loads all the slices.
+            load_head: whether to add the partial volume at the beginning of the recording.
+            load_tail: whether to add the partial volume at the end of the recording.
+            lazy: if True, returns a dask array that only reads the volumes from disk
+                when they are displayed. Otherwise, reads everything into memory.
+            multiscale: if True, returns the multiscale pyramid: a list of arrays,
+                each 2 times smaller in y and x than the one before ( see build_pyramid ).
+                In memory pyramids are cached, so loading the same selection again is instant,
+                the levels of the cached pyramids are read-only ( see set_pyramid_budget ).
+            pad: if True, the head and tail volumes can be loaded together with the full volumes
+                even if they don't have all the selected slices: the missing slices are filled with zeros.
+                Otherwise, such a request raises a ValueError.
+            volume_step: for a quick preview, loads only every volume_step-th of the requested volumes.
+            slice_step: for a quick preview, loads only every slice_step-th of the requested slices.
+            bin_xy: for a quick preview, averages blocks of bin_xy x bin_xy pixels ( see block_mean ).
+                The frames are binned a few volumes at a time as they are read,
+                so the full resolution volumes are never in memory all together.
+        Returns:
+            4D array (volume, slice, y, x) or a list of such arrays if multiscale.
+        """
+        return _run_to_end(self.iter_load_volumes(volumes, slices, load_head, load_tail,
+                                                  lazy=lazy, multiscale=multiscale, pad=pad,
+                                                  volume_step=volume_step, slice_step=slice_step, bin_xy=bin_xy))
+
+    def iter_load_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                          lazy: bool = False, multiscale: bool = False, pad: bool = False,
+                          volume_step: int = 1, slice_step: int = 1, bin_xy: int = 1):
+        """
+        Same as load_volumes, but reports the progress: yields (volumes loaded, volumes total)
+        after every volume and returns the loaded array at the end.
+        Used to load the volumes in a separate thread, stop iterating to cancel the loading.
+        """
+        from ._arrays import block_mean
+        from ._arrays import build_pyramid
+        from ._arrays import lazy_volumes
+
+        assert self.experiment is not None, "Error when loading volumes: " \
+                                            "experiment is not initialized."
+
+        volumes, slices = self._prepare_selection(volumes, slices, load_head, load_tail,
+                                                  volume_step=volume_step, slice_step=slice_step)
+        frame_ids = self._get_frame_ids(volumes, slices)
+        self._check_frame_ids(frame_ids, pad)
+
+        # open the disk cache here, and not from the threads that read the lazy volumes
+        self._get_disk_cache()
+
+        # padding doesn't change the key: without it, the partial volumes with missing slices can't be loaded
+        pyramid_key = (tuple(volumes.tolist()), tuple(slices.tolist()), bin_xy)
+        if multiscale and not lazy:
+            pyramid = self.pyramids.get(pyramid_key)
+            if pyramid is not None:
+                return list(pyramid)
+
+        loader = self._get_loader().loader
+        frame_size = self._binned_frame_size(bin_xy)
+        if lazy:
+            def read_volume(i_volume):
+                volume = self._read_volume(volumes[i_volume], slices, frame_ids[i_volume])
+                return volume if bin_xy == 1 else block_mean(volume, bin_xy)
+
+            with self.timer.stage("assemble"):
+                img = lazy_volumes(read_volume, len(volumes), len(slices), frame_size, loader.data_type)
+        elif bin_xy == 1:
+            n_volumes, n_slices = frame_ids.shape
+            with self.timer.stage("assemble"):
+                img = np.empty((n_volumes, n_slices) + frame_size, dtype=loader.data_type)
+            for n_frames in self._iter_read(volumes, slices, frame_ids, img):
+                yield n_frames // n_slices, n_volumes
+        else:
+            n_volumes, n_slices = frame_ids.shape
+            # full resolution frames are read into a small buffer, about READ_CHUNK_FRAMES at a time, and binned
+            chunk_size = max(1, min(n_volumes, READ_CHUNK_FRAMES // n_slices))
+            with self.timer.stage("assemble"):
+                img = np.empty((n_volumes, n_slices) + frame_size, dtype=loader.data_type)
+                buffer = np.empty((chunk_size, n_slices) + tuple(loader.frame_size), dtype=loader.data_type)
+            for start in range(0, n_volumes, chunk_size):
+                chunk = slice(start, start + chunk_size)
+                chunk_img = buffer[:len(volumes[chunk])]
+                for n_frames in self._iter_read(volumes[chunk], slices, frame_ids[chunk], chunk_img):
+                    yield start + n_frames // n_slices, n_volumes
+                with self.timer.stage("assemble"):
+                    img[chunk] = block_mean(chunk_img, bin_xy)
+
+        if multiscale:
+            with self.timer.stage("assemble"):
+                img = build_pyramid(img)
+            if not lazy:
+                for level in img:
+                    level.flags.writeable = False
+                self.pyramids.put(pyramid_key, img, n_bytes=sum(level.nbytes for level in img))
+                img = list(img)
+        return img
+
+    def browse_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                       pad: bool = False):
+        """
+        Returns the volumes as an array that reads the frames only when they are indexed ( see VolumeArray ),
+        for browsing very long recordings with the napari sliders: every step of the slider reads one frame.
+        The frames go through the cache, so going back to a frame that was just shown doesn't read it again.
+        Same arguments as load_volumes.
+
+        Returns:
+            VolumeArray (volume, slice, y, x)
+        """
+        from ._arrays import VolumeArray
+
+        assert self.experiment is not None, "Error when loading volumes: " \
+                                            "experiment is not initialized."
+
+        volumes, slices = self._prepare_selection(volumes, slices, load_head, load_tail)
+        frame_ids = self._get_frame_ids(volumes, slices)
+        self._check_frame_ids(frame_ids, pad)
+        self._get_disk_cache()
+
+        loader = self._get_loader().loader
+
+        def read_planes(volume_positions, slice_positions):
+            out = np.empty((len(volume_positions), len(slice_positions)) + tuple(loader.frame_size),
+                           dtype=loader.data_type)
+            _run_to_end(self._iter_read(volumes[volume_positions], slices[slice_positions],
+                                        frame_ids[np.ix_(volume_positions, slice_positions)], out))
+            return out
+
+        return VolumeArray(read_planes, frame_ids.shape + tuple(loader.frame_size), loader.data_type)
+
+    def average_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool):
+        """
+        Averages volumes without loading all of them into memory:
+        the volumes are read a few at a time ( AVERAGE_CHUNK_VOLUMES ) and added to the running statistics.
+
+        Args:
+            volumes: volume IDs to average, if empty, averages all the full volumes.
+            slices: slices to average in each volume, if empty, uses all the slices.
+            load_head: whether to add the partial volume at the beginning of the recording.
+            load_tail: whether to add the partial volume at the end of the recording.
+        Returns:
+            RunningStats with the sum, mean and standard deviation (slice, y, x) of the volumes.
+        """
+        return _run_to_end(self.iter_average_volumes(volumes, slices, load_head, load_tail))
+
+    def iter_average_volumes(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool):
+        """
+        Same as average_volumes, but reports the progress: yields (volumes averaged, volumes total)
+        after every chunk of volumes and returns the statistics at the end.
+        Used to average the volumes in a separate thread, stop iterating to cancel.
         """
+        from ._stats import RunningStats
+
+        stats = None
+        for volume_ids, img, n_total in self.iter_volume_chunks(volumes, slices, load_head, load_tail,
+                                                                AVERAGE_CHUNK_VOLUMES):
+            if stats is None:
+                stats = RunningStats(img.shape[1:])
+            with self.timer.stage("assemble"):
+                stats.add(img)
+            yield stats.count, n_total
+        return stats
+
+    def iter_volume_chunks(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                           chunk_volumes: int, pad: bool = False):
+        """
+        Reads the volumes a chunk at a time, for processing or saving volumes that don't fit into memory.
+        The same buffer is reused for every chunk, so the memory doesn't grow with the number of volumes:
+        copy the chunk if you need it after the next one is read.
+        The volumes are in the same order as in load_volumes.
+
+        Args:
+            volumes: volume IDs to read, if empty, reads all the full volumes.
+            slices: slices to read in each volume, if empty, reads all the slices.
+            load_head: whether to add the partial volume at the beginning of the recording.
+            load_tail: whether to add the partial volume at the end of the recording.
+            chunk_volumes: number of volumes in a chunk.
+            pad: whether to fill the slices that are missing in the head and tail with zeros, see load_volumes.
+        Yields:
+            volume IDs in the chunk, the chunk as a 4D array (volume, slice, y, x)
+            and the total number of volumes.
+        """
+        assert self.experiment is not None, "Error when reading volumes: " \
+                                            "experiment is not initialized."
+
+        volumes, slices = self._prepare_selection(volumes, slices, load_head, load_tail)
+        frame_ids = self._get_frame_ids(volumes, slices)
+        self._check_frame_ids(frame_ids, pad)
+
+        loader = self._get_loader().loader
+        n_volumes, n_slices = frame_ids.shape
+        chunk_size = max(1, min(chunk_volumes, n_volumes))
+        with self.timer.stage("assemble"):
+            buffer = np.empty((chunk_size, n_slices) + tuple(loader.frame_size), dtype=loader.data_type)
+
+        for start in range(0, n_volumes, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            img = buffer[:len(volumes[chunk])]
+            _run_to_end(self._iter_read(volumes[chunk], slices, frame_ids[chunk], img))
+            yield volumes[chunk], img, n_volumes
+
+    def iter_export_ome_zarr(self, path: Union[str, Path], volumes: List[int], slices: List[int],
+                             load_head: bool, load_tail: bool, pad: bool = False,
+                             chunk_mb: float = EXPORT_CHUNK_MB):
+        """
+        Writes the volumes to an OME-Zarr store as a 4D image (volume, slice, y, x), the same array as
+        load_volumes returns. The volumes are read chunk_mb at a time and the zarr chunks are compressed
+        and written in parallel, so the memory use doesn't depend on the number of volumes.
+        The experiment ( files, volumes, annotations ) is described in the "vodex" attribute of the store
+        and the label of every exported frame is written to the annotations/<annotation name> arrays.
+        Yields (volumes written, volumes total) after every chunk.
+
+        Args:
+            path: the store folder, usually ends with .zarr , overwritten if it exists.
+            volumes: volume IDs to export, if empty, exports all the full volumes.
+            slices: slices to export in each volume, if empty, exports all the slices.
+            load_head: whether to add the partial volume at the beginning of the recording.
+            load_tail: whether to add the partial volume at the end of the recording.
+            pad: whether to fill the slices that are missing in the head and tail with zeros, see load_volumes.
+            chunk_mb: how much to read at a time, in MB. At least one volume is read at a time.
+        Returns:
+            the IDs of the exported volumes, -1 for the head and -2 for the tail.
+        """
+        from ._ome_zarr import create_ome_zarr
+        from ._ome_zarr import write_label_codes
+
+        assert self.experiment is not None, "Error when exporting volumes: " \
+                                            "experiment is not initialized."
+
+        selection, slice_ids = self._prepare_selection(volumes, slices, load_head, load_tail)
+        frame_ids = self._get_frame_ids(selection, slice_ids)
+        self._check_frame_ids(frame_ids, pad)
+
+        loader = self._get_loader().loader
+        shape = frame_ids.shape + tuple(loader.frame_size)
+        group, image = create_ome_zarr(path, shape, loader.data_type,
+                                       {"vodex": self._export_info(selection, slice_ids)})
+        codes = {name: np.where(frame_ids >= 0, annotation.codes[np.maximum(frame_ids, 0)], -1)
+                 for name, annotation in self.annotations.items()}
+        write_label_codes(group, codes, {name: list(annotation.labels.state_names)
+                                         for name, annotation in self.annotations.items()})
+
+        volume_bytes = int(np.prod(shape[1:])) * np.dtype(loader.data_type).itemsize
+        chunk_volumes = max(1, int(chunk_mb * 2 ** 20 // volume_bytes))
+        slices_per_chunk = image.chunks[1]
+        n_done = 0
+        for volume_ids, img, n_total in self.iter_volume_chunks(volumes, slices, load_head, load_tail,
+                                                                chunk_volumes, pad=pad):
+            # one job per zarr chunk, so that the threads never write to the same chunk
+            jobs = [(i_volume, start) for i_volume in range(len(img))
+                    for start in range(0, shape[1], slices_per_chunk)]
+
+            def write(job, img=img, n_done=n_done):
+                i_volume, start = job
+                end = start + slices_per_chunk
+                image[n_done + i_volume, start:end] = img[i_volume, start:end]
+
+            with self.timer.stage("assemble"):
+                _run_to_end(self._iter_in_threads(write, jobs))
+            n_done += len(img)
+            yield n_done, n_total
+        return selection.tolist()
+
+    def _export_info(self, volumes: np.ndarray, slices: np.ndarray) -> dict:
+        """
+        Describes the experiment and the exported volumes, for the attributes of the exported files.
+        """
+        from ._annotations import run_lengths
+
+        fm = self.vm.file_manager
+        annotations = {}
+        for name, annotation in self.annotations.items():
+            info = {"info": annotation.info,
+                    "labels": {label.name: label.description for label in annotation.labels.states}}
+            if annotation.cycle is not None:
+                info["cycle"] = {"labels": [label.name for label in annotation.cycle.label_order],
+                                 "duration": [int(d) for d in annotation.cycle.duration]}
+            else:
+                codes, durations = run_lengths(annotation.codes)
+                info["timeline"] = {"labels": [annotation.labels.state_names[code] for code in codes],
+                                    "duration": durations.tolist()}
+            annotations[name] = info
+
+        return {"db_file": None if self.db_file is None else str(self.db_file),
+                "data_dir": str(fm.data_dir),
+                "file_names": list(fm.file_names),
+                "frames_per_file": [int(n) for n in fm.num_frames],
+                "frames_per_volume": int(self.vm.fpv),
+                "n_head": int(self.vm.n_head),
+                "n_frames": int(self.vm.n_frames),
+                "volumes": volumes.tolist(),
+                "slices": slices.tolist(),
+                "annotations": annotations}
+
+    def estimate_load(self, volumes: List[int], slices: List[int], load_head: bool,
+                      load_tail: bool, multiscale: bool = False, pad: bool = False,
+                      volume_step: int = 1, slice_step: int = 1, bin_xy: int = 1,
+                      measure_speed: bool = True) -> LoadEstimate:
+        """
+        Checks what load_volumes will return without reading it: the shape, dtype and size of the array,
+        how long it will take to read, and how much memory is available.
+        The time is estimated from the read speed of the previous loads
+        ( a few frames are read to measure the speed if nothing has been loaded yet and measure_speed is True ).
+        Raises the same errors as load_volumes for invalid requests.
+
+        Args:
+            volumes: volume IDs to load, if empty, loads all the full volumes.
+            slices: slices to load in each volume, if empty, loads all the slices.
+            load_head: whether to add the partial volume at the beginning of the recording.
+            load_tail: whether to add the partial volume at the end of the recording.
+            multiscale: whether the multiscale pyramid will be loaded, adds the size of the lower levels.
+            pad: whether the missing slices of the head and tail will be filled with zeros.
+            volume_step: loads every volume_step-th of the requested volumes, see load_volumes.
+            slice_step: loads every slice_step-th of the requested slices, see load_volumes.
+            bin_xy: size of the blocks of pixels that are averaged, see load_volumes.
+            measure_speed: whether to read a few frames to measure the read speed if it is not known yet.
+                Reading them can take a while on slow drives, without it the time is None until something is loaded.
+        Returns:
+            the estimate.
+        """
+        from ._arrays import pyramid_shapes
+
         assert self.experiment is not None, "Error when loading volumes: " \
                                             "experiment is not initialized."
 
+        volumes, slices = self._prepare_selection(volumes, slices, load_head, load_tail,
+                                                  volume_step=volume_step, slice_step=slice_step)
+        frame_ids = self._get_frame_ids(volumes, slices)
+        self._check_frame_ids(frame_ids, pad)
+
+        loader = self._get_loader().loader
+        shape = (len(volumes), len(slices)) + self._binned_frame_size(bin_xy)
+        itemsize = np.dtype(loader.data_type).itemsize
+        # the frames are read at full resolution, even if they are binned
+        frame_bytes = int(np.prod(loader.frame_size)) * itemsize
+        n_bytes = int(np.prod(shape)) * itemsize
+        if multiscale:
+            n_bytes = sum(int(np.prod(level)) * itemsize for level in pyramid_shapes(shape))
+
+        if multiscale and (tuple(volumes.tolist()), tuple(slices.tolist()), bin_xy) in self.pyramids:
+            n_bytes_to_read = 0
+        else:
+            selected_volumes, selected_slices = set(volumes.tolist()), set(slices.tolist())
+            n_cached = sum(volume in selected_volumes and slice_id in selected_slices
+                           for volume, slice_id in self.cache.keys())
+            # the padding is not read
+            n_bytes_to_read = (np.count_nonzero(frame_ids >= 0) - n_cached) * frame_bytes
+
+        if measure_speed and self.read_speed is None:
+            self._read_frames(np.arange(min(SPEED_PROBE_FRAMES, self.vm.n_frames)))
+        seconds = None if self.read_speed is None else n_bytes_to_read / self.read_speed
+
+        return LoadEstimate(shape, np.dtype(loader.data_type), n_bytes, n_bytes_to_read, seconds, available_memory())
+
+    def set_cache_budget(self, max_bytes: int):
+        """
+        Sets the memory budget for the volume cache, 0 turns the cache off.
+        """
+        self.cache.set_budget(max_bytes)
+
+    def set_pyramid_budget(self, max_bytes: int):
+        """
+        Sets the memory budget for the multiscale pyramids cache, 0 turns the cache off.
+        Pyramids larger than the budget are not cached.
+        """
+        self.pyramids.set_budget(max_bytes)
+
+    def set_disk_cache(self, enabled: bool):
+        """
+        Turns the disk cache on or off. The frames are only cached on disk once the experiment is saved.
+        """
+        self.use_disk_cache = enabled
+        self._close_disk_cache()
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the cache hits, misses, number of cached frames and the memory used and available in bytes.
+        """
+        return self.cache.stats()
+
+    def _reset_loading(self):
+        """
+        Forgets everything that depends on the current files and volumes:
+        the loader, the open files and the cached frames.
+        """
+        self._loader = None
+        self.cache.clear()
+        self.pyramids.clear()
+        self._close_disk_cache()
+        self._close_readers()
+
+    def _prepare_selection(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                           volume_step: int = 1, slice_step: int = 1):
+        """
+        Fills in the defaults for the volumes and slices to load and puts them in the loading order:
+        slices in ascending order, head volume first, then full volumes in ascending order, then the tail volume.
+        Repeated volumes and slices are only loaded once.
+        With the steps, only every step-th of the requested full volumes and slices is kept,
+        the head and tail are added if asked for.
+
+        Returns:
+            volumes and slices to load as 1D arrays.
+        """
+        if volume_step < 1 or slice_step < 1:
+            raise ValueError(f"The volume and slice steps must be at least 1, got {volume_step} and {slice_step}.")
+
         # if slices are empty, load all slices
         if not slices:
             slices = [s for s in range(self.vm.fpv)]
+        slices = np.unique(slices)
+        if slices[-1] >= self.vm.fpv:
+            warnings.warn(f"Some of the requested slices {slices.tolist()} are not present in the volumes. " +
+                          f"Loading slices up to {self.vm.fpv - 1}.")
+            slices = slices[slices < self.vm.fpv]
+            if len(slices) == 0:
+                raise ValueError(f"None of the requested slices are present in the volumes: "
+                                 f"there are {self.vm.fpv} slices per volume.")
 
         # if volumes are empty, load all volumes
         if not volumes:
-            volumes = []
-            volumes.extend([s for s in range(self.vm.full_volumes)])
+            volumes = [s for s in range(self.vm.full_volumes)]
+        volumes = [v for v in np.unique(volumes) if v >= 0]
+        missing = [v for v in volumes if v >= self.vm.full_volumes]
+        if missing:
+            raise ValueError(f"Requested volumes {missing} are not in the recording: "
+                             f"there are {self.vm.full_volumes} full volumes.")
+        volumes = volumes[::volume_step]
+        slices = slices[::slice_step]
 
         # add head and tail volumes if needed
         if load_head and self.vm.n_head > 0:
@@ -201,14 +1002,311 @@ class VodexModel:
         if load_tail and self.vm.n_tail > 0:
             volumes.append(-2)
 
-        img = None
-        try:
-            img = self.experiment.load_slices(slices, volumes, skip_missing=False)
-        except Exception as e:
-            if str(e) == "Can't have different number of frames per volume!":
-                raise ValueError("Uncheck Head or Tail or specify slices: " +
-                                 "not all of the selected volumes have the same number of selected slices.")
+        return np.array(volumes, dtype=int), slices
+
+    def preview_placement(self, volumes: List[int], slices: List[int], load_head: bool, load_tail: bool,
+                          volume_step: int = 1, slice_step: int = 1) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """
+        Where the volumes and slices of a preview are in the layer with the same request loaded without the steps,
+        so that the preview can be placed in napari to line up with it.
+        Same arguments as load_volumes.
+
+        Returns:
+            scale and translate for the volume and slice axes. The volumes ( or slices ) of the preview
+            that are not evenly spaced in the full selection, for example with the head, are not scaled:
+            they are shown one after another, the same as without the steps.
+        """
+        full = self._prepare_selection(volumes, slices, load_head, load_tail)
+        preview = self._prepare_selection(volumes, slices, load_head, load_tail,
+                                          volume_step=volume_step, slice_step=slice_step)
+        scale, translate = [], []
+        for full_ids, preview_ids in zip(full, preview):
+            position = {item: i for i, item in enumerate(full_ids.tolist())}
+            positions = np.array([position[item] for item in preview_ids.tolist()])
+            steps = np.unique(np.diff(positions))
+            if len(steps) <= 1:
+                scale.append(int(steps[0]) if len(steps) else 1)
+                translate.append(int(positions[0]))
             else:
-                raise e
+                scale.append(1)
+                translate.append(0)
+        return tuple(scale), tuple(translate)
+
+    def _binned_frame_size(self, bin_xy: int) -> Tuple[int, int]:
+        """
+        Size of the frames after averaging blocks of bin_xy x bin_xy pixels, the incomplete blocks are dropped.
+        """
+        frame_size = tuple(self._get_loader().loader.frame_size)
+        if bin_xy < 1 or bin_xy > min(frame_size):
+            raise ValueError(f"Can't bin {frame_size[0]} x {frame_size[1]} frames by {bin_xy}: "
+                             f"the bin must be between 1 and {min(frame_size)}.")
+        return tuple(side // bin_xy for side in frame_size)
 
+    def _get_frame_ids(self, volumes: np.ndarray, slices: np.ndarray) -> np.ndarray:
+        """
+        Finds the frames for every slice in every volume.
+        Frame ids start at 0 (unlike in the database, where they start at 1).
+
+        Args:
+            volumes: volume IDs, -1 for head and -2 for tail.
+            slices: slices in the volume.
+        Returns:
+            2D array (volume, slice) of frame ids, -1 for slices that are missing in the partial volumes.
+        """
+        vm = self.vm
+        volumes = np.asarray(volumes, dtype=int)[:, np.newaxis]
+        slices = np.asarray(slices, dtype=int)[np.newaxis, :]
+
+        # full volumes
+        frame_ids = vm.n_head + volumes * vm.fpv + slices
+        # head: the first frame in the recording is the slice fpv - n_head
+        head_ids = slices - (vm.fpv - vm.n_head)
+        frame_ids = np.where(volumes == -1, np.where(head_ids >= 0, head_ids, -1), frame_ids)
+        # tail: starts at the top of the volume right after the last full volume
+        tail_ids = vm.n_head + vm.full_volumes * vm.fpv + slices
+        frame_ids = np.where(volumes == -2, np.where(slices < vm.n_tail, tail_ids, -1), frame_ids)
+
+        return frame_ids
+
+    def _check_frame_ids(self, frame_ids: np.ndarray, pad: bool):
+        """
+        Raises a ValueError if some of the selected slices are missing in the partial volumes
+        and they can't be padded.
+        """
+        if not pad and np.any(frame_ids < 0):
+            raise ValueError("Uncheck Head or Tail, specify slices or check Pad: " +
+                             "not all of the selected volumes have the same number of selected slices.")
+
+    def _get_disk_cache(self):
+        """
+        Returns the disk cache for the current experiment, opens it if needed.
+        None if the disk cache is off, the experiment is not saved or the cache can't be written.
+        """
+        if self._disk_cache is None and self.use_disk_cache and self.db_file is not None:
+            fm = self.vm.file_manager
+            loader = self._get_loader().loader
+            files = [Path(fm.data_dir, file_name) for file_name in fm.file_names]
+            try:
+                self._disk_cache = DiskCache(cache_dir(self.db_file), files, self.vm.n_frames,
+                                             loader.frame_size, loader.data_type)
+            except OSError as e:
+                warnings.warn(f"Could not create the disk cache, turning it off: {e}")
+                self.use_disk_cache = False
+        return self._disk_cache
+
+    def _close_disk_cache(self):
+        if self._disk_cache is not None:
+            self._disk_cache.close()
+            self._disk_cache = None
+
+    def _get_readers(self):
+        """
+        Returns the pool of open tif files, creates it if needed.
+        """
+        if self._readers is None:
+            from ._readers import TiffReaderPool
+
+            self._readers = TiffReaderPool()
+        return self._readers
+
+    def _close_readers(self):
+        if self._readers is not None:
+            self._readers.close()
+            self._readers = None
+
+    def _get_loader(self):
+        """
+        Returns the ImageLoader for the current files, creates it if needed.
+        """
+        if self._loader is None:
+            import vodex as vx
+
+            fm = self.vm.file_manager
+            self._loader = vx.ImageLoader(Path(fm.data_dir, fm.file_names[0]))
+        return self._loader
+
+    def _frame_to_file(self, frame_ids: np.ndarray):
+        """
+        Maps frames to the files where they are stored.
+
+        Args:
+            frame_ids: frame ids, starting at 0.
+        Returns:
+            file index for every frame and frame index inside that file.
+        """
+        frames_per_file = np.asarray(self.vm.file_manager.num_frames)
+        file_starts = np.cumsum(frames_per_file) - frames_per_file
+        file_ids = np.searchsorted(file_starts, frame_ids, side='right') - 1
+        return file_ids, frame_ids - file_starts[file_ids]
+
+    def _read_volume(self, volume: int, slices: np.ndarray, frame_ids: np.ndarray) -> np.ndarray:
+        """
+        Reads the slices of one volume.
+
+        Args:
+            volume: volume ID.
+            slices: slices to read.
+            frame_ids: frame ids for the slices, starting at 0.
+        Returns:
+            3D array (slice, y, x)
+        """
+        loader = self._get_loader().loader
+        img = np.empty((1, len(slices)) + tuple(loader.frame_size), dtype=loader.data_type)
+        _run_to_end(self._iter_read([volume], slices, frame_ids[np.newaxis], img))
+        return img[0]
+
+    def _iter_read(self, volumes: np.ndarray, slices: np.ndarray, frame_ids: np.ndarray, out: np.ndarray):
+        """
+        Reads the slices of the volumes into the output array.
+        The slices that are in the cache are not read from disk, then the slices in the disk cache are copied
+        from there, the rest are decoded from the image files and added to both caches.
+        The slices that are missing in the partial volumes ( frame id -1 ) are filled with zeros.
+        Yields the number of frames that are already in the output array.
+
+        Args:
+            volumes: volume IDs.
+            slices: slices to read in every volume.
+            frame_ids: 2D array (volume, slice) of frame ids, starting at 0, -1 for the missing slices.
+            out: 4D output array (volume, slice, y, x).
+        """
+        keys = [(int(volume), int(slice_id)) for volume in volumes for slice_id in slices]
+        frame_ids = frame_ids.ravel()
+        out = out.reshape((-1,) + out.shape[2:])
+
+        missing = []
+        with self.timer.stage("assemble"):
+            for position, key in enumerate(keys):
+                if frame_ids[position] < 0:
+                    out[position] = 0
+                    continue
+                frame = self.cache.get(key)
+                if frame is None:
+                    missing.append(position)
+                else:
+                    out[position] = frame
+        n_done = len(keys) - len(missing)
+
+        # when the request is larger than the cache, only its tail is cached:
+        # caching the head would just evict it again further down the request
+        frame_bytes = int(np.prod(out.shape[1:])) * out.itemsize
+        first_cached = len(keys) - self.cache.max_bytes // max(1, frame_bytes)
+
+        missing = np.array(missing, dtype=int)
+        disk_cache = self._get_disk_cache()
+        if disk_cache is not None and len(missing) > 0:
+            on_disk = missing[disk_cache.contains(frame_ids[missing])]
+            missing = np.setdiff1d(missing, on_disk)
+            for start in range(0, len(on_disk), READ_CHUNK_FRAMES):
+                positions = on_disk[start: start + READ_CHUNK_FRAMES]
+                with self.timer.stage("decode"):
+                    read = disk_cache.read(frame_ids[positions], out, positions)
+                if not read:
+                    # the disk cache was turned off meanwhile, decode the rest
+                    missing = np.union1d(missing, on_disk[start:])
+                    break
+                self._cache_frames(keys, out, positions, first_cached)
+                n_done += len(positions)
+                yield n_done
+
+        for positions in self.timer.iterate("decode", self._iter_read_frames(frame_ids[missing], out, missing)):
+            if disk_cache is not None:
+                with self.timer.stage("decode"):
+                    disk_cache.write(frame_ids[positions], out[positions])
+            self._cache_frames(keys, out, positions, first_cached)
+            n_done += len(positions)
+            yield n_done
+
+    def _cache_frames(self, keys: list, out: np.ndarray, positions: np.ndarray, first_cached: int = 0):
+        """
+        Adds copies of the frames from the output array to the cache.
+
+        Args:
+            keys: cache keys for every position in the output array.
+            out: 3D output array (frame, y, x).
+            positions: positions in the output array to cache.
+            first_cached: the frames before this position are not cached.
+        """
+        positions = positions[positions >= first_cached]
+        if len(positions) == 0:
+            return
+        with self.timer.stage("assemble"):
+            for position in positions:
+                self.cache.put(keys[position], out[position].copy())
+
+    def _iter_read_frames(self, frame_ids: np.ndarray, out: np.ndarray, positions: np.ndarray):
+        """
+        Reads frames from the image files using the File and Frame managers (doesn't query the database).
+        The frames are grouped by file and the files are read in parallel, in chunks of READ_CHUNK_FRAMES.
+        Yields the positions in the output array that have been filled in, chunk by chunk.
+
+        Args:
+            frame_ids: frame ids, starting at 0.
+            out: 3D output array (frame, y, x).
+            positions: where to put each frame in the output array.
+        """
+        from ._readers import group_by_file
+        from ._readers import read_file_frames
+
+        if len(frame_ids) == 0:
+            return
+        fm = self.vm.file_manager
+        loader = self._get_loader()
+        file_ids, frame_in_file = self._frame_to_file(np.asarray(frame_ids))
+        jobs = group_by_file(file_ids, frame_in_file, np.asarray(positions), READ_CHUNK_FRAMES)
+        readers = self._get_readers()
+
+        def read(job):
+            read_file_frames(loader, Path(fm.data_dir, fm.file_names[job.file_id]),
+                             job.frame_in_file, out, job.positions, readers=readers)
+            return job.positions
+
+        start = time.perf_counter()
+        n_read = 0
+        for positions in self._iter_in_threads(read, jobs):
+            n_read += len(positions)
+            yield positions
+        self._update_read_speed(n_read * out[0].nbytes, time.perf_counter() - start)
+
+    def _iter_in_threads(self, function, items: list):
+        """
+        Calls the function on every item, in n_workers threads.
+        Yields the results in the order they are ready.
+        When the iteration is stopped early or the function fails, the items that haven't been started are skipped.
+        """
+        if len(items) <= 1 or self.n_workers == 1:
+            for item in items:
+                yield function(item)
+            return
+
+        pool = ThreadPoolExecutor(max_workers=min(self.n_workers, len(items)))
+        futures = [pool.submit(function, item) for item in items]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    def _update_read_speed(self, n_bytes: int, seconds: float):
+        """
+        Updates the measured read speed, averaging it with the previous measurements.
+        """
+        if n_bytes == 0 or seconds <= 0:
+            return
+        speed = n_bytes / seconds
+        self.read_speed = speed if self.read_speed is None else (self.read_speed + speed) / 2
+
+    def _read_frames(self, frame_ids: np.ndarray) -> np.ndarray:
+        """
+        Reads frames from the image files, bypassing the cache.
+
+        Args:
+            frame_ids: frame ids, starting at 0.
+        Returns:
+            3D array (frame, y, x) in the order of frame_ids.
+        """
+        loader = self._get_loader().loader
+        img = np.empty((len(frame_ids),) + tuple(loader.frame_size), dtype=loader.data_type)
+        _run_to_end(self._iter_read_frames(frame_ids, img, np.arange(len(frame_ids))))
         return img
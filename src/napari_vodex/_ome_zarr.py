@@ -0,0 +1,92 @@
+"""
+Writing the volumes to an OME-Zarr store ( NGFF 0.4, https://ngff.openmicroscopy.org/0.4/ ),
+a chunked and compressed format that napari, Fiji and python can read without going through the tif files.
+zarr is an optional dependency: pip install napari-vodex[zarr]
+"""
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+# the volumes are split into zarr chunks of at most this size, but at least one frame
+ZARR_CHUNK_MB = 16
+# the axes of the exported array: volumes are the time points, slices are z
+OME_AXES = [{"name": "t", "type": "time"},
+            {"name": "z", "type": "space"},
+            {"name": "y", "type": "space"},
+            {"name": "x", "type": "space"}]
+
+
+def import_zarr():
+    """
+    Imports zarr, with a hint on how to install it if it is missing.
+    """
+    try:
+        import zarr
+    except ImportError as e:
+        raise ImportError("Exporting to OME-Zarr needs zarr: pip install napari-vodex[zarr]") from e
+    return zarr
+
+
+def zarr_chunks(shape: Tuple[int, int, int, int], itemsize: int, chunk_mb: float = ZARR_CHUNK_MB) -> tuple:
+    """
+    Chunk shape for the array (volume, slice, y, x): whole frames from one volume, up to chunk_mb per chunk.
+    """
+    frame_bytes = shape[2] * shape[3] * itemsize
+    n_slices = int(max(1, min(shape[1], chunk_mb * 2 ** 20 // frame_bytes)))
+    return 1, n_slices, shape[2], shape[3]
+
+
+def create_array(group, name: str, shape: tuple, dtype, chunks: tuple):
+    """
+    Adds an empty array to the group, in the same zarr format as the group.
+    """
+    # zarr-python 2 has no create_array, and zarr-python 3 creates format 3 arrays with zeros
+    if hasattr(group, "create_array"):
+        return group.create_array(name=name, shape=shape, dtype=dtype, chunks=chunks)
+    return group.zeros(name=name, shape=shape, dtype=dtype, chunks=chunks)
+
+
+def create_ome_zarr(path: Union[str, Path], shape: Tuple[int, int, int, int], dtype, attributes: dict):
+    """
+    Creates the OME-Zarr store with an empty image array, overwrites the store if it exists.
+    The image is a single resolution level, in the array "0".
+
+    Args:
+        path: the store folder, usually ends with .zarr .
+        shape: shape of the image (volume, slice, y, x).
+        dtype: datatype of the image.
+        attributes: more attributes for the root group, next to the OME "multiscales".
+    Returns:
+        the root group and the image array.
+    """
+    zarr = import_zarr()
+    # NGFF 0.4 is defined for zarr format 2, zarr-python 3 writes format 3 unless asked
+    zarr_format = {"zarr_format": 2} if int(zarr.__version__.split(".")[0]) >= 3 else {}
+    group = zarr.open_group(str(path), mode="w", **zarr_format)
+
+    image = create_array(group, "0", shape, dtype, zarr_chunks(shape, np.dtype(dtype).itemsize))
+    group.attrs["multiscales"] = [{
+        "version": "0.4",
+        "name": Path(path).stem,
+        "axes": OME_AXES,
+        "datasets": [{"path": "0", "coordinateTransformations": [{"type": "scale", "scale": [1.0] * 4}]}],
+    }]
+    group.attrs.update(attributes)
+    return group, image
+
+
+def write_label_codes(group, codes: Dict[str, np.ndarray], state_names: Dict[str, List[str]]):
+    """
+    Adds the label of every exported frame for each annotation, as the arrays annotations/<annotation name>
+    (volume, slice) with the label codes: the position of the label in the "labels" attribute of the array,
+    -1 for the padding.
+    """
+    annotations = group.require_group("annotations")
+    for name, name_codes in codes.items():
+        array = create_array(annotations, name, name_codes.shape, np.int16, name_codes.shape)
+        array[...] = name_codes
+        array.attrs["labels"] = state_names[name]
@@ -0,0 +1,187 @@
+"""
+Reading frames from the image files.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+import numpy as np
+import vodex as vx
+from tifffile import TiffFile
+
+# how many tif files the reader pool keeps open
+MAX_OPEN_FILES = 64
+# how many handles the reader pool keeps open for each file, so that the chunks of a file are read in parallel
+HANDLES_PER_FILE = 4
+
+
+class ReadJob(NamedTuple):
+    """
+    Frames to read from one file.
+
+    Attributes:
+        file_id: index of the file in the FileManager.
+        frame_in_file: frames inside the file, in ascending order.
+        positions: where to put each frame in the output array.
+    """
+    file_id: int
+    frame_in_file: np.ndarray
+    positions: np.ndarray
+
+
+def group_by_file(file_ids: np.ndarray, frame_in_file: np.ndarray, positions: np.ndarray,
+                  chunk_size: int) -> List[ReadJob]:
+    """
+    Groups the frames by the file where they are stored, frames are sorted in the order they are stored in the file.
+    Groups larger than chunk_size are split into several jobs.
+
+    Args:
+        file_ids: the file for every frame.
+        frame_in_file: the frame inside the file for every frame.
+        positions: where to put each frame in the output array.
+        chunk_size: maximum number of frames per job.
+    Returns:
+        list of jobs, one or more per file.
+    """
+    order = np.lexsort((frame_in_file, file_ids))
+    file_ids, frame_in_file, positions = file_ids[order], frame_in_file[order], positions[order]
+
+    jobs = []
+    file_starts = np.flatnonzero(np.diff(file_ids, prepend=-1))
+    file_ends = np.append(file_starts[1:], len(file_ids))
+    for start, end in zip(file_starts, file_ends):
+        for chunk_start in range(start, end, chunk_size):
+            chunk = slice(chunk_start, min(chunk_start + chunk_size, end))
+            jobs.append(ReadJob(int(file_ids[start]), frame_in_file[chunk], positions[chunk]))
+    return jobs
+
+
+class _OpenFile:
+    """
+    A tif file in the TiffReaderPool: the handles that are open and not used by any reader right now.
+    Every reader takes its own handle, so the file is read by several threads at the same time.
+    """
+
+    def __init__(self, file: Path, max_handles: int):
+        self.file = file
+        self.max_handles = max_handles
+        self.lock = threading.Lock()
+        self.idle = []
+        # set when the file was closed by the pool, the handles that are still used are closed when returned
+        self.closed = False
+
+    def take(self) -> TiffFile:
+        """
+        Takes an idle handle, or opens a new one if all are in use.
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        # setting multifile to false, same as vodex does
+        tif = TiffFile(self.file, _multifile=False)
+        # keep the parsed page headers, not only the offsets
+        tif.pages.cache = True
+        return tif
+
+    def give_back(self, tif: TiffFile):
+        """
+        Keeps the handle for the next reader, or closes it if the file is closed or enough handles are kept.
+        """
+        with self.lock:
+            if not self.closed and len(self.idle) < self.max_handles:
+                self.idle.append(tif)
+                return
+        tif.close()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for tif in idle:
+            tif.close()
+
+
+class TiffReaderPool:
+    """
+    Keeps the recently read tif files open, so that every load doesn't open the files
+    and parse the chain of the page headers ( IFDs ) again: the pages that have been found are kept
+    with their offsets, and the next read of the same page goes straight to its data.
+    Each reader gets a handle of its own, so one file is read by several threads at the same time,
+    up to handles_per_file handles are kept open for each file.
+    When more than max_open files are open, the least recently used one is closed.
+    Safe to use from several threads.
+
+    Args:
+        max_open: maximum number of open files.
+        handles_per_file: maximum number of handles kept open for each file.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_FILES, handles_per_file: int = HANDLES_PER_FILE):
+        self.max_open = max_open
+        self.handles_per_file = handles_per_file
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+    @contextmanager
+    def open(self, file: Path):
+        """
+        Opens the file, or takes an open handle from the pool, and holds it for the with block.
+        """
+        key = str(file)
+        with self._lock:
+            entry = self._files.pop(key, None) or _OpenFile(Path(file), self.handles_per_file)
+            self._files[key] = entry
+            closing = []
+            while len(self._files) > self.max_open:
+                closing.append(self._files.popitem(last=False)[1])
+        for old in closing:
+            old.close()
+
+        tif = entry.take()
+        try:
+            yield tif
+        finally:
+            entry.give_back(tif)
+
+    def close(self):
+        """
+        Closes all the files, the pool can still be used after that.
+        """
+        with self._lock:
+            entries = list(self._files.values())
+            self._files.clear()
+        for entry in entries:
+            entry.close()
+
+
+def read_file_frames(loader: vx.ImageLoader, file: Path, frame_in_file: np.ndarray,
+                     out: np.ndarray, positions: np.ndarray, readers: Optional[TiffReaderPool] = None):
+    """
+    Reads frames from one file directly into the output array.
+
+    Args:
+        loader: ImageLoader for the recording.
+        file: full path to the file.
+        frame_in_file: frames to read from the file.
+        out: output array (frame, y, x).
+        positions: where to put each frame in the output array.
+        readers: the pool of open tif files to read from, if None, the file is opened just for this read.
+    """
+    if isinstance(loader.loader, vx.TiffLoader):
+        if readers is None:
+            # keeps nothing open: the file is opened just for this read
+            readers = TiffReaderPool(max_open=0)
+        with readers.open(file) as stack:
+            for frame, position in zip(frame_in_file, positions):
+                stack.pages[int(frame)].asarray(out=out[position])
+    else:
+        out[positions] = loader.load_frames(frame_in_file.tolist(), [file] * len(frame_in_file),
+                                            show_progress=False)
@@ -0,0 +1,68 @@
+"""
+Statistics over many volumes that are computed while the volumes are read,
+so that only the result and a few volumes are in memory at any time.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+class RunningStats:
+    """
+    Running sum, mean and standard deviation of arrays of the same shape, updated a batch at a time.
+    The batches are merged with Chan's parallel version of Welford's algorithm, in float64,
+    so the standard deviation stays accurate for long recordings with a large mean.
+
+    Args:
+        shape: shape of one item, for example (slice, y, x) for volumes.
+
+    Attributes:
+        count: number of items added so far.
+        sum: sum of the items.
+    """
+
+    def __init__(self, shape: Tuple[int, ...]):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.sum = np.zeros(self.shape, dtype=np.float64)
+        self._mean = np.zeros(self.shape, dtype=np.float64)
+        # sum of the squared differences from the mean
+        self._m2 = np.zeros(self.shape, dtype=np.float64)
+
+    def add(self, batch: np.ndarray):
+        """
+        Adds a batch of items.
+
+        Args:
+            batch: array (item, ...) with the items along the first axis.
+        """
+        n_batch = len(batch)
+        if n_batch == 0:
+            return
+        batch = batch.astype(np.float64, copy=False)
+        batch_sum = batch.sum(axis=0)
+        batch_mean = batch_sum / n_batch
+        batch_m2 = ((batch - batch_mean) ** 2).sum(axis=0)
+
+        n_total = self.count + n_batch
+        delta = batch_mean - self._mean
+        self._mean += delta * (n_batch / n_total)
+        self._m2 += batch_m2 + delta ** 2 * (self.count * n_batch / n_total)
+        self.sum += batch_sum
+        self.count = n_total
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        Mean of the items, float32.
+        """
+        return self._mean.astype(np.float32)
+
+    @property
+    def std(self) -> np.ndarray:
+        """
+        Population standard deviation of the items ( same as numpy std ), float32.
+        """
+        if self.count == 0:
+            return np.zeros(self.shape, dtype=np.float32)
+        return np.sqrt(self._m2 / self.count).astype(np.float32)
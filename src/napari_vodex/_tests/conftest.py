@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import tifffile
+
+from napari_vodex._model import VodexModel
+
+
+def write_recording(directory, frames_per_file, frame_size=(4, 5), dtype=np.uint16):
+    """
+    Writes a synthetic recording split into several tif files.
+    Every pixel of a frame is set to the frame id ( starting at 0 ),
+    so it is easy to check which frames were loaded.
+
+    Args:
+        directory: where to write the files.
+        frames_per_file: number of frames in each file.
+        frame_size: ( height, width ) of a frame in pixels.
+        dtype: datatype of the frames, the frame ids wrap around if they don't fit.
+    Returns:
+        the directory.
+    """
+    frame_id = 0
+    for i_file, n_frames in enumerate(frames_per_file):
+        frames = np.arange(frame_id, frame_id + n_frames).astype(dtype)
+        img = np.broadcast_to(frames[:, None, None], (n_frames,) + tuple(frame_size))
+        tifffile.imwrite(directory / f"recording_{i_file}.tif", img)
+        frame_id += n_frames
+    return directory
+
+
+@pytest.fixture
+def make_recording(tmp_path):
+    """
+    Factory for synthetic recordings in a temporary directory, see write_recording.
+    """
+    def make(frames_per_file, frame_size=(4, 5), dtype=np.uint16):
+        directory = tmp_path / "recording"
+        directory.mkdir()
+        return write_recording(directory, frames_per_file, frame_size=frame_size, dtype=dtype)
+
+    return make
+
+
+@pytest.fixture
+def recording(make_recording):
+    """
+    A small recording split into 3 tif files: 9, 10 and 11 frames of 4x5 pixels.
+    """
+    return make_recording([9, 10, 11])
+
+
+@pytest.fixture
+def model(recording):
+    """
+    Model with the experiment created from the recording:
+    4 frames per volume, 1 frame in the head, 7 full volumes, 1 frame in the tail.
+    """
+    vodex_model = VodexModel()
+    vodex_model.crete_fm(recording, "TIFF")
+    vodex_model.create_vm(4, 1)
+    vodex_model.create_experiment()
+    return vodex_model
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: times the model on a synthetic recording")
@@ -0,0 +1,499 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dask.array as da
+import numpy as np
+import pytest
+import vodex as vx
+
+from napari_vodex._annotations import ANNOTATION_TABLES
+from napari_vodex._arrays import block_mean
+from napari_vodex._arrays import build_pyramid
+from napari_vodex._disk_cache import cache_dir
+from napari_vodex._model import VodexModel
+from napari_vodex._stats import RunningStats
+from napari_vodex._timing import PerfRecorder
+
+
+def test_load_volumes_matches_vodex(model):
+    img = model.load_volumes([2, 0, 2], [1, 3], False, False)
+    expected = model.experiment.load_slices([1, 3], [0, 2])
+    np.testing.assert_array_equal(img, expected)
+    # frames 0 to 4 : 1 frame of head + volume 0
+    assert img[0, :, 0, 0].tolist() == [2, 4]
+
+
+def test_load_volumes_lazy(model):
+    img = model.load_volumes([], [0], False, True, lazy=True)
+    assert isinstance(img, da.Array)
+    assert img.shape == (8, 1, 4, 5)
+    # the first slice of every volume, the tail starts at frame 29
+    assert img[:, 0, 0, 0].compute().tolist() == [1, 5, 9, 13, 17, 21, 25, 29]
+
+    # the tail volume has only one frame, so it can't be loaded with all the slices
+    with pytest.raises(ValueError):
+        model.load_volumes([], [], False, True, lazy=True)
+
+
+def test_load_volumes_padded(model):
+    with pytest.raises(ValueError):
+        model.load_volumes([], [], True, True)
+
+    # head: frame 0 is the last slice, tail: frame 29 is the first slice, the rest is padded with zeros
+    expected = [0, 0, 0, 0] + list(range(1, 29)) + [29, 0, 0, 0]
+    estimate = model.estimate_load([], [], True, True, pad=True)
+    assert estimate.shape == (9, 4, 4, 5)
+    assert estimate.n_bytes_to_read == 30 * 40
+
+    img = model.load_volumes([], [], True, True, pad=True)
+    assert img.shape == (9, 4, 4, 5)
+    assert img[:, :, 0, 0].ravel().tolist() == expected
+    lazy_img = model.load_volumes([], [], True, True, pad=True, lazy=True)
+    assert lazy_img[:, :, 0, 0].compute().ravel().tolist() == expected
+
+
+def test_load_volumes_preview(model):
+    full = model.load_volumes([], [], False, True, pad=True).astype(np.float32)
+    # every 2nd of the full volumes, then the tail, every 3rd slice, 2 x 2 binning drops the last column
+    expected = full[[0, 2, 4, 6, 7]][:, ::3, :, :4].reshape(5, 2, 2, 2, 2, 2).mean(axis=(3, 5))
+
+    estimate = model.estimate_load([], [], False, True, pad=True, volume_step=2, slice_step=3, bin_xy=2)
+    assert estimate.shape == (5, 2, 2, 2)
+    img = model.load_volumes([], [], False, True, pad=True, volume_step=2, slice_step=3, bin_xy=2)
+    np.testing.assert_array_equal(img, expected.astype(np.uint16))
+    lazy_img = model.load_volumes([], [], False, True, pad=True, lazy=True, volume_step=2, slice_step=3, bin_xy=2)
+    np.testing.assert_array_equal(lazy_img.compute(), img)
+
+    with pytest.raises(ValueError):
+        model.load_volumes([], [], False, False, bin_xy=5)
+
+    # the preview lines up with the full layer of the same request: volumes 1 and 5 are at 0 and 2 there
+    assert model.preview_placement([1, 3, 5], [1, 2, 3], False, False, volume_step=2, slice_step=2) == \
+           ((2, 2), (0, 0))
+    # the tail breaks the even spacing of the volumes, the slices are still scaled
+    assert model.preview_placement([], [], False, True, volume_step=2, slice_step=3) == ((1, 3), (0, 0))
+
+
+def test_browse_volumes(model):
+    full = model.load_volumes([], [], False, True, pad=True)
+    img = model.browse_volumes([], [], False, True, pad=True)
+    assert img.shape == full.shape and img.dtype == full.dtype
+
+    reads = []
+    read_planes = img.read_planes
+    img.read_planes = lambda volumes, slices: reads.append(volumes.size * slices.size) or read_planes(volumes, slices)
+    # a step of the napari slider reads one frame
+    np.testing.assert_array_equal(img[3, 2], full[3, 2])
+    assert reads == [1]
+    # the volume and slice axes are indexed independently, the padding of the tail is read as zeros
+    np.testing.assert_array_equal(img[[1, 3], ::2, 1:], full[[1, 3]][:, ::2, 1:])
+    np.testing.assert_array_equal(img[-1, ..., 0], full[-1, ..., 0])
+    np.testing.assert_array_equal(np.asarray(img), full)
+    with pytest.raises(IndexError):
+        img[8]
+
+
+def test_iter_load_volumes_reports_progress(model):
+    # volumes 1 to 3 are in the first two files, the progress is reported after each file
+    progress = [loaded for loaded, total in model.iter_load_volumes([1, 2, 3], [], False, False)]
+    assert len(progress) == 2
+    assert progress[-1] == 3
+
+
+def test_load_volumes_from_cache(model):
+    model.load_volumes([0, 1], [], False, False)
+    assert model.cache_stats()["misses"] == 8
+
+    # volume 1 is already in the cache
+    img = model.load_volumes([1, 2], [], False, False)
+    assert model.cache_stats()["hits"] == 4
+    assert img[:, 0, 0, 0].tolist() == [5, 9]
+
+    # each frame is 4x5 uint16 = 40 bytes, only the 3 most recently used frames fit
+    model.set_cache_budget(120)
+    assert len(model.cache) == 3
+    assert (2, 3) in model.cache
+
+
+def test_load_volumes_larger_than_cache(model):
+    # 2 volumes of 4 frames don't fit in 3 frames: only the last 3 frames are cached
+    model.set_cache_budget(120)
+    model.cache.clear()
+    model.load_volumes([3, 4], [], False, False)
+    assert sorted(model.cache.keys()) == [(4, 1), (4, 2), (4, 3)]
+
+
+def test_load_volumes_in_parallel(model):
+    # volumes 0 to 6 are spread over the 3 files
+    model.n_workers = 3
+    img = model.load_volumes([], [], False, False)
+    assert img[:, :, 0, 0].ravel().tolist() == list(range(1, 29))
+
+    model.n_workers = 1
+    model.cache.clear()
+    np.testing.assert_array_equal(img, model.load_volumes([], [], False, False))
+
+
+def test_average_volumes(model):
+    # 7 volumes are averaged in 2 chunks
+    progress = [done for done, total in model.iter_average_volumes([], [1, 2], False, False)]
+    assert progress == [4, 7]
+
+    img = model.load_volumes([], [1, 2], False, False).astype(np.float64)
+    stats = model.average_volumes([], [1, 2], False, False)
+    assert stats.count == 7
+    np.testing.assert_allclose(stats.sum, img.sum(axis=0))
+    np.testing.assert_allclose(stats.mean, img.mean(axis=0), rtol=1e-6)
+    np.testing.assert_allclose(stats.std, img.std(axis=0), rtol=1e-6)
+
+
+def test_running_stats_in_batches():
+    # a large mean and a small spread, where the naive sum of squares loses precision
+    data = 60000 + np.random.default_rng(0).normal(size=(25, 3, 4))
+    stats = RunningStats((3, 4))
+    for batch in [data[:1], data[1:10], data[10:10], data[10:]]:
+        stats.add(batch)
+    assert stats.count == 25
+    np.testing.assert_allclose(stats.mean, data.mean(axis=0), rtol=1e-6)
+    np.testing.assert_allclose(stats.std, data.std(axis=0), rtol=1e-4)
+
+
+def test_tif_files_stay_open(model, monkeypatch):
+    import napari_vodex._readers as readers
+
+    opened = []
+    tiff_file = readers.TiffFile
+
+    def open_tif(file, **kwargs):
+        opened.append(file)
+        return tiff_file(file, **kwargs)
+
+    monkeypatch.setattr(readers, "TiffFile", open_tif)
+    model.set_cache_budget(0)
+
+    img = model.load_volumes([], [], False, False)
+    assert len(opened) == 3
+    # the files are not opened again
+    np.testing.assert_array_equal(model.load_volumes([], [], False, False), img)
+    assert len(opened) == 3
+
+    # only 2 files are kept open, the least recently used one is closed
+    model._readers.max_open = 2
+    model.load_volumes([], [], False, False)
+    assert len(model._readers) == 2
+    model.remove_experiment()
+    assert model._readers is None
+
+
+def test_tif_file_read_in_parallel(recording):
+    from napari_vodex._readers import TiffReaderPool
+
+    pool = TiffReaderPool(handles_per_file=2)
+    file = recording / "recording_1.tif"
+    # both threads must hold the file at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def read_chunk(frames):
+        with pool.open(file) as tif:
+            barrier.wait()
+            return [tif.pages[frame].asarray()[0, 0] for frame in frames]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        chunks = list(executor.map(read_chunk, [range(0, 5), range(5, 10)]))
+    assert chunks == [list(range(9, 14)), list(range(14, 19))]
+    # both handles are kept for the next reads
+    assert len(pool._files[str(file)].idle) == 2
+    pool.close()
+
+
+def test_choose_volumes_matches_vodex(model):
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    model.create_annotation("shape", ["c", "s"], {"c": "", "s": ""}, ["c", "s", "c"], [10, 12, 8], "Timeline")
+
+    queries = [([("light", "on")], "and"),
+               ([("light", "off")], "and"),
+               ([("light", "off"), ("shape", "s")], "and"),
+               ([("light", "on"), ("shape", "c")], "or"),
+               ([("light", "on"), ("light", "off")], "or")]
+    for conditions, logic in queries:
+        assert model.choose_volumes(conditions, logic) == model.experiment.choose_volumes(conditions, logic)
+
+    # the index follows the annotation when it is replaced
+    model.remove_annotation("light")
+    with pytest.raises(KeyError):
+        model.choose_volumes([("light", "off")], "and")
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [13, 4], "Cycle")
+    assert model.choose_volumes([("light", "off")], "and") == \
+           model.experiment.choose_volumes([("light", "off")], "and")
+
+
+def test_create_annotation_fails_to_write(model):
+    # the annotation name is already in the database, so writing it fails
+    model.experiment.db.connection.execute("INSERT INTO AnnotationTypes (Name, Description) VALUES ('light', '')")
+    with pytest.raises(sqlite3.IntegrityError):
+        model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    assert "light" not in model.index
+    assert "light" not in model.annotations
+
+
+def test_annotations_match_vodex(model, tmp_path, monkeypatch):
+    # the 30 frames are written to the database in several chunks
+    monkeypatch.setattr("napari_vodex._annotations.INSERT_CHUNK_FRAMES", 7)
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    model.create_annotation("shape", ["c", "s"], {"c": "", "s": ""}, ["c", "s", "c"], [10, 12, 8], "Timeline")
+
+    # the same annotations, created by vodex
+    annotations = [vx.Annotation.from_cycle(30, model.labels["light"], model.cycles["light"]),
+                   vx.Annotation.from_timeline(30, model.labels["shape"], model.timelines["shape"])]
+    experiment = vx.Experiment.create(model.vm, annotations)
+    query = """SELECT FrameId, Name FROM Annotations
+               JOIN AnnotationTypeLabels ON AnnotationTypeLabelId = AnnotationTypeLabels.Id
+               ORDER BY FrameId, Name"""
+    expected = experiment.db.connection.execute(query).fetchall()
+    assert model.experiment.db.connection.execute(query).fetchall() == expected
+    query = "SELECT FrameId, CycleIteration FROM CycleIterations ORDER BY FrameId"
+    assert model.experiment.db.connection.execute(query).fetchall() == \
+           experiment.db.connection.execute(query).fetchall()
+    for annotation in annotations:
+        assert model.annotations[annotation.name].frame_to_label == annotation.frame_to_label
+
+    # the timeline is reconstructed from the saved labels
+    model.save_experiment(tmp_path / "experiment.db")
+    model.remove_experiment()
+    model.load_experiment(tmp_path / "experiment.db")
+    assert model.timelines["shape"].duration == [10, 12, 8]
+    assert model.annotations["shape"].frame_to_label == annotations[1].frame_to_label
+    np.testing.assert_array_equal(model.annotations["light"].frame_to_cycle, annotations[0].frame_to_cycle)
+
+
+def test_save_experiment_incrementally(model, tmp_path, monkeypatch):
+    db_file = tmp_path / "experiment.db"
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    model.create_annotation("shape", ["c", "s"], {"c": "", "s": ""}, ["c", "s", "c"], [10, 12, 8], "Timeline")
+    model.save_experiment(db_file)
+
+    # created again with the same name, added and removed before saving
+    model.remove_annotation("light")
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["on", "off"], [2, 5], "Cycle")
+    model.create_annotation("size", ["b", "m"], {"b": "", "m": ""}, ["b", "m"], [20, 10], "Timeline")
+    model.create_annotation("temp", ["b", "m"], {"b": "", "m": ""}, ["b", "m"], [20, 10], "Timeline")
+    model.remove_annotation("temp")
+    assert model.added_annotations == {"light", "size"}
+    assert model.removed_annotations == {"light"}
+
+    # the database is not written again as a whole
+    monkeypatch.setattr(model.experiment, "save", None)
+    model.save_experiment(db_file)
+    assert model.experiment_saved
+    assert not model.added_annotations and not model.removed_annotations
+
+    saved = sqlite3.connect(db_file)
+    for table, _ in ANNOTATION_TABLES:
+        query = f"SELECT * FROM {table} ORDER BY 1, 2"
+        assert saved.execute(query).fetchall() == model.experiment.db.connection.execute(query).fetchall()
+    saved.close()
+
+    loaded = VodexModel()
+    loaded.load_experiment(db_file)
+    assert sorted(loaded.annotations) == ["light", "shape", "size"]
+    assert loaded.cycles["light"].duration == [2, 5]
+    for name in loaded.annotations:
+        assert loaded.annotations[name].frame_to_label == model.annotations[name].frame_to_label
+
+
+def test_estimate_load(model):
+    # nothing is read without measuring the speed, so the time is not known
+    assert model.estimate_load([0, 1, 2], [1, 3], False, False, measure_speed=False).seconds is None
+    assert model.read_speed is None
+
+    estimate = model.estimate_load([0, 1, 2], [1, 3], False, False)
+    img = model.load_volumes([0, 1, 2], [1, 3], False, False)
+    assert estimate.shape == img.shape
+    assert estimate.dtype == img.dtype
+    assert estimate.n_bytes == img.nbytes
+    assert estimate.fits_in_memory
+    # the speed was measured when estimating, nothing was cached then
+    assert estimate.seconds is not None
+    assert estimate.n_bytes_to_read == img.nbytes
+
+    # two of the volumes are in the cache now
+    estimate = model.estimate_load([1, 2, 3], [1, 3], False, False)
+    assert estimate.n_bytes_to_read == img.nbytes // 3
+
+
+def test_load_volumes_multiscale(model):
+    # 4 x 5 frames are small enough for a single level
+    levels = model.load_volumes([0, 1], [], False, False, multiscale=True)
+    assert len(levels) == 1
+    # the second load of the same selection comes from the cache, the cached levels can't be changed
+    cached = model.load_volumes([1, 0], [], False, False, multiscale=True)
+    assert cached[0] is levels[0]
+    assert not cached[0].flags.writeable
+    # the pyramids have their own budget
+    model.set_cache_budget(0)
+    assert model.load_volumes([0, 1], [], False, False, multiscale=True)[0] is levels[0]
+    model.set_pyramid_budget(0)
+    assert model.load_volumes([0, 1], [], False, False, multiscale=True)[0] is not levels[0]
+
+    levels = build_pyramid(levels[0], min_size=2)
+    assert [level.shape for level in levels] == [(2, 4, 4, 5), (2, 4, 2, 2)]
+    # every pixel is the frame id, so the block mean is the frame id too
+    np.testing.assert_array_equal(levels[1][:, :, 0, 0], levels[0][:, :, 0, 0])
+    lazy_levels = build_pyramid(model.load_volumes([0, 1], [], False, False, lazy=True), min_size=2)
+    np.testing.assert_array_equal(lazy_levels[1].compute(), levels[1])
+
+
+def test_block_mean_rounds_integers():
+    img = np.array([[1, 2], [2, 2]], dtype=np.uint16)
+    # the mean is 1.75, rounded to 2 and not truncated to 1
+    assert block_mean(img).tolist() == [[2]]
+    assert block_mean(da.from_array(img)).compute().tolist() == [[2]]
+    assert block_mean(img.astype(np.float32)).tolist() == [[1.75]]
+
+
+def test_load_volumes_from_disk_cache(model, recording, monkeypatch):
+    db_file = recording / "experiment.db"
+    model.save_experiment(db_file)
+    # off unless turned on
+    model.load_volumes([0], [], False, False)
+    assert not cache_dir(db_file).exists()
+
+    model.set_disk_cache(True)
+    img = model.load_volumes([0, 1, 2], [], False, False)
+    # only the frames that were read are on disk, the rest are read from the memory cache
+    parts = [np.load(file) for file in cache_dir(db_file).glob("part_*.npy")]
+    assert sum(len(part) for part in parts) == 8
+
+    # reopen the experiment: the frames come from the disk cache, the image files are not decoded
+    reopened = VodexModel()
+    reopened.set_disk_cache(True)
+    reopened.load_experiment(db_file)
+    with monkeypatch.context() as patch:
+        patch.setattr("napari_vodex._readers.read_file_frames", None)
+        np.testing.assert_array_equal(reopened.load_volumes([1, 2], [], False, False), img[1:])
+
+    # the cache is emptied when the image files change
+    reopened.remove_experiment()
+    stat = (recording / "recording_0.tif").stat()
+    os.utime(recording / "recording_0.tif", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    reopened.load_experiment(db_file)
+    reopened.load_volumes([2], [], False, False)
+    index = np.load(cache_dir(db_file) / "index.npy")
+    assert np.flatnonzero(index[:, 0] >= 0).tolist() == [9, 10, 11, 12]
+
+
+def test_load_volumes_timing(model, tmp_path):
+    perf = PerfRecorder(model.timer, log_file=tmp_path / "perf.jsonl")
+    with perf.action("load volumes", lazy=False):
+        model.load_volumes([0, 1], [], False, False)
+    with pytest.raises(ValueError):
+        with perf.action("load volumes", lazy=False):
+            model.load_volumes([100], [], False, False)
+
+    records = [json.loads(line) for line in open(tmp_path / "perf.jsonl")]
+    assert [record["status"] for record in records] == ["ok", "error"]
+    assert records[0]["decode"] > 0
+    assert records[0]["lazy"] is False
+    stages = sum(records[0][stage] for stage in ["db", "decode", "assemble", "layer", "other"])
+    assert stages == pytest.approx(records[0]["total"])
+
+
+def test_iter_load_experiment_in_thread(model, tmp_path):
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    model.create_annotation("shape", ["c", "s"], {"c": "", "s": ""}, ["c", "s", "c"], [10, 12, 8], "Timeline")
+    model.create_annotation("size", ["b", "m"], {"b": "", "m": ""}, ["b", "m"], [20, 10], "Timeline")
+    model.save_experiment(tmp_path / "experiment.db")
+
+    loaded = VodexModel()
+    loaded.n_workers = 3
+    pool = ThreadPoolExecutor(max_workers=1)
+    progress = []
+
+    def read_experiment():
+        generator = loaded.iter_load_experiment(tmp_path / "experiment.db")
+        while True:
+            try:
+                progress.append(next(generator))
+            except StopIteration as stop:
+                return stop.value
+
+    experiment = pool.submit(read_experiment).result()
+    pool.shutdown()
+    # the model is only changed when the experiment is set, here in the main thread
+    assert loaded.experiment is None
+    loaded.set_experiment(experiment)
+    assert progress[:3] == [("Reading the database", 0, 3), ("Reconstructing the files and volumes", 1, 3),
+                            ("Reading the annotations", 2, 3)]
+    assert [done for _, done, _ in progress[3:]] == [1, 2, 3]
+
+    # the experiment loaded in another thread is used from this one
+    assert list(loaded.annotations) == ["light", "shape", "size"]
+    assert loaded.timelines["shape"].duration == [10, 12, 8]
+    assert loaded.choose_volumes([("light", "on"), ("size", "b")], "and") == \
+           model.choose_volumes([("light", "on"), ("size", "b")], "and")
+    loaded.create_annotation("color", ["r", "g"], {"r": "", "g": ""}, ["r", "g"], [15, 15], "Timeline")
+    assert loaded.experiment.choose_volumes([("color", "r")]) == loaded.choose_volumes([("color", "r")], "and")
+
+
+def test_find_files_and_count_frames(recording):
+    # a file that sorts differently when the case is not ignored, and a file of another type
+    (recording / "Recording_3.tif").write_bytes((recording / "recording_0.tif").read_bytes())
+    (recording / "notes.txt").write_text("not an image")
+    model = VodexModel()
+    model.n_workers = 2
+
+    generator = model.iter_find_files(recording, "TIFF")
+    found = []
+    while True:
+        try:
+            found.extend(next(generator))
+        except StopIteration as stop:
+            file_names = stop.value
+            break
+    expected = vx.FileManager(recording)
+    assert sorted(found) == sorted(file_names)
+    assert file_names == expected.file_names
+
+    counted = dict(model.iter_count_frames(recording, file_names[:2]))
+    assert counted == dict(zip(expected.file_names[:2], expected.num_frames[:2]))
+    # the counts are only kept when added, by the full path
+    assert model.frame_counts == {}
+    model.add_frame_counts(recording, counted)
+    model.add_frame_counts(recording / "other", {file_names[2]: 1})
+    assert model.frame_counts[str(recording / file_names[0])] == expected.num_frames[0]
+    # the rest of the frames are counted when the FileManager is created
+    model.crete_fm(recording, "TIFF", file_names=file_names)
+    assert model.fm == expected
+    # listing the files again doesn't change the counts, they are only forgotten when asked to
+    list(model.iter_find_files(recording, "TIFF"))
+    assert len(model.frame_counts) == 5
+    model.clear_frame_counts()
+    assert model.frame_counts == {}
+
+    (recording / "empty").mkdir()
+    with pytest.raises(AssertionError, match="No files"):
+        list(model.iter_find_files(recording / "empty", "TIFF"))
+
+
+def test_import_annotation(model, tmp_path):
+    frame_labels = np.array(["rest"] * 12 + ["swim"] * 8 + ["rest"] * 10)
+    np.save(tmp_path / "behaviour.npy", frame_labels)
+    model.import_annotation("behaviour", tmp_path / "behaviour.npy", state_info={"swim": "tail beats"})
+    assert model.labels["behaviour"].state_names == ["rest", "swim"]
+    assert model.labels["behaviour"].swim.description == "tail beats"
+    assert model.timelines["behaviour"].duration == [12, 8, 10]
+    assert [label.name for label in model.annotations["behaviour"].frame_to_label] == frame_labels.tolist()
+
+    (tmp_path / "light.csv").write_text("label,duration\noff,3\non,6\n")
+    model.import_annotation("light", tmp_path / "light.csv", an_type="Cycle")
+    assert model.cycles["light"].duration == [3, 6]
+    assert model.experiment.choose_volumes([("light", "on"), ("behaviour", "swim")], "and") == \
+           model.choose_volumes([("light", "on"), ("behaviour", "swim")], "and")
+
+    # a timeline must cover the whole recording
+    with pytest.raises(ValueError, match="Timeline"):
+        model.import_annotation("short", tmp_path / "light.csv", an_type="Timeline")
+    assert "short" not in model.annotations
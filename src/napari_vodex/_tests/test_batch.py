@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import tifffile
+
+from napari_vodex._batch import export_volumes
+from napari_vodex._batch import main
+from napari_vodex._batch import open_experiment
+from napari_vodex._batch import parse_condition
+from napari_vodex._batch import parse_ids
+
+
+@pytest.fixture
+def db_file(model, tmp_path):
+    """
+    The experiment from the model fixture with a "light" annotation, saved to a database.
+    """
+    model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"], [3, 6], "Cycle")
+    db_file = tmp_path / "experiment.db"
+    model.save_experiment(db_file)
+    return db_file
+
+
+def test_parse_arguments():
+    assert parse_ids("0, 4,9:12") == [0, 4, 9, 10, 11, 12]
+    assert parse_condition(" light = on") == ("light", "on")
+    with pytest.raises(ValueError):
+        parse_condition("light")
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".tif"])
+def test_export_volumes(model, db_file, tmp_path, suffix):
+    exported = open_experiment(db_file)
+    out_file = tmp_path / f"volumes{suffix}"
+    progress = []
+    # 2 volumes ( 4 slices of 4 x 5 uint16 pixels ) per chunk
+    written = export_volumes(exported, out_file, [], [], True, False, pad=True,
+                             chunk_mb=320 / 2 ** 20, progress=lambda *p: progress.append(p))
+
+    assert written == [-1, 0, 1, 2, 3, 4, 5, 6]
+    assert progress == [(2, 8), (4, 8), (6, 8), (8, 8)]
+    img = np.load(out_file) if suffix == ".npy" else tifffile.imread(out_file)
+    np.testing.assert_array_equal(img, model.load_volumes([], [], True, False, pad=True))
+
+
+def test_export_cli(model, db_file, tmp_path, capsys):
+    out_file = tmp_path / "light_on.npy"
+    assert main([str(db_file), str(out_file), "--condition", "light=on", "--slices", "1:2"]) == 0
+
+    volumes = model.choose_volumes([("light", "on")], "and")
+    assert capsys.readouterr().out.strip() == ",".join(str(volume) for volume in volumes)
+    np.testing.assert_array_equal(np.load(out_file), model.load_volumes(volumes, [1, 2], False, False))
+
+    assert main([str(db_file), str(tmp_path / "volumes.png")]) == 1
+
+
+def test_export_ome_zarr(model, db_file, tmp_path):
+    zarr = pytest.importorskip("zarr")
+    exported = open_experiment(db_file, n_workers=3)
+    out_file = tmp_path / "volumes.zarr"
+    written = export_volumes(exported, out_file, [], [], False, True, pad=True, chunk_mb=320 / 2 ** 20)
+    assert written == [0, 1, 2, 3, 4, 5, 6, -2]
+
+    store = zarr.open_group(str(out_file), mode="r")
+    np.testing.assert_array_equal(store["0"][:], model.load_volumes([], [], False, True, pad=True))
+    assert [axis["name"] for axis in store.attrs["multiscales"][0]["axes"]] == ["t", "z", "y", "x"]
+
+    info = store.attrs["vodex"]
+    assert info["frames_per_file"] == [9, 10, 11]
+    assert info["volumes"] == written
+    assert info["annotations"]["light"]["cycle"] == {"labels": ["off", "on"], "duration": [3, 6]}
+    # volume 0 is frames 1 to 4: 3 frames off, then on, the tail has only one frame ( 29, off )
+    light = store["annotations/light"]
+    labels = np.array(light.attrs["labels"] + ["padding"])
+    assert labels[light[0]].tolist() == ["off", "off", "on", "on"]
+    assert labels[light[-1]].tolist() == ["off", "padding", "padding", "padding"]
@@ -0,0 +1,163 @@
+"""
+Times the model on a synthetic recording, to catch performance regressions ( for example when upgrading vodex ).
+The default recording is small, so that the benchmark runs with the rest of the tests.
+Set NAPARI_VODEX_BENCHMARK to change the size, for example:
+
+    NAPARI_VODEX_BENCHMARK="files=20,frames=2000,height=512,width=512,fpv=50,head=7" pytest -m benchmark -s
+
+The timings, throughput and peak memory are printed and recorded as properties in the junit xml report.
+The plugin startup ( importing it and opening the widget ) is timed in a fresh python process.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+from napari_vodex._model import VodexModel
+
+# files: number of files, frames: frames per file, height and width of a frame,
+# fpv: frames per volume, head: frames in the partial volume at the beginning
+DEFAULT_CONFIG = {"files": 4, "frames": 250, "height": 64, "width": 64, "fpv": 10, "head": 3}
+
+
+def benchmark_config() -> dict:
+    """
+    Recording size, DEFAULT_CONFIG updated from the NAPARI_VODEX_BENCHMARK environment variable.
+    """
+    config = dict(DEFAULT_CONFIG)
+    for item in os.environ.get("NAPARI_VODEX_BENCHMARK", "").split(","):
+        if item.strip():
+            key, value = item.split("=")
+            assert key.strip() in config, f"Unknown benchmark setting {key}, use one of {list(config)}"
+            config[key.strip()] = int(value)
+    return config
+
+
+@contextmanager
+def measure_time(results: dict, name: str):
+    """
+    Records how long the code in the with block takes.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results.setdefault(name, {})["seconds"] = time.perf_counter() - start
+
+
+@contextmanager
+def measure_memory(results: dict, name: str):
+    """
+    Records the peak memory allocated by the code in the with block.
+    Tracing the memory slows python down a lot, so the time is measured separately.
+    """
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.setdefault(name, {})["peak_mb"] = peak / 2 ** 20
+
+
+# opens the widget in a fresh process, prints the times and which of the slow to import packages got imported
+STARTUP_SCRIPT = """
+import json, sys, time
+from qtpy.QtWidgets import QApplication
+app = QApplication([])
+start = time.perf_counter()
+from napari_vodex import VodexWidget
+imported = time.perf_counter()
+widget = VodexWidget(None)
+opened = time.perf_counter()
+print(json.dumps({"import": imported - start, "open": opened - start,
+                  "loaded": [name for name in ["vodex", "dask.array", "tifffile"] if name in sys.modules]}))
+"""
+
+
+def run_model(recording, config: dict, db_file, measure, results: dict):
+    """
+    Goes through the model the same way the plugin does, measuring every step.
+    """
+    frame_size = (config["height"], config["width"])
+    n_frames = config["frames"] * config["files"]
+
+    model = VodexModel()
+    # measure the reading from the image files, not from the caches
+    model.set_cache_budget(0)
+    model.set_disk_cache(False)
+
+    with measure(results, "crete_fm"):
+        model.crete_fm(recording, "TIFF")
+    with measure(results, "create_vm"):
+        model.create_vm(config["fpv"], config["head"])
+        model.create_experiment()
+
+    with measure(results, "create_annotation"):
+        model.create_annotation("light", ["on", "off"], {"on": "", "off": ""}, ["off", "on"],
+                                [config["fpv"] * 3, config["fpv"] * 2 + 1], "Cycle")
+        half = n_frames // 2
+        model.create_annotation("shape", ["c", "s"], {"c": "", "s": ""}, ["c", "s"],
+                                [half, n_frames - half], "Timeline")
+
+    with measure(results, "choose_volumes"):
+        volumes = model.choose_volumes([("light", "on"), ("shape", "s")], "or")
+
+    with measure(results, "load_volumes"):
+        img = model.load_volumes([], [], False, False)
+    assert img.shape == (model.vm.full_volumes, config["fpv"]) + frame_size
+    n_bytes = img.nbytes
+
+    with measure(results, "load_volumes (conditions)"):
+        img = model.load_volumes(volumes, [], False, False)
+    assert len(img) == len(volumes)
+
+    with measure(results, "save_experiment"):
+        model.save_experiment(db_file)
+
+    loaded = VodexModel()
+    with measure(results, "load_experiment"):
+        loaded.load_experiment(db_file)
+    assert loaded.choose_volumes([("light", "on"), ("shape", "s")], "or") == volumes
+    return n_bytes
+
+
+@pytest.mark.benchmark
+def test_model_benchmark(make_recording, tmp_path, record_property):
+    config = benchmark_config()
+    recording = make_recording([config["frames"]] * config["files"],
+                               frame_size=(config["height"], config["width"]))
+
+    results = {}
+    n_bytes = run_model(recording, config, tmp_path / "timing.db", measure_time, results)
+    run_model(recording, config, tmp_path / "memory.db", measure_memory, results)
+
+    load = results["load_volumes"]
+    load["MB/s"] = n_bytes / 2 ** 20 / load["seconds"]
+    load["frames/s"] = n_bytes / (config["height"] * config["width"] * 2) / load["seconds"]
+
+    print(f"\nRecording: {config}")
+    for name, result in results.items():
+        print(f"{name:>28}: " + ", ".join(f"{key} {value:.3f}" for key, value in result.items()))
+        for key, value in result.items():
+            record_property(f"{name} {key}", float(np.round(value, 6)))
+
+
+@pytest.mark.benchmark
+def test_startup_benchmark(record_property):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    results = json.loads(output.strip().splitlines()[-1])
+
+    # vodex and the image reading are only imported when an experiment is created or loaded
+    assert results["loaded"] == []
+    print(f"\nStartup: import {results['import']:.3f} s, open the widget {results['open']:.3f} s")
+    record_property("startup import seconds", round(results["import"], 6))
+    record_property("startup open seconds", round(results["open"], 6))
@@ -1,6 +1,12 @@
 import numpy as np
+import pytest
+from qtpy.QtCore import QModelIndex
+from qtpy.QtCore import Qt
+from qtpy.QtTest import QAbstractItemModelTester
 
 from napari_vodex import VodexWidget
+from napari_vodex._view import FileListModel
+from napari_vodex._view import TimingTab
 
 
 # make_napari_viewer is a pytest fixture that returns a napari viewer object
@@ -21,3 +27,54 @@ def test_loading_experiment_from_file(make_napari_viewer):
     # assert captured.out == "napari has 1 layers\n"
     pass
 
+
+def test_file_list_model(qapp):
+    model = FileListModel(["a.tif", "b.tif", "c.tif"])
+    # checks that the model follows the Qt rules while it is changed
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    model.add_files(["d.tif", "e.tif"])
+    model.set_frame_count("b.tif", 10)
+    assert model.index(1).data() == "b.tif [10]"
+    assert model.index(1).data(Qt.UserRole) == "b.tif"
+
+    # move "a" after "c", the way the list view moves the dragged rows
+    assert model.moveRows(QModelIndex(), 0, 1, QModelIndex(), 3)
+    assert model.file_names() == ["b.tif", "c.tif", "a.tif", "d.tif", "e.tif"]
+    # drag and drop without moveRows: the dropped rows are inserted, then the dragged rows are removed
+    data = model.mimeData([model.index(3), model.index(4)])
+    assert model.dropMimeData(data, Qt.MoveAction, 0, 0, QModelIndex())
+    model.removeRows(5, 2)
+    assert model.file_names() == ["d.tif", "e.tif", "b.tif", "c.tif", "a.tif"]
+
+    model.remove_rows([0, 4, 1])
+    assert model.file_names() == ["b.tif", "c.tif"]
+    assert model.index(0).data() == "b.tif [10]"
+    model.set_files([])
+    assert model.rowCount() == 0
+    # the tester checks the model until here
+    del tester
+
+
+def test_timing_tab(qapp):
+    timing = TimingTab()
+    tester = QAbstractItemModelTester(timing.model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    timing.set_sequence(["on", "off"], ["off", "on"] * 1000, list(range(1, 2001)))
+    assert timing.get_names_sequence()[:3] == ["off", "on", "off"]
+    assert timing.get_duration_sequence()[-1] == 2000
+
+    timing.add_row(["on", "off"])
+    assert timing.model.index(2000, 0).data() == "on"
+    assert timing.model.setData(timing.model.index(2000, 0), "off")
+    assert not timing.model.setData(timing.model.index(2000, 1), 0)
+    timing.model.remove_rows(range(2, 2000))
+    assert timing.get_names_sequence() == ["off", "on", "off"]
+    assert timing.get_duration_sequence() == [1, 2, 1]
+
+    # the chosen labels are kept when the labels change
+    timing.update_choices(["dark", "off", "on"])
+    assert timing.get_names_sequence() == ["off", "on", "off"]
+    assert timing.model.uses("on") and not timing.model.uses("dark")
+    with pytest.raises(AssertionError):
+        timing.update_choices(["dark", "on"])
+    # the tester checks the model until here
+    del tester
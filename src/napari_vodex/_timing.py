@@ -0,0 +1,155 @@
+"""
+Timing of the plugin actions, split into the stages where the time goes:
+db ( vodex database queries ), decode ( reading the frames from the image files ),
+assemble ( putting the frames together into arrays ) and layer ( creating the napari layer ).
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+STAGES = ("db", "decode", "assemble", "layer")
+# the timing records are appended to this file as JSON lines, if the variable is set
+LOG_FILE_ENV = "NAPARI_VODEX_PERF_LOG"
+
+
+class StageTimer:
+    """
+    Adds up the time spent in each stage since it was created.
+    Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._totals = {stage: 0.0 for stage in STAGES}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage: str):
+        """
+        Adds the time spent in the with block to the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._totals[stage] += seconds
+
+    def iterate(self, stage: str, iterator):
+        """
+        Goes through the iterator, adding the time spent waiting for each item to the stage.
+        Closes the iterator if it is a generator and the iteration is stopped early.
+        """
+        iterator = iter(iterator)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+                yield item
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def totals(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._totals)
+
+
+class Action:
+    """
+    An action that is being timed, see PerfRecorder.start.
+    """
+
+    def __init__(self, name: str, totals: Dict[str, float], info: dict):
+        self.name = name
+        self.info = info
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.start_totals = totals
+
+
+class PerfRecorder:
+    """
+    Keeps the timing records of the recent actions and writes them to the log file.
+    The stage times of an action are the time the timer spent in each stage while the action was running.
+
+    Args:
+        timer: the timer that measures the stages.
+        log_file: file to append the records to as JSON lines,
+            defaults to the NAPARI_VODEX_PERF_LOG environment variable, None to not log.
+        max_records: how many recent records to keep.
+
+    Attributes:
+        records: the recent records, the oldest first.
+        listeners: functions to call with every new record.
+    """
+
+    def __init__(self, timer: StageTimer, log_file: Optional[str] = None, max_records: int = 200):
+        self.timer = timer
+        self.log_file = log_file if log_file is not None else os.environ.get(LOG_FILE_ENV)
+        self.records = deque(maxlen=max_records)
+        self.listeners: List[Callable[[dict], None]] = []
+
+    def start(self, name: str, **info) -> Action:
+        """
+        Starts timing an action, finish it with PerfRecorder.finish.
+        Use it for the actions that end in another function, for example when the worker is done.
+        """
+        return Action(name, self.timer.totals(), info)
+
+    def finish(self, action: Action, status: str = "ok") -> dict:
+        """
+        Finishes timing an action: creates the record, logs it and passes it to the listeners.
+
+        Args:
+            action: the action returned by start.
+            status: "ok", "error" or "cancelled".
+        Returns:
+            the record.
+        """
+        total = time.perf_counter() - action.start_time
+        totals = self.timer.totals()
+        record = {"action": action.name, "time": action.started.isoformat(timespec="seconds"),
+                  "status": status, "total": total}
+        for stage in STAGES:
+            record[stage] = totals[stage] - action.start_totals[stage]
+        # stages can overlap when reading lazily in other threads, so this can't go below 0
+        record["other"] = max(0.0, total - sum(record[stage] for stage in STAGES))
+        record.update(action.info)
+
+        self.records.append(record)
+        if self.log_file:
+            with open(self.log_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        for listener in self.listeners:
+            listener(record)
+        return record
+
+    @contextmanager
+    def action(self, name: str, **info):
+        """
+        Times the code in the with block as one action.
+        The status of the record is "error" if the block raised an exception.
+        """
+        action = self.start(name, **info)
+        status = "error"
+        try:
+            yield action
+            status = "ok"
+        finally:
+            self.finish(action, status=status)
@@ -1,7 +1,7 @@
 from typing import List
 from pathlib import Path
 
-from qtpy.QtCore import Qt, QRegExp, QModelIndex
+from qtpy.QtCore import Qt, QRegExp, QModelIndex, QAbstractListModel, QAbstractTableModel, QByteArray, QMimeData
 from qtpy.QtGui import QRegExpValidator
 from qtpy.QtWidgets import (
 
@@ -12,8 +12,8 @@ from qtpy.QtWidgets import (
     QTextBrowser,
     QTabWidget,
     QTableWidget,
-    QListWidget,
-    QListWidgetItem,
+    QTableView,
+    QListView,
     QFormLayout,
     QLineEdit,
     QStackedLayout,
@@ -30,10 +30,12 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QHBoxLayout,
     QFrame,
-    QLabel
+    QLabel,
+    QProgressBar
 )
+import numpy as np
 
-import vodex as vx
+from ._timing import STAGES
 
 
 # _______________________________________________________________________________
@@ -108,6 +110,151 @@ class ReadOnlyDelegate(QStyledItemDelegate):
         return None
 
 
+class FileListModel(QAbstractListModel):
+    """
+    The files in the recording, in the order they will be read, for the list of files.
+    The names are kept in an array, and the order of the list is an array of indices into it,
+    so reordering, deleting and getting the names are array operations instead of one item per file.
+
+    Args:
+        file_names: names of the files, in the initial order.
+    """
+    # the rows that are dragged, as the indices into the file names
+    MIME_TYPE = "application/x-vodex-file-ids"
+
+    def __init__(self, file_names: List[str] = ()):
+        super().__init__()
+        self.set_files(file_names)
+
+    def set_files(self, file_names: List[str]):
+        """
+        Replaces all the files in the list.
+        """
+        self.beginResetModel()
+        self._names = np.array(file_names, dtype=object)
+        self._n_frames = np.full(len(self._names), -1, dtype=np.int64)
+        self._ids = {name: i_name for i_name, name in enumerate(self._names)}
+        self._order = np.arange(len(self._names), dtype=np.int64)
+        self.endResetModel()
+
+    def add_files(self, file_names: List[str]):
+        """
+        Adds the files to the end of the list.
+        """
+        if len(file_names) == 0:
+            return
+        n_names, n_rows = len(self._names), len(self._order)
+        self.beginInsertRows(QModelIndex(), n_rows, n_rows + len(file_names) - 1)
+        self._names = np.concatenate([self._names, np.array(file_names, dtype=object)])
+        self._n_frames = np.concatenate([self._n_frames, np.full(len(file_names), -1, dtype=np.int64)])
+        self._ids.update({name: n_names + i_name for i_name, name in enumerate(file_names)})
+        self._order = np.concatenate([self._order, np.arange(n_names, len(self._names), dtype=np.int64)])
+        self.endInsertRows()
+
+    def set_frame_count(self, file_name: str, n_frames: int):
+        """
+        Sets the number of frames in the file, shown next to the file name.
+        """
+        i_name = self._ids.get(file_name)
+        if i_name is not None:
+            self._n_frames[i_name] = n_frames
+            # the view only repaints the rows that are visible
+            self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1), [Qt.DisplayRole])
+
+    def file_names(self) -> List[str]:
+        """
+        The file names in the order of the list.
+        """
+        return self._names[self._order].tolist()
+
+    def remove_rows(self, rows: List[int]):
+        """
+        Removes the rows from the list, each run of neighbouring rows at once.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) == 0:
+            return
+        # split into runs of neighbouring rows and remove them from the last one, so that the rows don't shift
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) > 1) + 1)
+        for run in reversed(runs):
+            self.removeRows(int(run[0]), len(run))
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        # it's a list: only the root has rows
+        if parent.isValid():
+            return 0
+        return len(self._order)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i_name = self._order[index.row()]
+        if role == Qt.DisplayRole:
+            if self._n_frames[i_name] >= 0:
+                return f"{self._names[i_name]} [{self._n_frames[i_name]}]"
+            return self._names[i_name]
+        if role == Qt.UserRole:
+            return self._names[i_name]
+        return None
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            # drop between the files, not on them
+            return Qt.ItemIsDropEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def removeRows(self, row: int, count: int, parent: QModelIndex = QModelIndex()) -> bool:
+        if parent.isValid() or row < 0 or count <= 0 or row + count > len(self._order):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self._order = np.delete(self._order, np.s_[row: row + count])
+        self.endRemoveRows()
+        return True
+
+    def moveRows(self, source_parent: QModelIndex, source_row: int, count: int,
+                 destination_parent: QModelIndex, destination_row: int) -> bool:
+        if not self.beginMoveRows(source_parent, source_row, source_row + count - 1,
+                                  destination_parent, destination_row):
+            return False
+        moved = self._order[source_row: source_row + count]
+        rest = np.delete(self._order, np.s_[source_row: source_row + count])
+        # destination_row is the row before which to insert, counted before the rows are taken out
+        if destination_row > source_row:
+            destination_row -= count
+        self._order = np.concatenate([rest[:destination_row], moved, rest[destination_row:]])
+        self.endMoveRows()
+        return True
+
+    def mimeTypes(self) -> List[str]:
+        return [self.MIME_TYPE]
+
+    def mimeData(self, indexes: List[QModelIndex]) -> QMimeData:
+        rows = sorted(index.row() for index in indexes if index.isValid())
+        mime_data = QMimeData()
+        mime_data.setData(self.MIME_TYPE, QByteArray(self._order[rows].tobytes()))
+        return mime_data
+
+    def dropMimeData(self, data: QMimeData, action, row: int, column: int, parent: QModelIndex) -> bool:
+        """
+        Inserts the dragged files at the drop position,
+        the view then removes the dragged rows from where they were.
+        """
+        if action == Qt.IgnoreAction:
+            return True
+        if not data.hasFormat(self.MIME_TYPE) or action != Qt.MoveAction:
+            return False
+        ids = np.frombuffer(bytes(data.data(self.MIME_TYPE)), dtype=np.int64)
+        if row < 0:
+            row = parent.row() if parent.isValid() else len(self._order)
+        self.beginInsertRows(QModelIndex(), row, row + len(ids) - 1)
+        self._order = np.insert(self._order, row, ids)
+        self.endInsertRows()
+        return True
+
+
 class FileListDisplay(QWidget):
     """
     Shows files in the folder. Allows editing.
@@ -120,16 +267,24 @@ class FileListDisplay(QWidget):
 
         # Create a top-level layout
         edit_layout = QVBoxLayout()
-        # prepare the list
-        self.list_widget = QListWidget()
+        # prepare the list: only the visible rows are created, so it works with any number of files
+        self.model = FileListModel(file_names)
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
         # setting drag drop mode
-        self.list_widget.setDragDropMode(QAbstractItemView.InternalMove)
-        self.fill_list(file_names)
-        edit_layout.addWidget(self.list_widget)
+        self.list_view.setDragDropMode(QAbstractItemView.InternalMove)
+        self.list_view.setDefaultDropAction(Qt.MoveAction)
+        edit_layout.addWidget(self.list_view)
+        # progress of listing the files and counting the frames
+        self.status_label = QLabel()
+        edit_layout.addWidget(self.status_label)
+        self.status_label.hide()
 
         # Add the buttons
         button_layout = QHBoxLayout()
-        self.delete_button = QPushButton("Delete File")
+        self.delete_button = QPushButton("Delete Files")
         self.save_button = QPushButton("Save File Order")
         self.edit_button = QPushButton("Edit Files")
 
@@ -143,26 +298,47 @@ class FileListDisplay(QWidget):
         self.setLayout(edit_layout)
 
     def fill_list(self, file_names):
-        # clear existing items
-        self.list_widget.clear()
-        # add file names and order to the list
-        for name in file_names:
-            # adding items to the list widget
-            self.list_widget.addItem(QListWidgetItem(name))
+        # replace the existing files
+        self.model.set_files(file_names)
+
+    def add_files(self, file_names: List[str]):
+        """
+        Adds the files to the end of the list.
+        """
+        self.model.add_files(file_names)
+
+    def n_files(self) -> int:
+        """
+        Number of files in the list.
+        """
+        return self.model.rowCount()
+
+    def set_frame_count(self, file_name: str, n_frames: int):
+        """
+        Shows the number of frames next to the file name.
+        """
+        self.model.set_frame_count(file_name, n_frames)
+
+    def show_status(self, text: str):
+        """
+        Shows the text under the list, hides it if the text is empty.
+        """
+        self.status_label.setText(text)
+        self.status_label.setVisible(bool(text))
 
     def delete_file(self):
         """
-        Removes a file from the list.
+        Removes the selected files from the list.
         """
-        curItem = self.list_widget.currentItem()
-        self.list_widget.takeItem(self.list_widget.row(curItem))
+        rows = [index.row() for index in self.list_view.selectionModel().selectedRows()]
+        self.model.remove_rows(rows)
 
     def freeze(self):
         """
         Freeze the file-list widget: doesn't allow any modifications until Edit button is pressed.
         """
-        self.list_widget.setDragEnabled(False)
-        self.list_widget.setEnabled(False)
+        self.list_view.setDragEnabled(False)
+        self.list_view.setEnabled(False)
         # hide the buttons
         self.delete_button.hide()
         self.save_button.hide()
@@ -172,8 +348,8 @@ class FileListDisplay(QWidget):
         """
         Unfreeze the file-list widget: doesn't allow any modifications until Edit button is pressed.
         """
-        self.list_widget.setDragEnabled(True)
-        self.list_widget.setEnabled(True)
+        self.list_view.setDragEnabled(True)
+        self.list_view.setEnabled(True)
         # hide a button
         self.edit_button.hide()
         # show the buttons
@@ -184,8 +360,7 @@ class FileListDisplay(QWidget):
         """
         Returns the list of files in the order as they appear in the list.
         """
-        all_items = [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
-        return all_items
+        return self.model.file_names()
 
 
 class LoadExperimentTab(QWidget):
@@ -206,6 +381,16 @@ class LoadExperimentTab(QWidget):
         main_layout.addWidget(self.load_db_l)
         main_layout.addLayout(load_layout)
 
+        # progress of loading the experiment, shown only while loading
+        self.progress_bar = QProgressBar()
+        self.cancel_pb = QPushButton("Cancel")
+        progress_lo = QHBoxLayout()
+        progress_lo.addWidget(self.progress_bar)
+        progress_lo.addWidget(self.cancel_pb)
+        main_layout.addLayout(progress_lo)
+        self.progress_bar.hide()
+        self.cancel_pb.hide()
+
         # File Manager Info
         self.info_fm = QLabel("File manager information:")
         main_layout.addWidget(self.info_fm)
@@ -231,6 +416,30 @@ class LoadExperimentTab(QWidget):
                                                       directory=start_dir, filter="Database Files (*.db)")
         self.db_location.setText(selected_db)
 
+    def start_progress(self):
+        """
+        Shows the progress bar and disables the load button until the loading is finished.
+        """
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setFormat("Opening the database ...")
+        self.progress_bar.show()
+        self.cancel_pb.show()
+        self.cancel_pb.setEnabled(True)
+        self.load_db_pb.setEnabled(False)
+
+    def update_progress(self, stage: str, n_done: int, n_total: int):
+        self.progress_bar.setRange(0, n_total)
+        self.progress_bar.setValue(n_done)
+        self.progress_bar.setFormat(f"{stage}: %v / %m")
+
+    def stop_progress(self):
+        """
+        Hides the progress bar and enables the load button.
+        """
+        self.progress_bar.hide()
+        self.cancel_pb.hide()
+        self.load_db_pb.setEnabled(True)
+
 
 class NewExperimentTab(QWidget):
     def __init__(self):
@@ -257,8 +466,7 @@ class NewExperimentTab(QWidget):
         self.file_types = QComboBox()
         ftype_layout = QFormLayout()
         ftype_layout.addRow("Choose file type:", self.file_types)
-        # grabs the file types from vodex core.py
-        self.file_types.addItems(vx.VX_SUPPORTED_TYPES.keys())
+        # filled with the file types from vodex when the tab is opened, see set_file_types
         ftype_layout.addWidget(self.file_types)
         main_layout.addLayout(ftype_layout)
         main_layout.addWidget(QLabel("* Currently only supports tiffiles.\n   "
@@ -283,6 +491,13 @@ class NewExperimentTab(QWidget):
         selected_dir = QFileDialog.getExistingDirectory(caption='Choose Directory', directory=start_dir)
         self.dir_location.setText(selected_dir)
 
+    def set_file_types(self, file_types: List[str]):
+        """
+        Shows the file types to choose from.
+        """
+        self.file_types.clear()
+        self.file_types.addItems(file_types)
+
     def freeze_dir(self):
         """
         Makes the field to enter the directory inactive.
@@ -531,6 +746,13 @@ class LabelsTab(QWidget):
             state_names.append(name)
         return state_names
 
+    def clear(self):
+        """
+        Removes all the labels from the table.
+        """
+        self.label_table.setRowCount(0)
+        self.label_names = []
+
     def get_descriptions(self):
         """
         Returns all the descriptions in the table.
@@ -561,6 +783,200 @@ class LabelsTab(QWidget):
         x = self.msg.exec_()  # this will show our messagebox
 
 
+class TimingModel(QAbstractTableModel):
+    """
+    The sequence of the conditions for the TimingTab table: label name and duration on every row.
+    The labels are kept as codes ( indices into the label names ) and the durations in arrays,
+    so that thousands of conditions don't need a widget each, and the sequences are read with array operations.
+    A code of -1 means that no label is chosen yet.
+    """
+    HEADER = ["Label name", "Duration (in frames!)"]
+
+    def __init__(self):
+        super().__init__()
+        self._label_names: List[str] = []
+        self._codes = np.zeros(0, dtype=np.int32)
+        self._durations = np.zeros(0, dtype=np.int64)
+
+    def label_names(self) -> List[str]:
+        """
+        The labels to choose from.
+        """
+        return list(self._label_names)
+
+    def set_label_names(self, label_names: List[str]):
+        """
+        Changes the labels to choose from, keeping the chosen labels. The rows without a label get the first one.
+        """
+        chosen = self.names_sequence()
+        missing = set(chosen) - set(label_names) - {""}
+        assert not missing, f"Labels {sorted(missing)} are chosen, but they are missing from the labels: {label_names}"
+
+        self._label_names = list(label_names)
+        self._codes = self._to_codes(chosen)
+        if self._label_names:
+            self._codes[self._codes < 0] = 0
+        if self.rowCount() > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, 0))
+
+    def set_sequence(self, label_names: List[str], names: List[str], durations: List[int]):
+        """
+        Replaces all the rows.
+
+        Args:
+            label_names: the labels to choose from.
+            names: label name on every row.
+            durations: duration on every row.
+        """
+        assert len(names) == len(durations), "Need a duration for every label."
+        self.beginResetModel()
+        self._label_names = list(label_names)
+        self._codes = self._to_codes(names)
+        self._durations = np.asarray(durations, dtype=np.int64).reshape(-1)
+        self.endResetModel()
+
+    def append_row(self, label_name: str = None, duration: int = 1):
+        """
+        Adds a row at the end, with the first label if the label name is not given.
+        """
+        if label_name is None:
+            code = 0 if self._label_names else -1
+        else:
+            code = self._to_codes([label_name])[0]
+        n_rows = self.rowCount()
+        self.beginInsertRows(QModelIndex(), n_rows, n_rows)
+        self._codes = np.append(self._codes, np.int32(code))
+        self._durations = np.append(self._durations, np.int64(duration))
+        self.endInsertRows()
+
+    def remove_rows(self, rows: List[int]):
+        """
+        Removes the rows, each run of neighbouring rows at once.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) == 0:
+            return
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) > 1) + 1)
+        for run in reversed(runs):
+            self.removeRows(int(run[0]), len(run))
+
+    def names_sequence(self) -> List[str]:
+        """
+        The label name on every row, an empty string if no label is chosen.
+        """
+        names = np.array(self._label_names + [""], dtype=object)
+        # code -1 takes the last element: the empty string
+        return names[self._codes].tolist()
+
+    def durations(self) -> List[int]:
+        """
+        The duration on every row.
+        """
+        return self._durations.tolist()
+
+    def uses(self, label_name: str) -> bool:
+        """
+        Whether the label is chosen on any of the rows.
+        """
+        return label_name in self._label_names and bool(np.any(self._codes == self._label_names.index(label_name)))
+
+    def _to_codes(self, names: List[str]) -> np.ndarray:
+        lookup = {name: code for code, name in enumerate(self._label_names)}
+        unknown = set(names) - set(lookup) - {""}
+        assert not unknown, f"Unknown labels {sorted(unknown)}, the labels are: {self._label_names}"
+        return np.array([lookup.get(name, -1) for name in names], dtype=np.int32)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._codes)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return 2
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        if index.column() == 0:
+            code = self._codes[index.row()]
+            return self._label_names[code] if code >= 0 else ""
+        return int(self._durations[index.row()])
+
+    def setData(self, index: QModelIndex, value, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        if index.column() == 0:
+            if value not in self._label_names:
+                return False
+            self._codes[index.row()] = self._label_names.index(value)
+        else:
+            if int(value) < 1:
+                return False
+            self._durations[index.row()] = int(value)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADER[section]
+        return section + 1
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def removeRows(self, row: int, count: int, parent: QModelIndex = QModelIndex()) -> bool:
+        if parent.isValid() or row < 0 or count <= 0 or row + count > self.rowCount():
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self._codes = np.delete(self._codes, np.s_[row: row + count])
+        self._durations = np.delete(self._durations, np.s_[row: row + count])
+        self.endRemoveRows()
+        return True
+
+
+class LabelDelegate(QStyledItemDelegate):
+    """
+    Edits the label name in the TimingModel with a combo box, only while the cell is edited.
+    """
+
+    def createEditor(self, parent: QWidget, option: 'QStyleOptionViewItem', index: QModelIndex) -> QComboBox:
+        editor = QComboBox(parent)
+        editor.addItems(index.model().label_names())
+        # save the choice right away, not when the editor is closed
+        editor.activated.connect(lambda: self.commitData.emit(editor))
+        return editor
+
+    def setEditorData(self, editor: QComboBox, index: QModelIndex):
+        editor.setCurrentText(index.data(Qt.EditRole))
+
+    def setModelData(self, editor: QComboBox, model: QAbstractTableModel, index: QModelIndex):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+
+class DurationDelegate(QStyledItemDelegate):
+    """
+    Edits the duration in the TimingModel with a spin box, only while the cell is edited.
+    """
+
+    def createEditor(self, parent: QWidget, option: 'QStyleOptionViewItem', index: QModelIndex) -> QSpinBox:
+        editor = QSpinBox(parent)
+        editor.setRange(1, 1000000000)
+        return editor
+
+    def setEditorData(self, editor: QSpinBox, index: QModelIndex):
+        editor.setValue(index.data(Qt.EditRole))
+
+    def setModelData(self, editor: QSpinBox, model: QAbstractTableModel, index: QModelIndex):
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.EditRole)
+
+
 class TimingTab(QWidget):
     """
     Contains the information about the timing of the conditions.
@@ -581,17 +997,22 @@ class TimingTab(QWidget):
         # Label adder
         self.add_button = QPushButton("Add condition")
         self.del_button = QPushButton("Delete condition")
+        # creates the whole annotation from a file with the label of every frame or the labels and durations
+        self.import_button = QPushButton("Import from file")
         self.ROW_HEIGHT = 30
         self.add_button.setFixedHeight(self.ROW_HEIGHT)
 
         input_lo = QVBoxLayout()
         input_lo.addWidget(self.add_button)
         input_lo.addWidget(self.del_button)
+        input_lo.addWidget(self.import_button)
         input_lo.addStretch(42)
         table_lo.addLayout(input_lo)
 
-        # Table
-        self.table = QTableWidget()
+        # Table: the label and the duration are edited with delegates, so the rows don't have widgets
+        self.model = TimingModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.set_up_table()
         table_lo.addWidget(self.table)
         main_lo.addLayout(table_lo)
@@ -599,83 +1020,80 @@ class TimingTab(QWidget):
         self.msg = InputError()
 
     def set_up_table(self):
-        self.table.setColumnCount(2)
         self.table.setColumnWidth(0, 150)
-        self.table.setHorizontalHeaderLabels(["Label name", "Duration (in frames!)"])
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.AllEditTriggers)
+        self.table.setItemDelegateForColumn(0, LabelDelegate(self.table))
+        self.table.setItemDelegateForColumn(1, DurationDelegate(self.table))
         h_header = self.table.horizontalHeader()
         h_header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        v_header = self.table.verticalHeader()
+        v_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        v_header.setDefaultSectionSize(self.ROW_HEIGHT)
 
     def add_row(self, labels: List[str], label_name: str = None, duration: int = None):
         """
-        Adds a row to the table and sets the widgets in the cells.
+        Adds a row to the table.
 
         Args:
-            labels: available label names to add to the combo box.
-            label_name: the name of the label to set for the row
-            duration: the duration to set for the row
-        Learning Resources:
-            Instead of setting widgets for each cell,
-            a better way would be to use a delegate https://forum.qt.io/topic/88486/dropdown-in-qtablewdget
-        """
-        # create the elements to insert
-        label_choice = QComboBox()
-        label_duration = QSpinBox()
-        label_duration.setRange(1, 1000000000)
-        label_choice.addItems(labels)
-        label_duration.setMinimum(1)
-
-        n_rows = self.table.rowCount()
-        self.table.insertRow(n_rows)
-        self.table.setRowHeight(n_rows, self.ROW_HEIGHT)
-
-        self.table.setCellWidget(n_rows, 0, label_choice)
-        self.table.setCellWidget(n_rows, 1, label_duration)
-
-        # set the values if provided
-        if label_name is not None:
-            label_choice.setCurrentText(label_name)
-        if duration is not None:
-            label_duration.setValue(duration)
+            labels: available label names to choose from.
+            label_name: the name of the label to set for the row, the first label if not provided.
+            duration: the duration to set for the row, 1 if not provided.
+        """
+        if labels != self.model.label_names():
+            self.model.set_label_names(labels)
+        self.model.append_row(label_name, 1 if duration is None else duration)
+
+    def set_sequence(self, labels: List[str], names: List[str], durations: List[int]):
+        """
+        Fills the table with the sequence of the conditions at once.
+
+        Args:
+            labels: available label names to choose from.
+            names: the name of the label on every row.
+            durations: the duration on every row.
+        """
+        self.model.set_sequence(labels, names, durations)
 
     def delete_row(self):
-        selected_row = self.table.currentRow()
-        self.table.removeRow(selected_row)
+        """
+        Deletes the selected rows.
+        """
+        rows = [index.row() for index in self.table.selectionModel().selectedRows()]
+        if not rows and self.table.currentIndex().isValid():
+            rows = [self.table.currentIndex().row()]
+        self.model.remove_rows(rows)
 
     def update_choices(self, labels):
         """
-        Updates the labels on all the combo boxes.
+        Updates the labels to choose from.
         Assumes that all the chosen labels are present in the new labels.
         """
-        n_rows = self.table.rowCount()
-        for row in range(n_rows):
-            chosen_label = self.table.cellWidget(row, 0).currentText()
-            assert chosen_label in labels, f"A label {chosen_label} is chosen, " \
-                                           f"but it is missing from the labels: {labels}"
-            self.table.cellWidget(row, 0).clear()
-            self.table.cellWidget(row, 0).addItems(labels)
-            self.table.cellWidget(row, 0).setCurrentText(chosen_label)
+        self.model.set_label_names(labels)
 
     def check_in_use(self, label_name: str) -> bool:
         """
         Checks if a given label name has been chosen.
         """
-        chosen_names = self.get_names_sequence()
-        in_use = label_name in chosen_names
+        in_use = self.model.uses(label_name)
         if in_use:
             self.launch_popup(f"Label {label_name} is in use!")
         return in_use
 
     def get_names_sequence(self) -> List[str]:
-        n_rows = self.table.rowCount()
-        label_name_order = [self.table.cellWidget(row, 0).currentText() for row in range(n_rows)]
-        return label_name_order
+        return self.model.names_sequence()
+
+    def get_import_file(self) -> str:
+        """
+        Asks for the file to import the annotation from, returns an empty string if cancelled.
+        """
+        file_name, _ = QFileDialog.getOpenFileName(caption="Import annotation", directory=str(Path().absolute()),
+                                                   filter="Label per frame (*.npy);;Label and duration (*.csv)")
+        return file_name
 
     def get_duration_sequence(self):
-        n_rows = self.table.rowCount()
-        duration = [self.table.cellWidget(row, 1).value() for row in range(n_rows)]
-        return duration
+        return self.model.durations()
 
     def launch_popup(self, text):
         self.msg.setText(text)
@@ -862,6 +1280,74 @@ class DataReaderWriterTab(QWidget):
         self.main_layout = QVBoxLayout()
         self.setLayout(self.main_layout)
 
+        # 0. How to load the volumes ( applies to both options below )
+        self.load_mode = QComboBox()
+        self.load_mode.addItems(["In memory", "Lazy", "Browse", "Average", "Preview"])
+        self.m_info_pb = QPushButton("")
+        self.m_info_pb.setIcon(self.style().standardIcon(getattr(QStyle, "SP_MessageBoxInformation")))
+        self.m_info_pb.clicked.connect(self.how_to_load_mode)
+        mode_lo = QHBoxLayout()
+        mode_lo.addWidget(QLabel("Load volumes: "))
+        mode_lo.addWidget(self.load_mode)
+        self.multiscale_cb = QCheckBox("Multiscale")
+        mode_lo.addWidget(self.multiscale_cb)
+        mode_lo.addWidget(self.m_info_pb)
+        self.main_layout.addLayout(mode_lo)
+
+        # what to skip in the Preview mode, only visible in that mode
+        self.volume_step = QSpinBox()
+        self.volume_step.setRange(1, 1000000)
+        self.volume_step.setValue(10)
+        self.slice_step = QSpinBox()
+        self.slice_step.setRange(1, 1000000)
+        self.bin_xy = QSpinBox()
+        self.bin_xy.setRange(1, 64)
+        self.bin_xy.setValue(4)
+        preview_lo = QHBoxLayout()
+        preview_lo.setContentsMargins(0, 0, 0, 0)
+        preview_lo.addWidget(QLabel("Every Nth volume:"))
+        preview_lo.addWidget(self.volume_step)
+        preview_lo.addWidget(QLabel("slice:"))
+        preview_lo.addWidget(self.slice_step)
+        preview_lo.addWidget(QLabel("Bin XY:"))
+        preview_lo.addWidget(self.bin_xy)
+        self.preview_options = QWidget()
+        self.preview_options.setLayout(preview_lo)
+        self.preview_options.hide()
+        self.load_mode.currentTextChanged.connect(lambda mode: self.preview_options.setVisible(mode == "Preview"))
+        # Browse reads single frames and Average makes two new volumes, neither one builds a pyramid
+        self.load_mode.currentTextChanged.connect(
+            lambda mode: self.multiscale_cb.setEnabled(mode not in ["Browse", "Average"]))
+        self.main_layout.addWidget(self.preview_options)
+
+        # memory budget for the recently loaded volumes
+        self.cache_mb = QSpinBox()
+        self.cache_mb.setRange(0, 1000000)
+        self.cache_mb.setSuffix(" MB")
+        self.cache_info = QLabel("")
+        cache_lo = QHBoxLayout()
+        cache_lo.addWidget(QLabel("Keep in memory: "))
+        cache_lo.addWidget(self.cache_mb)
+        cache_lo.addWidget(self.cache_info)
+        # memory budget for the multiscale pyramids of the recently loaded selections
+        self.pyramid_mb = QSpinBox()
+        self.pyramid_mb.setRange(0, 1000000)
+        self.pyramid_mb.setSuffix(" MB")
+        self.pyramid_mb.setToolTip("Keep the recently loaded multiscale pyramids in memory,\n"
+                                   "so that loading the same volumes again is instant.")
+        pyramid_lo = QHBoxLayout()
+        pyramid_lo.addWidget(QLabel("Keep pyramids: "))
+        pyramid_lo.addWidget(self.pyramid_mb)
+        pyramid_lo.addStretch()
+        # keep the decoded frames next to the saved experiment
+        self.disk_cache_cb = QCheckBox("Cache on disk")
+        self.disk_cache_cb.setToolTip("Keep the decoded frames in a .vxcache folder next to the saved experiment,\n"
+                                      "so that they are not decoded again next time the experiment is loaded.\n"
+                                      "Only the frames that have been loaded are kept.")
+        cache_lo.addWidget(self.disk_cache_cb)
+        self.main_layout.addLayout(cache_lo)
+        self.main_layout.addLayout(pyramid_lo)
+
         # 1. Individual volumes
         section1_title = QLabel("[LOAD OPTION 1] Load based on volumes/slices IDs")
         self.main_layout.addWidget(QLabel("____________________________________________________"))
@@ -905,9 +1391,13 @@ class DataReaderWriterTab(QWidget):
         # 2 checkboxes whether to consider the head and the tail of the dataset
         self.head_cb = QCheckBox("Head")
         self.tail_cb = QCheckBox("Tail")
+        # whether to fill the slices that are missing in the head and tail with zeros
+        self.pad_cb = QCheckBox("Pad")
+        self.pad_cb.setToolTip("Fill the slices that are missing in the Head and Tail with zeros")
         head_tail_lo = QVBoxLayout()
         head_tail_lo.addWidget(self.head_cb)
         head_tail_lo.addWidget(self.tail_cb)
+        head_tail_lo.addWidget(self.pad_cb)
 
         volume_slice_checkbox_lo = QHBoxLayout()
         volume_slice_checkbox_lo.addLayout(volume_slice_lo)
@@ -915,7 +1405,11 @@ class DataReaderWriterTab(QWidget):
 
         self.main_layout.addLayout(volume_slice_checkbox_lo)
         self.load_volumes_pb = QPushButton("Load")
-        self.main_layout.addWidget(self.load_volumes_pb)
+        self.export_volumes_pb = QPushButton("Export to OME-Zarr")
+        load_volumes_lo = QHBoxLayout()
+        load_volumes_lo.addWidget(self.load_volumes_pb)
+        load_volumes_lo.addWidget(self.export_volumes_pb)
+        self.main_layout.addLayout(load_volumes_lo)
         self.main_layout.addWidget(horizontal_line())
 
         # 2. Annotation list
@@ -946,17 +1440,34 @@ class DataReaderWriterTab(QWidget):
         self.volumes_label = QLabel("Volumes that satisfy the conditions:")
         self.volumes_info = QTextBrowser()
         self.load_conditions_pb = QPushButton("Load")
+        self.export_conditions_pb = QPushButton("Export to OME-Zarr")
+        load_conditions_lo = QHBoxLayout()
+        load_conditions_lo.addWidget(self.load_conditions_pb)
+        load_conditions_lo.addWidget(self.export_conditions_pb)
 
         buttons_lo.addWidget(logic_label)
         buttons_lo.addWidget(self.logic_box)
         buttons_lo.addWidget(self.find_volumes)
         buttons_lo.addWidget(self.volumes_label)
         buttons_lo.addWidget(self.volumes_info)
-        buttons_lo.addWidget(self.load_conditions_pb)
+        buttons_lo.addLayout(load_conditions_lo)
 
         self.main_layout.addLayout(buttons_lo)
         self.main_layout.addWidget(horizontal_line())
 
+        # 3. What the last request loads and the loading progress, only visible while loading
+        self.estimate_info = QLabel("")
+        self.estimate_info.setWordWrap(True)
+        self.main_layout.addWidget(self.estimate_info)
+        self.progress_bar = QProgressBar()
+        self.cancel_pb = QPushButton("Cancel")
+        progress_lo = QHBoxLayout()
+        progress_lo.addWidget(self.progress_bar)
+        progress_lo.addWidget(self.cancel_pb)
+        self.main_layout.addLayout(progress_lo)
+        self.progress_bar.hide()
+        self.cancel_pb.hide()
+
         # self.main_layout.addStretch(42)
         self.msg = InputError("Info")
 
@@ -982,6 +1493,117 @@ class DataReaderWriterTab(QWidget):
             else:
                 self.annotations[annotation_name].update_labels(label_names)
 
+    def start_progress(self):
+        """
+        Shows the progress bar and disables the load buttons until the loading is finished.
+        """
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setFormat("Preparing to load ...")
+        self.progress_bar.show()
+        self.cancel_pb.show()
+        self.cancel_pb.setEnabled(True)
+        for button in [self.load_volumes_pb, self.export_volumes_pb,
+                       self.load_conditions_pb, self.export_conditions_pb]:
+            button.setEnabled(False)
+
+    def update_progress(self, n_loaded: int, n_total: int, action: str = "Loaded"):
+        self.progress_bar.setRange(0, n_total)
+        self.progress_bar.setValue(n_loaded)
+        self.progress_bar.setFormat(f"{action} %v / %m volumes")
+
+    def stop_progress(self):
+        """
+        Hides the progress bar and enables the load buttons.
+        """
+        self.progress_bar.hide()
+        self.cancel_pb.hide()
+        for button in [self.load_volumes_pb, self.export_volumes_pb,
+                       self.load_conditions_pb, self.export_conditions_pb]:
+            button.setEnabled(True)
+
+    def get_export_file(self):
+        """
+        Asks where to export the volumes, returns None if cancelled.
+        """
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export to OME-Zarr", "", "OME-Zarr (*.zarr)")
+        if not file_name:
+            return None
+        if not file_name.endswith(".zarr"):
+            file_name += ".zarr"
+        return file_name
+
+    def ask_load_lazily(self, text: str):
+        """
+        Asks what to do when the requested volumes don't fit into memory.
+
+        Returns:
+            "lazy" to load lazily, "preview" to load a preview, "memory" to load into memory anyway,
+            None to cancel the loading.
+        """
+        box = QMessageBox(QMessageBox.Warning, "Not enough memory", text)
+        lazy_pb = box.addButton("Load lazily", QMessageBox.AcceptRole)
+        preview_pb = box.addButton("Load preview", QMessageBox.AcceptRole)
+        memory_pb = box.addButton("Load anyway", QMessageBox.DestructiveRole)
+        box.addButton(QMessageBox.Cancel)
+        box.setDefaultButton(lazy_pb)
+        box.exec_()
+        answers = {lazy_pb: "lazy", preview_pb: "preview", memory_pb: "memory"}
+        return answers.get(box.clickedButton())
+
+    def how_to_load_mode(self):
+        text = "Choose how the volumes are loaded into napari.\n\n" \
+               "• In memory: all the requested volumes are read from disk at once. " \
+               "Browsing is fast afterwards, but the data must fit into RAM.\n" \
+               "• Lazy: loading returns right away, the volumes are read from disk " \
+               "only when napari displays them. Use it for recordings that don't fit into RAM.\n" \
+               "• Browse: like Lazy, but only the frame that is shown is read from disk, " \
+               "so every step of the slider reads one frame instead of a whole volume. " \
+               "Use it to scroll through very long recordings.\n" \
+               "• Average: the volumes are read a few at a time and only their mean and standard deviation " \
+               "are added to napari, as two volumes. Use it to get the mean volume for a condition " \
+               "without loading all of the volumes into RAM.\n" \
+               "• Preview: a quick look at a new recording. Only every Nth volume and every Nth slice " \
+               "is read, and the frames are shrunk by averaging blocks of Bin XY x Bin XY pixels " \
+               "while they are read. The layer is scaled to line up with the full resolution layers.\n\n" \
+               "Check Multiscale for large frames: napari gets a pyramid of downsampled copies " \
+               "( 2 x 2 pixels averaged at every level ) and shows the smaller ones when zoomed out, " \
+               "so browsing stays smooth. The pyramid is computed while loading and kept in memory, " \
+               "so loading the same volumes again is instant. Multiscale is not available for Browse and Average."
+
+        self.launch_popup(text=text)
+
+    def is_multiscale(self) -> bool:
+        """
+        Whether to load the volumes as a multiscale pyramid ( never in the Browse and Average modes ).
+        """
+        return self.multiscale_cb.isChecked() and not (self.is_browse() or self.is_average())
+
+    def is_lazy(self) -> bool:
+        """
+        Whether the volumes should be loaded lazily.
+        """
+        return self.load_mode.currentText() == "Lazy"
+
+    def get_preview(self):
+        """
+        Volume step, slice step and XY binning for the Preview mode, all 1 in the other modes.
+        """
+        if self.load_mode.currentText() != "Preview":
+            return 1, 1, 1
+        return self.volume_step.value(), self.slice_step.value(), self.bin_xy.value()
+
+    def is_browse(self) -> bool:
+        """
+        Whether the volumes should be read one frame at a time, as they are shown.
+        """
+        return self.load_mode.currentText() == "Browse"
+
+    def is_average(self) -> bool:
+        """
+        Whether only the mean and standard deviation of the volumes should be loaded.
+        """
+        return self.load_mode.currentText() == "Average"
+
     def how_to_volumes(self):
         text = "Enter the indices for the volumes you would like to load. " \
                "Valid inputs include individual indices, comma-separated lists, or ranges using a colon. " \
@@ -995,7 +1617,11 @@ class DataReaderWriterTab(QWidget):
                "If the dataset has unfilled volumes at the beginning or end of the recording, " \
                "you can include/exclude them by checking the Head and Tail checkboxes. " \
                "This might be important if you are trying to load a set of slices that " \
-               "are not present in the Head or Tail of the dataset."
+               "are not present in the Head or Tail of the dataset. " \
+               "Check Pad to load them anyway: the missing slices are filled with zeros.\n\n" \
+               "Export to OME-Zarr writes the volumes to a chunked and compressed OME-Zarr folder " \
+               "instead of adding them to napari, together with the experiment and the annotations. " \
+               "If no volumes or slices are entered, the whole recording is exported."
 
         self.launch_popup(text=text)
 
@@ -1012,9 +1638,10 @@ class DataReaderWriterTab(QWidget):
                "If slices to volumes are specified, you can leave the slices empty. " \
                "Then all the slices will be loaded for the specified volumes.\n\n" \
                "If the dataset has unfilled volumes at the beginning or end of the recording, " \
-               "you can include/exclude them by checking the Head and Tail checkboxes." \
+               "you can include/exclude them by checking the Head and Tail checkboxes. " \
                "This might be important if you are trying to load a set of slices that " \
-               "are not present in the Head or Tail of the dataset."
+               "are not present in the Head or Tail of the dataset. " \
+               "Check Pad to load them anyway: the missing slices are filled with zeros."
 
         self.launch_popup(text=text)
 
@@ -1069,6 +1696,60 @@ class DataReaderWriterTab(QWidget):
         return slices, requested_slices
 
 
+class PerformanceTab(QWidget):
+    """
+    Shows how long the recent actions took and where the time went.
+    """
+    MAX_ROWS = 200
+
+    def __init__(self):
+        super().__init__()
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
+
+        main_layout.addWidget(QLabel("Time in seconds: total, vodex database, decoding the image files,\n"
+                                     "assembling the arrays, creating the napari layer and everything else."))
+        self.columns = ["action", "status", "total"] + list(STAGES) + ["other"]
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        main_layout.addWidget(self.table)
+
+        self.log_pb = QPushButton("Log to file ...")
+        self.clear_pb = QPushButton("Clear")
+        self.log_info = QLabel("")
+        buttons_lo = QHBoxLayout()
+        buttons_lo.addWidget(self.log_pb)
+        buttons_lo.addWidget(self.clear_pb)
+        main_layout.addLayout(buttons_lo)
+        main_layout.addWidget(self.log_info)
+
+        self.clear_pb.clicked.connect(lambda: self.table.setRowCount(0))
+
+    def add_record(self, record: dict):
+        """
+        Adds a timing record at the top of the table.
+        """
+        self.table.insertRow(0)
+        for column, key in enumerate(self.columns):
+            value = record.get(key, "")
+            text = f"{value:.3f}" if isinstance(value, float) else str(value)
+            self.table.setItem(0, column, QTableWidgetItem(text))
+        if self.table.rowCount() > self.MAX_ROWS:
+            self.table.setRowCount(self.MAX_ROWS)
+
+    def show_log_file(self, log_file):
+        self.log_info.setText(f"Logging to {log_file}" if log_file else "")
+
+    def get_log_filename(self):
+        """
+        Asks for a file to log the timing records to ( JSON lines ). Returns the file name or None.
+        """
+        file_name, _ = QFileDialog.getSaveFileName(self, "Log timing to file", "", "JSON lines (*.jsonl)")
+        return file_name or None
+
+
 class VodexView(QWidget):
     """
     Does everything about the GUI View.
@@ -1085,7 +1766,10 @@ class VodexView(QWidget):
         self.it = InitialiseTab()
         self.at = AnnotationTab()
         self.dt = DataReaderWriterTab(viewer)
+        self.pt = PerformanceTab()
         self.napari = viewer
+        # enabled state of the tabs that change the model, kept while a worker runs
+        self._frozen_tabs = {}
 
         self.main_layout = QVBoxLayout()
         self.setLayout(self.main_layout)
@@ -1119,6 +1803,9 @@ class VodexView(QWidget):
         splitter_3.addWidget(self.st)
         tabs.addTab(splitter_3, "Load/Save Data")
 
+        # 4. Performance Tab
+        tabs.addTab(self.pt, "Performance")
+
         self.main_layout.addWidget(tabs, alignment=Qt.AlignTop)
 
         # disable until called for the first time
@@ -1126,6 +1813,26 @@ class VodexView(QWidget):
         self.vt.setEnabled(False)
         self.st.setEnabled(False)
 
+    def freeze_model_tabs(self):
+        """
+        Disables the tabs that change the experiment, the files or the annotations,
+        so nothing replaces the model under a running worker.
+        Remembers their enabled state to restore it in unfreeze_model_tabs.
+        """
+        if self._frozen_tabs:
+            return
+        for tab in [self.nt, self.lt, self.vt, self.it, self.at, self.st]:
+            self._frozen_tabs[tab] = tab.isEnabled()
+            tab.setEnabled(False)
+
+    def unfreeze_model_tabs(self):
+        """
+        Restores the enabled state of the tabs disabled by freeze_model_tabs.
+        """
+        for tab, enabled in self._frozen_tabs.items():
+            tab.setEnabled(enabled)
+        self._frozen_tabs = {}
+
     def initialize_load_experiment(self):
         self.nt_pb.hide()
         self.lt_pb.hide()
@@ -1144,4 +1851,7 @@ class VodexView(QWidget):
         splitter_3.addWidget(self.st)
         tabs.addTab(splitter_3, "Load/Save Data")
 
+        # 4. Performance Tab
+        tabs.addTab(self.pt, "Performance")
+
         self.main_layout.addWidget(tabs)
@@ -15,11 +15,6 @@ if TYPE_CHECKING:
 # will fail to import. Instead use from qtpy import   QtCore. qtpy is a Qt compatibility layer that will import from
 # whatever backend is installed in the environment.
 
-
-from qtpy.QtWidgets import QApplication
-
-import napari
-
 from ._model import VodexModel
 from ._controller import VodexController
 from ._view import VodexView
@@ -41,6 +36,8 @@ class VodexWidget(VodexView):
 if __name__ == "__main__":
     import sys
 
+    from qtpy.QtWidgets import QApplication
+
     app = QApplication(sys.argv)
     window = VodexWidget()
     window.show()